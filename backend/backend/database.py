@@ -0,0 +1,40 @@
+"""
+DATABASES entries built from a database URL plus DB_* environment settings.
+
+By default connections are persistent: each worker thread keeps its
+connection for DB_CONN_MAX_AGE seconds instead of opening one per request,
+and checks it is still usable before reusing it (DB_CONN_HEALTH_CHECKS).
+
+With DB_POOL on PostgreSQL, Django's psycopg pool (psycopg[pool]) is used
+instead. Every thread of a process borrows from one pool of
+DB_POOL_MIN_SIZE to DB_POOL_MAX_SIZE connections, so size it for the
+request threads plus IMPORT_WORKERS. Requests wait up to DB_POOL_TIMEOUT
+seconds for a free connection.
+"""
+from dj_database_url import parse as db_url
+from decouple import config
+
+POSTGRES_ENGINE = 'django.db.backends.postgresql'
+
+
+def database(url):
+    """One DATABASES entry for `url` with the configured connection handling"""
+    settings = db_url(url)
+    settings['CONN_HEALTH_CHECKS'] = config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool)
+    if settings['ENGINE'] == POSTGRES_ENGINE and config('DB_POOL', default=False, cast=bool):
+        # The pool keeps the connections; Django must hand them back after each request
+        settings['CONN_MAX_AGE'] = 0
+        settings.setdefault('OPTIONS', {})['pool'] = {
+            'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+            'max_size': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+            'timeout': config('DB_POOL_TIMEOUT', default=10, cast=float),
+        }
+    else:
+        settings['CONN_MAX_AGE'] = config('DB_CONN_MAX_AGE', default=60, cast=int)
+    return settings
+
+def replica(url):
+    """A read replica entry; tests read the primary's test database through it"""
+    settings = database(url)
+    settings['TEST'] = {'MIRROR': 'default'}
+    return settings
@@ -44,6 +44,7 @@ INSTALLED_APPS = [
     ]
 
 MIDDLEWARE = [
+    'shipping.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -128,12 +129,22 @@ CSRF_COOKIE_SECURE = False  # Set to True only in production with HTTPS
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-from dj_database_url import parse as db_url
 from decouple import config
+from .database import database, replica
 
+# Connection reuse (persistent connections or DB_POOL) is configured from
+# the environment; see backend/database.py
 DATABASES = {
-    'default': db_url(config('DATABASE_URL'))
+    'default': database(config('DATABASE_URL'))
 }
+
+# Optional read replica for list and export reads (see
+# shipping/routers.py); they may trail the primary by the replication lag
+DATABASE_REPLICA_URL = config('DATABASE_REPLICA_URL', default='')
+if DATABASE_REPLICA_URL:
+    DATABASES['replica'] = replica(DATABASE_REPLICA_URL)
+READ_REPLICA_DATABASE = 'replica' if DATABASE_REPLICA_URL else None
+DATABASE_ROUTERS = ['shipping.routers.ReplicaRouter']
 print(f'Connected to database')
 
 
@@ -151,7 +162,7 @@ SIMPLE_JWT = {
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'shipping.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -192,3 +203,64 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
 STATIC_URL = 'static/'
+
+# Uploaded manifests waiting for a background import
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Per-user summaries and presets. The default is per process; with several
+# worker processes use a shared backend (file, Redis, Memcached) so writes
+# invalidate every worker's copy. Preset lists are only cached, and given
+# ETags, with a shared backend
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='shipping'),
+    }
+}
+
+# Background CSV imports (in-process thread pool, no broker needed)
+IMPORT_WORKERS = config('IMPORT_WORKERS', default=2, cast=int)
+
+# Shipping rates: engine class, rate table version and the default ship-from
+# ZIP used for zoning
+SHIPPING_RATE_ENGINE = 'shipping.rates.TableRateEngine'
+SHIPPING_RATE_TABLE = config('SHIPPING_RATE_TABLE', default='2026-02')
+SHIPPING_ORIGIN_ZIP = config('SHIPPING_ORIGIN_ZIP', default='91773')
+
+# Label rendering: worker processes and the on-disk page cache
+LABEL_WORKERS = config('LABEL_WORKERS', default=4, cast=int)
+LABEL_CACHE_DIR = config('LABEL_CACHE_DIR', default=str(MEDIA_ROOT / 'labels'))
+# Cached pages are deleted this many seconds after they were rendered, and
+# the oldest first once the cache outgrows LABEL_CACHE_MAX_BYTES (0: no limit)
+LABEL_CACHE_MAX_AGE = config('LABEL_CACHE_MAX_AGE', default=30 * 24 * 3600, cast=int)
+LABEL_CACHE_MAX_BYTES = config('LABEL_CACHE_MAX_BYTES', default=1024 ** 3, cast=int)
+
+# Shipment changes feed: seconds of overlap between consecutive syncs, and
+# how long deletions are remembered before clients must resync in full
+SHIPMENT_SYNC_OVERLAP = config('SHIPMENT_SYNC_OVERLAP', default=5, cast=int)
+SHIPMENT_TOMBSTONE_DAYS = config('SHIPMENT_TOMBSTONE_DAYS', default=30, cast=int)
+
+# Cached dashboard summary; writes invalidate it, the TTL bounds staleness
+# from anything that does not
+SHIPMENT_SUMMARY_TTL = config('SHIPMENT_SUMMARY_TTL', default=300, cast=int)
+
+# Cached preset lists are keyed by a version bumped on every write, so the
+# TTL only bounds how long orphaned lists take up memory
+PRESET_CACHE_TTL = config('PRESET_CACHE_TTL', default=86400, cast=int)
+
+# Seconds an authenticated user and profile are kept in process memory
+# (0 loads them on every request). Saves in this process, and purchases,
+# drop the cached copy at once; changes made by other processes, such as a
+# deactivation, show up once this runs out
+AUTH_USER_CACHE_TTL = config('AUTH_USER_CACHE_TTL', default=30, cast=int)
+
+# Request metrics at /api/metrics/ (Prometheus text format). Scrapers
+# authenticate with this bearer token; without one the endpoint is only
+# served with DEBUG on
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Opt-in profiling: this fraction of requests runs under cProfile, and
+# those slower than the threshold are dumped to the directory
+METRICS_PROFILE_DIR = config('METRICS_PROFILE_DIR', default='')
+METRICS_PROFILE_RATE = config('METRICS_PROFILE_RATE', default=0.01, cast=float)
+METRICS_PROFILE_MIN_SECONDS = config('METRICS_PROFILE_MIN_SECONDS', default=1.0, cast=float)
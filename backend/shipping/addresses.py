@@ -0,0 +1,190 @@
+"""
+Ship-to address normalization and validation.
+
+State names and ZIP formats are normalized, then the ZIP is checked
+against the bundled offline dataset (data/zipcodes.tsv.gz): it must exist,
+belong to the given state and be served under the given city name. Each
+address gets one of ShipmentRecord.ADDRESS_STATUS_CHOICES.
+"""
+import functools
+import gzip
+import os
+import re
+import threading
+import numpy as np
+
+ZIP_DATA_PATH = os.path.join(os.path.dirname(__file__), 'data', 'zipcodes.tsv.gz')
+
+# Distinct addresses remembered by the lookup caches; manifests repeat
+# the same recipients and cities over and over
+ADDRESS_CACHE_SIZE = 65536
+
+STATE_NAMES = {
+    'ALABAMA': 'AL', 'ALASKA': 'AK', 'ARIZONA': 'AZ', 'ARKANSAS': 'AR', 'CALIFORNIA': 'CA',
+    'COLORADO': 'CO', 'CONNECTICUT': 'CT', 'DELAWARE': 'DE', 'DISTRICT OF COLUMBIA': 'DC',
+    'WASHINGTON DC': 'DC', 'FLORIDA': 'FL', 'GEORGIA': 'GA', 'HAWAII': 'HI', 'IDAHO': 'ID',
+    'ILLINOIS': 'IL', 'INDIANA': 'IN', 'IOWA': 'IA', 'KANSAS': 'KS', 'KENTUCKY': 'KY',
+    'LOUISIANA': 'LA', 'MAINE': 'ME', 'MARYLAND': 'MD', 'MASSACHUSETTS': 'MA', 'MICHIGAN': 'MI',
+    'MINNESOTA': 'MN', 'MISSISSIPPI': 'MS', 'MISSOURI': 'MO', 'MONTANA': 'MT', 'NEBRASKA': 'NE',
+    'NEVADA': 'NV', 'NEW HAMPSHIRE': 'NH', 'NEW JERSEY': 'NJ', 'NEW MEXICO': 'NM', 'NEW YORK': 'NY',
+    'NORTH CAROLINA': 'NC', 'NORTH DAKOTA': 'ND', 'OHIO': 'OH', 'OKLAHOMA': 'OK', 'OREGON': 'OR',
+    'PENNSYLVANIA': 'PA', 'RHODE ISLAND': 'RI', 'SOUTH CAROLINA': 'SC', 'SOUTH DAKOTA': 'SD',
+    'TENNESSEE': 'TN', 'TEXAS': 'TX', 'UTAH': 'UT', 'VERMONT': 'VT', 'VIRGINIA': 'VA',
+    'WASHINGTON': 'WA', 'WEST VIRGINIA': 'WV', 'WISCONSIN': 'WI', 'WYOMING': 'WY',
+    'PUERTO RICO': 'PR', 'GUAM': 'GU', 'VIRGIN ISLANDS': 'VI', 'US VIRGIN ISLANDS': 'VI',
+    'AMERICAN SAMOA': 'AS', 'NORTHERN MARIANA ISLANDS': 'MP', 'MARSHALL ISLANDS': 'MH',
+    'FEDERATED STATES OF MICRONESIA': 'FM', 'MICRONESIA': 'FM', 'PALAU': 'PW',
+    'ARMED FORCES AMERICAS': 'AA', 'ARMED FORCES EUROPE': 'AE', 'ARMED FORCES PACIFIC': 'AP',
+}
+STATE_CODES = frozenset(STATE_NAMES.values())
+
+# Abbreviations expanded before city names are compared
+CITY_WORDS = {'ST': 'SAINT', 'STE': 'SAINTE', 'FT': 'FORT', 'MT': 'MOUNT', 'PT': 'POINT'}
+CITY_FIRST_WORDS = {'N': 'NORTH', 'S': 'SOUTH', 'E': 'EAST', 'W': 'WEST'}
+
+_ZIP = re.compile(r'(\d{5})(?:[- ]?(\d{4}))?')
+_NOT_LETTERS = re.compile(r'[^A-Z ]+')
+_CITY_PUNCTUATION = re.compile(r"[.,']+")
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_zip(value):
+    """
+    (zip, zip5): the ZIP as 'NNNNN' or 'NNNNN-NNNN' and its five-digit
+    part, or (value, None) if it is not a US ZIP. Leading zeros lost to
+    spreadsheets (2134, 21345678) are restored.
+    """
+    value = value.strip()
+    if value.isdigit():
+        if 3 <= len(value) <= 4:
+            value = value.zfill(5)
+        elif 7 <= len(value) <= 8:
+            value = value.zfill(9)
+    match = _ZIP.fullmatch(value)
+    if match is None:
+        return value, None
+    zip5, plus4 = match.groups()
+    return (f'{zip5}-{plus4}' if plus4 else zip5), zip5
+
+def normalize_state(value):
+    """Two-letter code for a state code or name (any case, dots allowed), or None"""
+    key = _SPACES.sub(' ', _NOT_LETTERS.sub('', value.upper())).strip()
+    if len(key.replace(' ', '')) == 2:
+        key = key.replace(' ', '')
+        return key if key in STATE_CODES else None
+    return STATE_NAMES.get(key)
+
+def city_key(value):
+    """City name reduced for comparison: upper case, no punctuation, abbreviations spelled out"""
+    words = _CITY_PUNCTUATION.sub('', value.upper()).replace('-', ' ').split()
+    if words:
+        words[0] = CITY_FIRST_WORDS.get(words[0], words[0])
+    return ' '.join(CITY_WORDS.get(word, word) for word in words)
+
+
+class ZipIndex:
+    """
+    Compact ZIP lookup. The state and preferred city of every five-digit
+    ZIP live in two direct-addressed numpy arrays (a few hundred KB for
+    the whole country); the few ZIPs served under more than one city name
+    keep the other names in a dict.
+    """
+
+    def __init__(self, rows):
+        self.state_codes = []
+        self.city_names = []
+        state_ids = {}
+        city_ids = {}
+        self.state_of = np.full(100000, -1, dtype=np.int8)
+        self.city_of = np.zeros(100000, dtype=np.int32)
+        self.other_cities = {}
+        for zip5, state, city, other_cities in rows:
+            code = int(zip5)
+            self.state_of[code] = state_ids.setdefault(state, len(state_ids))
+            self.city_of[code] = city_ids.setdefault(city, len(city_ids))
+            if other_cities:
+                self.other_cities[code] = tuple(other_cities.split('|'))
+        self.state_codes = list(state_ids)
+        self.city_names = list(city_ids)
+
+    @classmethod
+    def load(cls, path=ZIP_DATA_PATH):
+        with gzip.open(path, 'rt', encoding='utf-8') as file:
+            next(file)
+            return cls(line.rstrip('\n').split('\t') for line in file)
+
+    def lookup(self, zip5):
+        """(state, preferred city, other city names) for a five-digit ZIP, or None"""
+        code = int(zip5)
+        state = self.state_of[code]
+        if state < 0:
+            return None
+        return (
+            self.state_codes[state],
+            self.city_names[self.city_of[code]],
+            self.other_cities.get(code, ()),
+        )
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_zip_index():
+    """Process-wide ZIP index, loaded on first use"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = ZipIndex.load()
+    return _index
+
+@functools.lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def check_location(city, state, zip5):
+    """
+    (city, status) for a city, state code and five-digit ZIP. The city
+    comes back in its USPS spelling when it matches, and is filled in
+    when missing.
+    """
+    entry = get_zip_index().lookup(zip5)
+    if entry is None:
+        return city, 'unknown_zip'
+    zip_state, preferred, others = entry
+    if zip_state != state:
+        return city, 'mismatch'
+    if not city:
+        return preferred, 'valid'
+    key = city_key(city)
+    for name in (preferred,) + others:
+        if city_key(name) == key:
+            return name, 'valid'
+    return city, 'mismatch'
+
+@functools.lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def normalize_address(city, state, zip_code):
+    """
+    (city, state, zip, status) for one ship-to address. Valid addresses
+    whose spelling had to change are 'corrected'; anything that cannot be
+    checked keeps its original values.
+    """
+    city = _SPACES.sub(' ', city).strip()
+    normalized_zip, zip5 = normalize_zip(zip_code)
+    state_code = normalize_state(state)
+    if zip5 is None or state_code is None:
+        return city, state, zip_code, 'invalid'
+
+    checked_city, status = check_location(city, state_code, zip5)
+    if status != 'valid':
+        return city, state_code, normalized_zip, status
+    if (checked_city, state_code, normalized_zip) != (city, state, zip_code):
+        status = 'corrected'
+    return checked_city, state_code, normalized_zip, status
+
+def validate_addresses(cities, states, zips):
+    """
+    Normalize parallel ship-to columns (strings, '' when missing). Returns
+    lists of (cities, states, zips, statuses).
+    """
+    results = [normalize_address(*address) for address in zip(cities, states, zips)]
+    if not results:
+        return [], [], [], []
+    return tuple(list(column) for column in zip(*results))
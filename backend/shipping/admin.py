@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import SavedAddress, SavedPackage, ShipmentRecord
+from .models import SavedAddress, SavedPackage, ShipmentRecord, ImportJob, Purchase
 
 @admin.register(SavedAddress)
 class SavedAddressAdmin(admin.ModelAdmin):
@@ -15,4 +15,14 @@ class SavedPackageAdmin(admin.ModelAdmin):
 class ShipmentRecordAdmin(admin.ModelAdmin):
     list_display = ['order_no', 'to_first_name', 'to_last_name', 'to_city', 'to_state', 'status']
     list_filter = ['status', 'shipping_service']
-    search_fields = ['order_no', 'to_first_name', 'to_last_name', 'to_address']
\ No newline at end of file
+    search_fields = ['order_no', 'to_first_name', 'to_last_name', 'to_address']
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ['filename', 'user', 'status', 'rows_parsed', 'rows_inserted', 'created_at']
+    list_filter = ['status']
+
+@admin.register(Purchase)
+class PurchaseAdmin(admin.ModelAdmin):
+    list_display = ['user', 'records_processed', 'total', 'label_format', 'created_at']
+    search_fields = ['idempotency_key']
@@ -0,0 +1,162 @@
+"""
+Cheaper JWT authentication.
+
+simplejwt's JWTAuthentication loads the User row on every request, and
+views reading request.user.profile add a second query.
+
+CachedJWTAuthentication (the default) loads the user together with its
+profile in one query, and keeps them in process memory for
+AUTH_USER_CACHE_TTL seconds, so repeated requests cost no auth queries. Saves
+and deletes in this process drop the cached copy; changes made elsewhere
+show up once the TTL runs out.
+
+StatelessJWTAuthentication never queries: request.user is built from the
+token's claims. It is meant for read-only polling endpoints that only
+need the user's id. A deactivated or deleted user keeps access to them
+until the access token expires.
+"""
+import threading
+import time
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import router, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from .models import UserProfile
+
+USER_FIELDS = [field.attname for field in User._meta.concrete_fields]
+PROFILE_FIELDS = [field.attname for field in UserProfile._meta.concrete_fields]
+
+# Users remembered per process; the oldest entries make room for new ones
+USER_CACHE_SIZE = 10000
+
+
+def tokens_for(user):
+    """Refresh token (and through it the access token) carrying the claims a stateless user is built from"""
+    refresh = RefreshToken.for_user(user)
+    refresh['username'] = user.username
+    return refresh
+
+def token_user(validated_token):
+    """
+    An unsaved-looking User built from the token's claims, with only id
+    and username filled in. It works as a query filter value and foreign
+    key (filter(user=request.user)) but must never be saved.
+    """
+    try:
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+    except KeyError as e:
+        raise InvalidToken(_('Token contained no recognizable user identification')) from e
+    user = User(**{api_settings.USER_ID_FIELD: user_id}, username=validated_token.get('username', ''))
+    user._state.adding = False
+    user._state.db = router.db_for_read(User)
+    return user
+
+
+class UserCache:
+    """
+    Per-process {user id: (expiry, user row, profile row)} with a TTL.
+    Ids are keyed as strings, the way simplejwt puts them in tokens.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def get(self, user_id, ttl):
+        """Fresh User with its profile attached, from memory while the entry lasts; None if there is no such user"""
+        user_id = str(user_id)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(user_id)
+        if entry is None or entry[0] <= now:
+            entry = self.load(user_id, now + ttl)
+            if entry is None:
+                return None
+            if ttl > 0:
+                with self.lock:
+                    self.entries.pop(user_id, None)
+                    while len(self.entries) >= USER_CACHE_SIZE:
+                        del self.entries[next(iter(self.entries))]
+                    self.entries[user_id] = entry
+        return self.build(*entry[1:])
+
+    def load(self, user_id, expires):
+        try:
+            user = User.objects.select_related('profile').get(**{api_settings.USER_ID_FIELD: user_id})
+        except User.DoesNotExist:
+            return None
+        profile = getattr(user, 'profile', None)
+        return (
+            expires,
+            [getattr(user, name) for name in USER_FIELDS],
+            [getattr(profile, name) for name in PROFILE_FIELDS] if profile is not None else None,
+        )
+
+    def build(self, user_values, profile_values):
+        """New instances every time, so one request's changes never leak into another's"""
+        db = router.db_for_read(User)
+        user = User.from_db(db, USER_FIELDS, user_values)
+        if profile_values is not None:
+            user.profile = UserProfile.from_db(db, PROFILE_FIELDS, profile_values)
+        return user
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.entries.pop(str(user_id), None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+user_cache = UserCache()
+
+
+def forget_user(user_id):
+    """Drop the cached user once the current transaction commits, so it is not reloaded stale in between"""
+    transaction.on_commit(lambda: user_cache.invalidate(user_id))
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    forget_user(instance.pk)
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def profile_changed(sender, instance, **kwargs):
+    forget_user(instance.user_id)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication loading the user with its profile, from the per-process cache when enabled"""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_('Token contained no recognizable user identification')) from e
+
+        user = user_cache.get(user_id, settings.AUTH_USER_CACHE_TTL)
+        if user is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+
+        return user
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """JWT authentication without queries: request.user comes from token_user()"""
+
+    def get_user(self, validated_token):
+        return token_user(validated_token)
@@ -0,0 +1,158 @@
+from operator import itemgetter
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Case, Value, When, sql
+from .rates import cents_to_decimal
+
+
+def supports_update_returning(using):
+    """UPDATE ... RETURNING is available on PostgreSQL and SQLite 3.35+"""
+    connection = connections[using]
+    return (
+        connection.vendor in ('postgresql', 'sqlite')
+        and connection.features.can_return_columns_from_insert
+    )
+
+def supports_copy(using):
+    """COPY FROM STDIN is driven through psycopg 3's copy API"""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return False
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+    return is_psycopg3
+
+def copy_rows(model, fields, rows, using=DEFAULT_DB_ALIAS):
+    """
+    Stream `rows` (tuples in `fields` order) into the model's table with
+    COPY FROM STDIN in text format. Returns the number of rows copied.
+    """
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    columns = ', '.join(quote_name(field.column) for field in fields)
+    statement = f'COPY {quote_name(model._meta.db_table)} ({columns}) FROM STDIN'
+
+    count = 0
+    with connection.cursor() as cursor:
+        with cursor.cursor.copy(statement) as copy:
+            for row in rows:
+                copy.write_row(row)
+                count += 1
+    return count
+
+def update_returning(queryset, values, fields=None):
+    """
+    Apply `queryset.update(**values)` and return the updated rows.
+
+    Runs as a single UPDATE ... RETURNING statement where the database
+    supports it, otherwise as SELECT ids + UPDATE + SELECT. The UPDATE is
+    executed immediately; the returned iterator yields one dict per row
+    keyed like `.values(*fields)` (all concrete fields by default), in no
+    particular order.
+    """
+    model = queryset.model
+    using = queryset.db
+    if fields is None:
+        fields = [field.name for field in model._meta.concrete_fields]
+
+    if not supports_update_returning(using):
+        ids = list(queryset.values_list('pk', flat=True))
+        queryset.update(**values)
+        return model._default_manager.using(using).filter(pk__in=ids).values(*fields).order_by().iterator()
+
+    connection = connections[using]
+    query = queryset.query.chain(sql.UpdateQuery)
+    query.add_update_values(values)
+    update_sql, params = query.get_compiler(using).as_sql()
+    if not update_sql:
+        return iter(())
+
+    model_fields = [model._meta.get_field(name) for name in fields]
+    columns = [field.get_col(model._meta.db_table) for field in model_fields]
+    returning = ', '.join(connection.ops.quote_name(field.column) for field in model_fields)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'{update_sql} RETURNING {returning}', params)
+        results = cursor.fetchall()
+
+    converters = [
+        (i, connection.ops.get_db_converters(col) + col.get_db_converters(connection), col)
+        for i, col in enumerate(columns)
+    ]
+    converters = [(i, funcs, col) for i, funcs, col in converters if funcs]
+    return _convert_rows(results, fields, converters, connection)
+
+def delete_returning(queryset):
+    """
+    Delete the rows of `queryset` and return their primary keys.
+
+    Runs as a single DELETE ... RETURNING statement where the database
+    supports it, otherwise as SELECT ids + DELETE. Only for models whose
+    deletes need no cascades or signals.
+    """
+    model = queryset.model
+    using = queryset.db
+    if not supports_update_returning(using):
+        ids = list(queryset.values_list('pk', flat=True))
+        model._default_manager.using(using).filter(pk__in=ids).delete()
+        return ids
+
+    connection = connections[using]
+    query = queryset.query.chain(sql.DeleteQuery)
+    query.clear_ordering(force=True)
+    delete_sql, params = query.get_compiler(using).as_sql()
+    pk_column = connection.ops.quote_name(model._meta.pk.column)
+    with connection.cursor() as cursor:
+        cursor.execute(f'{delete_sql} RETURNING {pk_column}', params)
+        return [row[0] for row in cursor.fetchall()]
+
+def ordered_rows(model, rows):
+    """`.values()` rows sorted by the model's Meta.ordering, as a queryset would return them"""
+    rows = list(rows)
+    for name in reversed(model._meta.ordering):
+        field = name.lstrip('-')
+        rows.sort(key=itemgetter(model._meta.pk.name if field == 'pk' else field), reverse=name.startswith('-'))
+    return rows
+
+def _convert_rows(results, fields, converters, connection):
+    for result in results:
+        result = list(result)
+        for i, funcs, col in converters:
+            value = result[i]
+            for func in funcs:
+                value = func(value, col, connection)
+            result[i] = value
+        yield dict(zip(fields, result))
+
+def reprice_rows(model, rows, engine, chunk_size=1000, using=DEFAULT_DB_ALIAS):
+    """
+    Price updated `.values()` rows with the rate engine and write the prices
+    back with one CASE UPDATE per chunk, on the `using` connection the rows
+    were updated through. Rows the engine cannot price keep their current
+    price. Returns the rows with shipping_price filled in.
+    """
+    rows = list(rows)
+    if not rows:
+        return rows
+
+    cents, _, valid = engine.quote(
+        [row['shipping_service'] for row in rows],
+        [row['weight_lbs'] for row in rows],
+        [row['weight_oz'] for row in rows],
+        [row['from_zip'] for row in rows],
+        [row['to_zip'] for row in rows],
+    )
+    priced = []
+    for row, price, ok in zip(rows, cents, valid):
+        if ok:
+            row['shipping_price'] = cents_to_decimal(price)
+            priced.append(row)
+
+    price_field = model._meta.get_field('shipping_price')
+    for start in range(0, len(priced), chunk_size):
+        chunk = priced[start:start + chunk_size]
+        model._default_manager.using(using).filter(pk__in=[row['id'] for row in chunk]).update(
+            shipping_price=Case(
+                *[When(pk=row['id'], then=Value(row['shipping_price'])) for row in chunk],
+                output_field=price_field.clone()
+            )
+        )
+    return rows
@@ -0,0 +1,182 @@
+import csv
+import re
+import zipfile
+from xml.sax.saxutils import escape
+from django.http import StreamingHttpResponse
+from .ingest import (
+    COLUMN_COUNT, TEMPLATE_CATEGORY_ROW, TEMPLATE_COLUMN_ROW,
+    STRING_COLUMNS, INTEGER_COLUMNS, DECIMAL_COLUMNS, ORDER_NO_COLUMN
+)
+from .metrics import record_rows
+from .streaming import STREAM_CHUNK_SIZE, ZipSink
+
+# Model fields in template column order, followed by the shipment's own
+# state; importing an export ignores the extra columns
+_COLUMN_FIELDS = {
+    col: field for field, col, *_ in STRING_COLUMNS + INTEGER_COLUMNS + DECIMAL_COLUMNS
+}
+_COLUMN_FIELDS[ORDER_NO_COLUMN] = 'order_no'
+TEMPLATE_FIELDS = [_COLUMN_FIELDS[col] for col in range(COLUMN_COUNT)]
+
+EXTRA_FIELDS = ['shipping_service', 'shipping_price', 'status']
+EXPORT_FIELDS = TEMPLATE_FIELDS + EXTRA_FIELDS
+
+# download_template's header rows, widened for the extra columns
+EXPORT_HEADER_ROWS = [
+    TEMPLATE_CATEGORY_ROW + [''] * (len(EXPORT_FIELDS) - len(TEMPLATE_CATEGORY_ROW)),
+    TEMPLATE_COLUMN_ROW + ['Service', 'Price', 'Status'],
+]
+
+# Characters XML 1.0 cannot carry, even escaped
+_XML_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def export_rows(queryset):
+    """Lazily fetched export rows, a cursor batch at a time"""
+    return queryset.values_list(*EXPORT_FIELDS).iterator(chunk_size=STREAM_CHUNK_SIZE)
+
+
+class _Echo:
+    """File-like object whose write() hands the line straight back"""
+
+    def write(self, value):
+        return value
+
+def iter_csv(rows, batch_size=STREAM_CHUNK_SIZE):
+    """Yield the export as CSV in the template layout, batch_size rows per chunk"""
+    writer = csv.writer(_Echo())
+    yield ''.join(writer.writerow(row) for row in EXPORT_HEADER_ROWS).encode()
+    batch = []
+    for row in rows:
+        batch.append(writer.writerow(row))
+        if len(batch) >= batch_size:
+            record_rows(len(batch), 'serialized')
+            yield ''.join(batch).encode()
+            batch = []
+    if batch:
+        record_rows(len(batch), 'serialized')
+        yield ''.join(batch).encode()
+
+
+def column_letters(count):
+    letters = []
+    for i in range(count):
+        name = ''
+        i += 1
+        while i:
+            i, remainder = divmod(i - 1, 26)
+            name = chr(65 + remainder) + name
+        letters.append(name)
+    return letters
+
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Shipments" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+        'Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/styles.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/></cellXfs>'
+        '</styleSheet>'
+    ),
+}
+
+SHEET_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+SHEET_FOOTER = '</sheetData></worksheet>'
+
+def xlsx_row(number, values, letters):
+    cells = []
+    for letter, value in zip(letters, values):
+        if value is None or value == '':
+            continue
+        if isinstance(value, str):
+            text = escape(_XML_ILLEGAL.sub('', value))
+            cells.append(f'<c r="{letter}{number}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>')
+        else:
+            cells.append(f'<c r="{letter}{number}"><v>{value}</v></c>')
+    return f'<row r="{number}">{"".join(cells)}</row>'
+
+def iter_xlsx(rows, batch_size=STREAM_CHUNK_SIZE):
+    """
+    Yield the export as an XLSX workbook. The worksheet is one deflated
+    ZIP entry written row by row with inline strings, so nothing but the
+    current batch is held in memory.
+    """
+    letters = column_letters(len(EXPORT_FIELDS))
+    sink = ZipSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_PARTS.items():
+            archive.writestr(name, content)
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(SHEET_HEADER.encode())
+            for number, row in enumerate(EXPORT_HEADER_ROWS, start=1):
+                sheet.write(xlsx_row(number, row, letters).encode())
+            batch = []
+            for number, row in enumerate(rows, start=len(EXPORT_HEADER_ROWS) + 1):
+                batch.append(xlsx_row(number, row, letters))
+                if len(batch) >= batch_size:
+                    record_rows(len(batch), 'serialized')
+                    sheet.write(''.join(batch).encode())
+                    batch = []
+                    yield sink.drain()
+            record_rows(len(batch), 'serialized')
+            sheet.write(''.join(batch).encode())
+            sheet.write(SHEET_FOOTER.encode())
+    yield sink.drain()
+
+
+EXPORT_FORMATS = {
+    'csv': (iter_csv, 'text/csv'),
+    'xlsx': (iter_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+def export_response(queryset, file_type):
+    """Stream `queryset` as a CSV or XLSX attachment"""
+    generate, content_type = EXPORT_FORMATS[file_type]
+    response = StreamingHttpResponse(generate(export_rows(queryset)), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="shipments.{file_type}"'
+    return response
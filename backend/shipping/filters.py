@@ -0,0 +1,94 @@
+# Exact-match filters accepted by the shipment list endpoints
+SHIPMENT_FILTER_FIELDS = ['status', 'shipping_service', 'to_state', 'order_no', 'address_status']
+
+
+class SelectionError(Exception):
+    """A bulk request whose selection is invalid; `status` is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def shipment_lookups(values_by_field):
+    """Filter kwargs for {field: [values]}; several values match any of them"""
+    filters = {}
+    for field, values in values_by_field.items():
+        values = [value for value in values if value != '']
+        if len(values) == 1:
+            filters[field] = values[0]
+        elif values:
+            filters[f'{field}__in'] = values
+    return filters
+
+def filter_shipments(queryset, params):
+    """
+    Narrow a ShipmentRecord queryset by query params.
+
+    Each field may be repeated (?status=pending&status=error) to match any
+    of the given values.
+    """
+    return queryset.filter(**shipment_lookups({
+        field: params.getlist(field) for field in SHIPMENT_FILTER_FIELDS
+    }))
+
+def selection_lookups(data):
+    """
+    Filter kwargs for a bulk request's `filter` object, mapping
+    SHIPMENT_FILTER_FIELDS to a value or a list of values; None when the
+    request lists record_ids instead. Raises SelectionError if invalid.
+    """
+    conditions = data.get('filter')
+    if conditions is None:
+        return None
+    if data.get('record_ids') is not None:
+        raise SelectionError('Give either record_ids or filter, not both')
+    if not isinstance(conditions, dict) or not conditions:
+        raise SelectionError('filter must be an object with at least one field')
+    unknown = sorted(set(conditions) - set(SHIPMENT_FILTER_FIELDS))
+    if unknown:
+        raise SelectionError(
+            f'Unknown filter fields: {", ".join(unknown)}; use {", ".join(SHIPMENT_FILTER_FIELDS)}'
+        )
+    values_by_field = {}
+    for field, values in conditions.items():
+        values = values if isinstance(values, list) else [values]
+        # An empty value would silently drop the condition and widen the selection
+        if not values or not all(isinstance(value, str) and value for value in values):
+            raise SelectionError(f'filter {field} must be a non-empty string or list of strings')
+        values_by_field[field] = sorted(set(values))
+    return shipment_lookups(values_by_field)
+
+def is_id_list(value):
+    """Whether `value` is a list of integer ids; JSON true and false are not ids"""
+    return isinstance(value, list) and all(isinstance(pk, int) and not isinstance(pk, bool) for pk in value)
+
+def select_shipments(queryset, data):
+    """
+    The shipments a bulk request applies to, as a queryset.
+
+    `data` either gives a `filter` object (see selection_lookups), which
+    becomes the WHERE clause as is, or lists `record_ids`, all of which
+    must be in `queryset`. Either way validation costs at most one query,
+    whatever the size of the selection. Raises SelectionError otherwise.
+    """
+    lookups = selection_lookups(data)
+    if lookups is not None:
+        return queryset.filter(**lookups)
+
+    record_ids = data.get('record_ids')
+    if not record_ids:
+        raise SelectionError('No record IDs provided')
+    if not is_id_list(record_ids):
+        raise SelectionError('record_ids must be a list of integers')
+
+    records = queryset.filter(id__in=record_ids)
+    # One COUNT instead of loading ids; list the bad ones only when needed
+    found = records.count()
+    if not found:
+        raise SelectionError(f'No shipments found for IDs: {record_ids}', status=404)
+    if found != len(set(record_ids)):
+        existing_ids = set(records.values_list('id', flat=True))
+        invalid_ids = [pk for pk in record_ids if pk not in existing_ids]
+        raise SelectionError(f'Invalid shipment IDs: {invalid_ids}')
+    return records
@@ -0,0 +1,350 @@
+import secrets
+from itertools import repeat
+import numpy as np
+import pandas as pd
+from django.db import router, transaction
+from django.utils import timezone
+from .models import ImportJob, ShipmentRecord
+from .addresses import validate_addresses
+from .bulk import copy_rows, supports_copy
+from .rates import get_rate_engine, cents_to_decimal
+
+# Rows read from the CSV per pandas chunk
+DEFAULT_CHUNK_SIZE = 10000
+
+# Manifest columns in download_template order
+COLUMN_COUNT = 23
+
+# The two header rows every manifest starts with
+TEMPLATE_CATEGORY_ROW = [
+    'From', '', '', '', '', '', '', '',
+    'To', '', '', '', '', '', '', '',
+    'weight*', 'weight*',
+    'Dimensions*', 'Dimensions*', 'Dimensions*',
+    '', '', '', ''
+]
+
+TEMPLATE_COLUMN_ROW = [
+    'First name*', 'Last name', 'Address*', 'Address2', 'City*', 'ZIP/Postal code*', 'Abbreviation*',
+    'First name*', 'Last name', 'Address*', 'Address2', 'City*', 'ZIP/Postal code*', 'Abbreviation*',
+    'lbs', 'oz', 'Length', 'width', 'Height',
+    'phone num1', 'phone num2', 'order no', 'Item-sku'
+]
+
+# (model field, csv column, max length kept)
+STRING_COLUMNS = [
+    ('from_first_name', 0, 50),
+    ('from_last_name', 1, 50),
+    ('from_address', 2, 100),
+    ('from_address2', 3, 100),
+    ('from_city', 4, 50),
+    ('from_zip', 5, 20),
+    ('from_state', 6, 50),
+    ('to_first_name', 7, 50),
+    ('to_last_name', 8, 50),
+    ('to_address', 9, 100),
+    ('to_address2', 10, 100),
+    ('to_city', 11, 50),
+    ('to_zip', 12, 20),
+    ('to_state', 13, 50),
+    ('phone_num1', 19, 20),
+    ('phone_num2', 20, 20),
+    ('item_sku', 22, 30),
+]
+
+ORDER_NO_COLUMN = 21
+ORDER_NO_MAX_LENGTH = 30
+
+# Import modes: skip rows whose order already exists, or update it
+IMPORT_MODES = [mode for mode, _ in ImportJob.MODE_CHOICES]
+
+# A user's shipment is identified by its order number and item SKU
+UPSERT_KEY = ['user', 'order_no', 'item_sku']
+
+# (model field, csv column)
+INTEGER_COLUMNS = [
+    ('weight_lbs', 14),
+    ('weight_oz', 15),
+]
+
+DECIMAL_COLUMNS = [
+    ('length', 16),
+    ('width', 17),
+    ('height', 18),
+]
+
+# Largest values the model columns can hold
+MAX_INTEGER = 2 ** 31 - 1
+MAX_DIMENSION = 9999.99
+
+
+# Helper functions for safe conversion
+def safe_int(value, default=0):
+    try:
+        return int(float(value))
+    except (ValueError, TypeError):
+        return default
+
+def safe_float(value, default=0.0):
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return default
+
+def safe_int_column(column, default=0):
+    """Vectorized safe_int: returns (floats truncated toward zero, non-finite mask)"""
+    values = pd.to_numeric(column, errors='coerce').to_numpy(dtype='float64')
+    overflow = np.isinf(values)
+    values = np.where(np.isnan(values), default, np.trunc(values))
+    return values, overflow
+
+def safe_float_column(column, default=0.0):
+    """Vectorized safe_float: returns (floats, non-finite mask)"""
+    values = pd.to_numeric(column, errors='coerce').to_numpy(dtype='float64')
+    overflow = np.isinf(values)
+    values = np.where(np.isnan(values), default, values)
+    return values, overflow
+
+
+def read_manifest(file, chunksize=DEFAULT_CHUNK_SIZE, skiprows=2):
+    """
+    Read a manifest in chunks of raw string columns (two header rows
+    skipped), or as one frame when chunksize is None.
+    """
+    return pd.read_csv(
+        file,
+        skiprows=skiprows,
+        header=None,
+        encoding='utf-8',
+        dtype=str,
+        chunksize=chunksize,
+    )
+
+def parse_chunk(chunk, order_prefix='ORDER'):
+    """
+    Convert one raw chunk into column arrays. Rows without an order number
+    get '<order_prefix>-<row>'.
+
+    Returns (columns, row_numbers, errors) where columns maps model field
+    names to equally sized lists for the rows that parsed cleanly.
+
+    Rows are accepted and rejected as by the original iterrows() loop
+    (bench_ingest.legacy_parse), with the same errors, except for rows it
+    accepted that the database then refused, failing the whole upload:
+    missing or 'nan' dimensions are 0 here rather than NaN, and infinite
+    dimensions, numbers too large for their columns and weights with no
+    rate are row errors.
+    """
+    chunk = chunk.reindex(columns=range(COLUMN_COUNT))
+
+    # Skip empty rows (no recipient name at all)
+    chunk = chunk[chunk[7].notna() | chunk[8].notna()]
+    if chunk.empty:
+        return {}, [], []
+
+    index = chunk.index.to_numpy()
+    bad = np.zeros(len(chunk), dtype=bool)
+    reasons = np.full(len(chunk), '', dtype=object)
+
+    def flag(mask, message):
+        mask = mask & ~bad
+        reasons[mask] = message
+        bad[mask] = True
+
+    numbers = {}
+    for field, col in INTEGER_COLUMNS:
+        values, overflow = safe_int_column(chunk[col])
+        flag(overflow, 'cannot convert float infinity to integer')
+        flag(np.abs(values) > MAX_INTEGER, f'{field} out of range')
+        numbers[field] = values
+
+    for field, col in DECIMAL_COLUMNS:
+        values, overflow = safe_float_column(chunk[col])
+        flag(overflow, f'{field} must be a finite number')
+        flag(np.abs(values) > MAX_DIMENSION, f'{field} exceeds {MAX_DIMENSION}')
+        numbers[field] = values
+
+    # Normalize the ship-to city, state and ZIP first so zones come from clean ZIPs
+    chunk = chunk.copy()
+    chunk[11], chunk[13], chunk[12], address_status = validate_addresses(
+        *(chunk[col].fillna('').tolist() for col in (11, 13, 12))
+    )
+
+    # Uploads always start on ground; rows already flagged are priced as 0 oz
+    weights = [
+        np.where(bad, 0, numbers[field]).astype('int64')
+        for field in ('weight_lbs', 'weight_oz')
+    ]
+    cents, _, priced = get_rate_engine().quote(
+        ['ground'] * len(chunk), *weights, chunk[5].tolist(), chunk[12].tolist()
+    )
+    flag(~priced, 'no ground rate for this weight')
+
+    errors = [
+        {'row': int(row) + 2, 'error': reasons[i]}
+        for i, row in enumerate(index) if bad[i]
+    ]
+
+    good = ~bad
+    columns = {}
+    for field, col, max_length in STRING_COLUMNS:
+        columns[field] = chunk[col][good].fillna('').str.slice(0, max_length).tolist()
+
+    order_no = chunk[ORDER_NO_COLUMN][good].str.slice(0, ORDER_NO_MAX_LENGTH)
+    fallback = pd.Series(index[good], index=order_no.index).map(f'{order_prefix}-{{}}'.format)
+    columns['order_no'] = order_no.fillna(fallback).tolist()
+
+    for field, _ in INTEGER_COLUMNS:
+        columns[field] = numbers[field][good].astype('int64').tolist()
+    for field, _ in DECIMAL_COLUMNS:
+        columns[field] = numbers[field][good].tolist()
+
+    columns['address_status'] = np.asarray(address_status, dtype=object)[good].tolist()
+    columns['shipping_service'] = ['ground'] * int(good.sum())
+    columns['shipping_price'] = [cents_to_decimal(c) for c in cents[good]]
+
+    return columns, index[good].tolist(), errors
+
+def column_sources(columns, user, fields):
+    """
+    One value iterable per field: the parsed column, a per-import constant
+    (user, timestamps) or the field default repeated. `user` may be None
+    when the columns carry user_id.
+    """
+    count = len(next(iter(columns.values())))
+    now = timezone.now()
+    constants = {'user_id': getattr(user, 'pk', None), 'created_at': now, 'updated_at': now}
+    sources = []
+    for field in fields:
+        if field.attname in columns:
+            sources.append(columns[field.attname])
+        elif field.attname in constants:
+            sources.append(repeat(constants[field.attname], count))
+        else:
+            sources.append(repeat(field.get_default(), count))
+    return sources
+
+def build_records(columns, user):
+    """Instantiate unsaved ShipmentRecords from parsed column arrays"""
+    if not columns:
+        return []
+    # Positional Model() construction skips the per-kwarg lookups
+    sources = column_sources(columns, user, ShipmentRecord._meta.concrete_fields)
+    return [ShipmentRecord(*values) for values in zip(*sources)]
+
+def insert_chunk(columns, user, batch_size=DEFAULT_CHUNK_SIZE, method=None):
+    """
+    Insert parsed column arrays and return the number of rows written.
+
+    On PostgreSQL the rows are streamed with COPY FROM STDIN straight from
+    the columns, without building model instances; other databases use
+    batched bulk_create. `method` ('copy' or 'bulk_create') forces one.
+    """
+    if not columns:
+        return 0
+    using = router.db_for_write(ShipmentRecord)
+    if method is None:
+        method = 'copy' if supports_copy(using) else 'bulk_create'
+
+    if method == 'copy':
+        fields = [field for field in ShipmentRecord._meta.concrete_fields if not field.primary_key]
+        return copy_rows(ShipmentRecord, fields, zip(*column_sources(columns, user, fields)), using=using)
+
+    records = build_records(columns, user)
+    ShipmentRecord.objects.using(using).bulk_create(records, batch_size=batch_size)
+    return len(records)
+
+def existing_keys(user, keys, lock=False):
+    """
+    {(order_no, item_sku): status} for the user's records matching `keys`,
+    in one query over the (user, order_no, item_sku) unique index.
+    """
+    records = ShipmentRecord.objects.filter(user=user, order_no__in={order_no for order_no, _ in keys})
+    if lock:
+        records = records.select_for_update()
+    return {
+        (order_no, item_sku): record_status
+        for order_no, item_sku, record_status in records.values_list('order_no', 'item_sku', 'status')
+        if (order_no, item_sku) in keys
+    }
+
+def import_chunk(columns, rows, user, mode='create', batch_size=DEFAULT_CHUNK_SIZE):
+    """
+    Write one parsed chunk, deduplicated on (order_no, item_sku); returns
+    (created, updated, skipped, errors).
+
+    `rows` are the chunk's row numbers as returned by parse_chunk. In
+    'create' mode rows whose order the user already has are not written;
+    each is reported as an error. In 'upsert' mode they overwrite the
+    existing record through bulk_create(update_conflicts=True) unless it
+    has been purchased, and are skipped then. Within a chunk the last row
+    for an order wins, and the earlier ones are skipped. Either way this
+    costs one lookup query plus the insert, however many rows match.
+    """
+    if not columns:
+        return 0, 0, 0, []
+    keys = list(zip(columns['order_no'], columns['item_sku']))
+    last_row = {key: i for i, key in enumerate(keys)}
+    existing = existing_keys(user, last_row, lock=mode == 'upsert')
+
+    errors = []
+    if mode == 'upsert':
+        keep = sorted(i for key, i in last_row.items() if existing.get(key) != 'processed')
+    else:
+        keep = sorted(i for key, i in last_row.items() if key not in existing)
+        errors = [
+            {'row': int(rows[i]) + 2, 'error': f'Order {key[0]} already exists'}
+            for i, key in enumerate(keys) if last_row[key] == i and key in existing
+        ]
+    skipped = len(keys) - len(keep) - len(errors)
+    if len(keep) < len(keys):
+        columns = {field: [values[i] for i in keep] for field, values in columns.items()}
+
+    if mode != 'upsert':
+        return insert_chunk(columns, user, batch_size=batch_size), 0, skipped, errors
+
+    updated = sum(1 for i in keep if keys[i] in existing)
+    if keep:
+        ShipmentRecord.objects.bulk_create(
+            build_records(columns, user),
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=UPSERT_KEY,
+            update_fields=[field for field in columns if field not in UPSERT_KEY] + ['updated_at'],
+        )
+    return len(keep) - updated, updated, skipped, errors
+
+def new_order_prefix():
+    """Per-import prefix for generated order numbers, so they never collide"""
+    return f'ORDER-{secrets.token_hex(3)}'
+
+def parse_manifest(file, user, chunksize=DEFAULT_CHUNK_SIZE):
+    """Yield (records, errors) for each chunk of the manifest"""
+    order_prefix = new_order_prefix()
+    for chunk in read_manifest(file, chunksize=chunksize):
+        columns, _, errors = parse_chunk(chunk, order_prefix)
+        yield build_records(columns, user), errors
+
+def import_manifest(file, user, chunksize=DEFAULT_CHUNK_SIZE, mode='create'):
+    """
+    Parse and write a whole manifest atomically; returns (counts, errors)
+    where counts has 'created', 'updated' and 'skipped'.
+
+    The transaction can outlast SHIPMENT_SYNC_OVERLAP, so the written rows
+    are stamped again just before it commits: otherwise they would become
+    visible with an updated_at older than sync tokens already handed out.
+    """
+    counts = dict.fromkeys(['created', 'updated', 'skipped'], 0)
+    errors = []
+    order_prefix = new_order_prefix()
+    started = timezone.now()
+    with transaction.atomic():
+        for chunk in read_manifest(file, chunksize=chunksize):
+            columns, rows, chunk_errors = parse_chunk(chunk, order_prefix)
+            *chunk_counts, conflicts = import_chunk(columns, rows, user, mode, batch_size=chunksize)
+            for key, count in zip(counts, chunk_counts):
+                counts[key] += count
+            errors.extend(sorted(chunk_errors + conflicts, key=lambda error: error['row']))
+        if counts['created'] or counts['updated']:
+            ShipmentRecord.objects.filter(user=user, updated_at__gte=started).update(updated_at=timezone.now())
+    return counts, errors
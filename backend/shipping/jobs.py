@@ -0,0 +1,92 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.utils import timezone
+from .ingest import DEFAULT_CHUNK_SIZE, read_manifest, parse_chunk, import_chunk, new_order_prefix
+from .models import ImportJob
+from .summary import invalidate_summary
+
+# Row errors stored on a job; error_count counts them all
+MAX_JOB_ERRORS = 1000
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Process-wide worker pool, created on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMPORT_WORKERS,
+                thread_name_prefix='shipping-import',
+            )
+    return _executor
+
+def enqueue_import(job):
+    """Run the job on the worker pool once the creating transaction commits"""
+    transaction.on_commit(lambda: get_executor().submit(run_import, job.pk))
+
+def import_rows(job, chunk, order_prefix, batch_size=DEFAULT_CHUNK_SIZE, **progress):
+    """
+    Parse and import one chunk of a job's manifest, adding to its counters.
+    The rows, the counters and any `progress` fields are committed together.
+    """
+    columns, rows, errors = parse_chunk(chunk, order_prefix)
+    with transaction.atomic():
+        created, updated, skipped, conflicts = import_chunk(
+            columns, rows, job.user, job.mode, batch_size=batch_size
+        )
+        errors = sorted(errors + conflicts, key=lambda error: error['row'])
+        invalidate_summary(job.user)
+        job.rows_parsed += len(chunk)
+        job.rows_inserted += created
+        job.rows_updated += updated
+        job.rows_skipped += skipped
+        job.error_count += len(errors)
+        # Only the first MAX_JOB_ERRORS are kept, and the list is only
+        # written while it grows, so a chunk never rewrites a large JSON
+        kept = errors[:max(MAX_JOB_ERRORS - len(job.errors), 0)]
+        if kept:
+            job.errors.extend(kept)
+            progress['errors'] = job.errors
+        ImportJob.objects.filter(pk=job.pk).update(
+            rows_parsed=job.rows_parsed, rows_inserted=job.rows_inserted, rows_updated=job.rows_updated,
+            rows_skipped=job.rows_skipped, error_count=job.error_count, **progress
+        )
+
+def run_import(job_id, chunksize=DEFAULT_CHUNK_SIZE):
+    """
+    Import a queued job's manifest chunk by chunk.
+
+    Each chunk is committed on its own so progress is visible to pollers;
+    if a later chunk fails the job is marked failed and rows_inserted says
+    how many records made it in.
+    """
+    close_old_connections()
+    jobs = ImportJob.objects.filter(pk=job_id)
+    try:
+        job = ImportJob.objects.select_related('user').get(pk=job_id)
+        jobs.update(status='running', started_at=timezone.now())
+
+        order_prefix = new_order_prefix()
+        with job.file.open('rb') as file:
+            for chunk in read_manifest(file, chunksize=chunksize):
+                import_rows(job, chunk, order_prefix, batch_size=chunksize)
+
+        jobs.update(
+            status='completed',
+            message=f'Successfully imported {job.rows_inserted} records',
+            finished_at=timezone.now(),
+        )
+    except Exception as e:
+        jobs.update(status='failed', message=str(e), finished_at=timezone.now())
+    finally:
+        job = jobs.first()
+        if job and job.file:
+            job.file.delete(save=False)
+            jobs.update(file='')
+        # Persistent connections would stay open on the idle worker thread
+        connections.close_all()
@@ -0,0 +1,215 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import threading
+import time
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.http import StreamingHttpResponse
+from .jobs import get_executor
+from .models import ShipmentRecord
+from .streaming import ZipSink
+from .pdf import LABEL_FIELDS, LAYOUT_VERSION, iter_pdf, pdf_document, render_pages
+
+# Fewer cache misses than this are rendered in the calling process
+PARALLEL_THRESHOLD = 200
+
+# Labels per task sent to a pool worker
+RENDER_CHUNK_SIZE = 250
+
+# Seconds between sweeps of the page cache, per process
+CACHE_PRUNE_INTERVAL = 3600
+
+_pool = None
+_pool_lock = threading.Lock()
+_last_prune = None
+
+
+def get_label_pool():
+    """
+    Process-wide label rendering pool, created on first use. Workers are
+    spawned rather than forked: a fork of a threaded server process would
+    copy its locks and open database connections mid-use.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.LABEL_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=django.setup,
+            )
+    return _pool
+
+def purchased_labels(user_id, record_ids):
+    """Label rows for the user's purchased records, in id order"""
+    return list(
+        ShipmentRecord.objects.filter(user_id=user_id, id__in=record_ids, status='processed')
+        .order_by('id').values(*LABEL_FIELDS)
+    )
+
+def cache_path(label, label_format):
+    """
+    Content-addressed page path: <format>/<id shard>/<id>-<digest>, where
+    the digest covers the layout version and everything printed, so a
+    record's cached page stops matching as soon as the record changes.
+    """
+    payload = json.dumps([LAYOUT_VERSION, label_format, label], sort_keys=True, default=str)
+    digest = hashlib.sha256(payload.encode()).hexdigest()[:40]
+    return os.path.join(
+        settings.LABEL_CACHE_DIR, label_format, f"{label['id'] % 1000:03d}", f"{label['id']}-{digest}.page"
+    )
+
+def render_labels(labels, label_format):
+    """
+    Make sure every label has a cached page and return the page paths in
+    label order. Large batches of misses are rendered across the process
+    pool.
+    """
+    paths = [cache_path(label, label_format) for label in labels]
+    misses = [(path, label) for path, label in zip(paths, labels) if not os.path.exists(path)]
+
+    remove_stale_pages(misses)
+
+    if len(misses) >= PARALLEL_THRESHOLD and settings.LABEL_WORKERS > 1:
+        chunks = [misses[i:i + RENDER_CHUNK_SIZE] for i in range(0, len(misses), RENDER_CHUNK_SIZE)]
+        list(get_label_pool().map(render_pages, chunks, [label_format] * len(chunks)))
+    elif misses:
+        render_pages(misses, label_format)
+    if misses:
+        schedule_cache_prune()
+    return paths
+
+def remove_stale_pages(misses):
+    """
+    Delete cached pages of earlier versions of the missed records, one
+    directory scan per shard. Only finished pages are removed: a .tmp file
+    belongs to a render still in progress, such as a purchase's warmup.
+    """
+    by_directory = defaultdict(dict)
+    for path, label in misses:
+        by_directory[os.path.dirname(path)][f"{label['id']}-"] = os.path.basename(path)
+    for directory, current in by_directory.items():
+        try:
+            entries = os.scandir(directory)
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if not entry.name.endswith('.page'):
+                    continue
+                prefix = entry.name.split('-', 1)[0] + '-'
+                if prefix in current and entry.name != current[prefix]:
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        # Another render removed it first
+                        pass
+
+def prune_label_cache():
+    """
+    Bound the page cache: delete files older than LABEL_CACHE_MAX_AGE,
+    then the oldest pages until the rest fit in LABEL_CACHE_MAX_BYTES.
+    Returns the number of files deleted. A page deleted under a download
+    is rendered again when it is read (see load_page).
+    """
+    cutoff = time.time() - settings.LABEL_CACHE_MAX_AGE
+    pages = []
+    expired = []
+    for root, _, names in os.walk(settings.LABEL_CACHE_DIR):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if stat.st_mtime < cutoff:
+                expired.append(path)
+            elif name.endswith('.page'):
+                pages.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in pages)
+    if settings.LABEL_CACHE_MAX_BYTES and total > settings.LABEL_CACHE_MAX_BYTES:
+        pages.sort()
+        for _, size, path in pages:
+            if total <= settings.LABEL_CACHE_MAX_BYTES:
+                break
+            expired.append(path)
+            total -= size
+
+    for path in expired:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    return len(expired)
+
+def schedule_cache_prune():
+    """Prune the page cache in the background, at most every CACHE_PRUNE_INTERVAL"""
+    global _last_prune
+    now = time.monotonic()
+    with _pool_lock:
+        if _last_prune is not None and now - _last_prune < CACHE_PRUNE_INTERVAL:
+            return
+        _last_prune = now
+    get_executor().submit(prune_label_cache)
+
+def warm_labels(user_id, record_ids, label_format):
+    """Render freshly purchased labels ahead of the first download"""
+    close_old_connections()
+    try:
+        render_labels(purchased_labels(user_id, record_ids), label_format)
+    finally:
+        # Do not hold a connection between warmups
+        connections.close_all()
+
+def enqueue_label_warmup(user, record_ids, label_format):
+    """Warm the label cache in the background once the purchase commits"""
+    transaction.on_commit(lambda: get_executor().submit(warm_labels, user.pk, record_ids, label_format))
+
+
+def read_page(path):
+    with open(path, 'rb') as file:
+        return file.read()
+
+def load_page(path, label, label_format):
+    """The label's cached page, rendered again if the cache was pruned meanwhile"""
+    try:
+        return read_page(path)
+    except FileNotFoundError:
+        render_pages([(path, label)], label_format)
+        return read_page(path)
+
+def label_filename(label):
+    order_no = re.sub(r'[^A-Za-z0-9._-]+', '_', label['order_no'] or '')
+    return f"{label['id']}-{order_no}.pdf" if order_no else f"{label['id']}.pdf"
+
+
+def iter_labels_zip(labels, paths, label_format):
+    """Yield a ZIP with one single-page PDF per label, an entry at a time"""
+    sink = ZipSink()
+    # Pages are already deflated, so entries are stored as-is
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as archive:
+        for label, path in zip(labels, paths):
+            archive.writestr(label_filename(label), pdf_document([load_page(path, label, label_format)], label_format))
+            yield sink.drain()
+    yield sink.drain()
+
+def labels_response(labels, paths, label_format, output='pdf'):
+    """Stream labels as one multi-page PDF, or as a ZIP of PDFs"""
+    if output == 'zip':
+        body = iter_labels_zip(labels, paths, label_format)
+        content_type = 'application/zip'
+    else:
+        pages = (load_page(path, label, label_format) for label, path in zip(labels, paths))
+        body = iter_pdf(pages, len(paths), label_format)
+        content_type = 'application/pdf'
+    response = StreamingHttpResponse(body, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="shipping-labels-{label_format}.{output}"'
+    return response
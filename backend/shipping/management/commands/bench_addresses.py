@@ -0,0 +1,54 @@
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from shipping.addresses import check_location, normalize_address, validate_addresses, get_zip_index
+
+
+class Command(BaseCommand):
+    help = 'Benchmark ship-to address normalization and validation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000])
+        parser.add_argument('--distinct', type=int, default=20000,
+                            help='Distinct addresses the rows are drawn from')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def addresses(self, count, seed):
+        """`count` real city/state/ZIP triples, some misspelled the way manifests are"""
+        index = get_zip_index()
+        rng = np.random.default_rng(seed)
+        zips = rng.choice(np.flatnonzero(index.state_of >= 0), count)
+        cities, states, zip_codes = [], [], []
+        for i, code in enumerate(zips):
+            state, city, _ = index.lookup(f'{code:05d}')
+            kind = i % 10
+            cities.append(city.lower() if kind == 1 else '' if kind == 2 else 'Elsewhere' if kind == 3 else city)
+            states.append(state.lower() if kind == 4 else state)
+            zip_codes.append(str(code) if kind == 5 else f'{code:05d}-{i % 10000:04d}' if kind == 6 else f'{code:05d}')
+        return cities, states, zip_codes
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        get_zip_index()
+        self.stdout.write(f'index loaded in {time.perf_counter() - start:.3f}s')
+
+        pool = self.addresses(options['distinct'], options['seed'])
+        rng = np.random.default_rng(options['seed'] + 1)
+        for rows in options['rows']:
+            picks = rng.integers(0, options['distinct'], rows)
+            columns = [[column[i] for i in picks] for column in pool]
+
+            normalize_address.cache_clear()
+            check_location.cache_clear()
+            start = time.perf_counter()
+            _, _, _, statuses = validate_addresses(*columns)
+            cold = time.perf_counter() - start
+
+            start = time.perf_counter()
+            validate_addresses(*columns)
+            warm = time.perf_counter() - start
+
+            counts = {value: statuses.count(value) for value in sorted(set(statuses))}
+            self.stdout.write(
+                f'{rows:>8} rows  cold {rows / cold:>10,.0f} rows/s  warm {rows / warm:>10,.0f} rows/s  {counts}'
+            )
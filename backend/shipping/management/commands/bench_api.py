@@ -0,0 +1,237 @@
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from decimal import Decimal
+from unittest import mock
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from shipping.models import ShipmentRecord, UserProfile
+from shipping.synthetic import write_manifest
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Operation:
+    """Latency, query and status samples for one benchmarked operation"""
+
+    def __init__(self, name, rows_per_request):
+        self.name = name
+        self.rows_per_request = rows_per_request
+        self.latencies = []
+        self.queries = 0
+        self.statuses = {}
+
+    def count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def request(self, send):
+        """Send one request and read its body to the end; returns (response, body)"""
+        with contextlib.ExitStack() as stack:
+            for db in connections.all():
+                stack.enter_context(db.execute_wrapper(self.count_query))
+            start = time.perf_counter()
+            response = send()
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+            self.latencies.append(time.perf_counter() - start)
+        status = str(response.status_code)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        return response, body
+
+    def result(self, size):
+        seconds = sum(self.latencies)
+        rows = self.rows_per_request * len(self.latencies)
+        return {
+            'size': size,
+            'operation': self.name,
+            'requests': len(self.latencies),
+            'rows': rows,
+            'seconds': round(seconds, 4),
+            'rows_per_sec': round(rows / seconds, 1) if seconds else None,
+            'requests_per_sec': round(len(self.latencies) / seconds, 2) if seconds else None,
+            'p50_ms': round(percentile(self.latencies, 0.5) * 1000, 2),
+            'p99_ms': round(percentile(self.latencies, 0.99) * 1000, 2),
+            'queries': self.queries,
+            'queries_per_request': round(self.queries / len(self.latencies), 1),
+            'peak_rss_mb': peak_rss_mb(),
+            'statuses': self.statuses,
+        }
+
+
+class Command(BaseCommand):
+    help = (
+        'End-to-end benchmark of upload, list, bulk update, purchase and bulk delete through the '
+        'Django test client, with JSON results to compare between runs'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000],
+                            help='Manifest sizes, e.g. 1000 10000 100000 1000000')
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Requests per batched operation (pages, batch updates, purchases, deletes)')
+        parser.add_argument('--batch', type=int, default=100, help='Records per batched request')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON results to this file instead of stdout')
+        parser.add_argument('--compare', help='Earlier results to print throughput and p99 ratios against')
+
+    def handle(self, *args, **options):
+        results = {
+            'meta': {
+                'started_at': timezone.now().isoformat(),
+                'revision': git_revision(),
+                'database': connection.vendor,
+                'django': django.get_version(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+                'options': {key: options[key] for key in ('rows', 'requests', 'batch', 'seed')},
+            },
+            'results': [],
+        }
+
+        # Production-like request handling: DEBUG would log every query.
+        # Label warmup is background work started after a purchase commits,
+        # not part of the request being measured.
+        with override_settings(DEBUG=False, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']), \
+                mock.patch('shipping.views.enqueue_label_warmup'):
+            for size in options['rows']:
+                self.stderr.write(f'{size} rows...')
+                results['results'].extend(self.run_size(size, options))
+
+        text = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(text + '\n')
+        else:
+            self.stdout.write(text)
+        if options['compare']:
+            self.compare(options['compare'], results['results'])
+
+    def run_size(self, size, options):
+        rng = random.Random(options['seed'])
+        manifest = io.StringIO()
+        write_manifest(manifest, size, seed=options['seed'])
+        content = manifest.getvalue().encode()
+        del manifest
+
+        user = User.objects.create_user(username=f'bench-api-{size}-{rng.getrandbits(32):08x}')
+        UserProfile.objects.create(user=user, account_balance=Decimal('99999999.99'))
+        client = APIClient()
+        client.force_authenticate(user)
+        batch = options['batch']
+        operations = []
+
+        def run(name, rows_per_request, requests):
+            operation = Operation(name, rows_per_request)
+            for send in requests:
+                response, body = operation.request(send)
+                if response.status_code >= 400:
+                    raise CommandError(f'{name}: HTTP {response.status_code} {body[:500]!r}')
+            operations.append(operation)
+            return operation
+
+        try:
+            def upload():
+                file = io.BytesIO(content)
+                file.name = 'manifest.csv'
+                return client.post('/api/upload/', {'file': file}, format='multipart')
+            run('upload', size, [upload])
+
+            run('list_all', size, [lambda: client.get('/api/shipments/')])
+
+            cursor = {'next': None}
+
+            def page():
+                params = {'page_size': batch}
+                if cursor['next']:
+                    params['cursor'] = cursor['next']
+                response = client.get('/api/shipments/', params)
+                cursor['next'] = response.data['cursor']
+                return response
+            pages = min(options['requests'], math.ceil(size / batch))
+            run('list_page', batch, [page] * pages)
+
+            ids = list(ShipmentRecord.objects.filter(user=user).values_list('id', flat=True))
+            rng.shuffle(ids)
+            # Purchases and deletes each take their own disjoint batches
+            requests = min(options['requests'], len(ids) // (2 * batch))
+            slices = [ids[i * batch:(i + 1) * batch] for i in range(2 * requests)]
+
+            run('bulk_update_batch', batch, [
+                lambda: client.patch('/api/shipments/bulk/update/', {
+                    'record_ids': rng.sample(ids, batch), 'shipping_service': 'priority'
+                }, format='json')
+            ] * requests)
+            run('bulk_update_all', size, [
+                lambda: client.patch('/api/shipments/bulk/update/', {
+                    'filter': {'status': 'pending'}, 'shipping_service': 'ground'
+                }, format='json')
+            ])
+
+            run('purchase_batch', batch, [
+                lambda record_ids=record_ids: client.post('/api/purchase/', {'record_ids': record_ids}, format='json')
+                for record_ids in slices[:requests]
+            ])
+            remaining = size - batch * requests
+            run('purchase_all', remaining, [
+                lambda: client.post('/api/purchase/', {'filter': {'status': 'pending'}}, format='json')
+            ])
+
+            run('bulk_delete_batch', batch, [
+                lambda record_ids=record_ids: client.post(
+                    '/api/shipments/bulk/delete/', {'record_ids': record_ids}, format='json'
+                )
+                for record_ids in slices[requests:]
+            ])
+            run('bulk_delete_all', size - batch * requests, [
+                lambda: client.post('/api/shipments/bulk/delete/', {'filter': {'status': 'processed'}}, format='json')
+            ])
+        finally:
+            user.delete()
+
+        return [operation.result(size) for operation in operations]
+
+    def compare(self, path, results):
+        with open(path) as file:
+            baseline = {(r['size'], r['operation']): r for r in json.load(file)['results']}
+        self.stderr.write(f'{"size":>8} {"operation":<18} {"throughput":>11} {"p99":>8}')
+        for result in results:
+            before = baseline.get((result['size'], result['operation']))
+            if before is None:
+                continue
+            speed = (result['rows_per_sec'] or 0) / before['rows_per_sec'] if before['rows_per_sec'] else math.nan
+            p99 = result['p99_ms'] / before['p99_ms'] if before['p99_ms'] else math.nan
+            self.stderr.write(f'{result["size"]:>8} {result["operation"]:<18} {speed:>10.2f}x {p99:>7.2f}x')
@@ -0,0 +1,164 @@
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import time
+import wsgiref.util
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+from shipping.authentication import tokens_for
+from shipping.ingest import insert_chunk
+from shipping.models import UserProfile
+from shipping.synthetic import shipment_columns
+
+# Environment each configuration runs under, in its own process
+MODES = {
+    'no-reuse': {'DB_POOL': 'false', 'DB_CONN_MAX_AGE': '0'},
+    'persistent': {'DB_POOL': 'false', 'DB_CONN_MAX_AGE': '60'},
+    'pool': {'DB_POOL': 'true'},
+    'replica': {'DB_POOL': 'false', 'DB_CONN_MAX_AGE': '60', 'DATABASE_REPLICA_URL': '$DATABASE_URL'},
+}
+
+# (name, path, query string); caches are cleared before every request so
+# the summary is built from the database each time
+ENDPOINTS = [
+    ('list_page', '/api/shipments/', 'page_size=50'),
+    ('summary', '/api/shipments/summary/', ''),
+    ('imports', '/api/imports/', ''),
+]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[max(round(fraction * len(ordered)) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark per-request database connection overhead with connections opened per request, '
+        'persistent connections, the psycopg pool and replica-routed reads'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+        parser.add_argument('--requests', type=int, default=500, help='Requests per endpoint')
+        parser.add_argument('--shipments', type=int, default=1000, help='Shipments of the benchmark user')
+        parser.add_argument('--output', help='Write the JSON results to this file')
+        parser.add_argument('--child', action='store_true', help='Run one mode in this process (internal)')
+
+    def handle(self, *args, **options):
+        if options['child']:
+            self.stdout.write(json.dumps(self.run_mode(options)))
+            return
+
+        results = {}
+        for mode in options['modes']:
+            env = {**os.environ}
+            for key, value in MODES[mode].items():
+                env[key] = os.path.expandvars(value) if value.startswith('$') else value
+            if 'DATABASE_REPLICA_URL' in MODES[mode] and not env.get('DATABASE_URL'):
+                raise CommandError('The replica mode reads DATABASE_URL from the environment')
+            self.stderr.write(f'{mode}...')
+            process = subprocess.run(
+                [sys.executable, sys.argv[0], 'bench_connections', '--child',
+                 '--requests', str(options['requests']), '--shipments', str(options['shipments'])],
+                env=env, capture_output=True, text=True,
+            )
+            if process.returncode:
+                raise CommandError(f'{mode} failed:\n{process.stderr}')
+            results[mode] = json.loads(process.stdout.strip().splitlines()[-1])
+
+        self.stdout.write(f'{"mode":<11} {"endpoint":<10} {"req/s":>8} {"p50 ms":>8} {"p99 ms":>8} '
+                          f'{"connects":>8} {"backends":>8}  queries by alias')
+        for mode, endpoints in results.items():
+            for name, result in endpoints.items():
+                self.stdout.write(
+                    f'{mode:<11} {name:<10} {result["requests_per_sec"]:>8.1f} {result["p50_ms"]:>8.2f} '
+                    f'{result["p99_ms"]:>8.2f} {result["connects"]:>8} {result["backends"]:>8}  {result["queries"]}'
+                )
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(results, file, indent=2)
+                file.write('\n')
+
+    def run_mode(self, options):
+        """Time requests through the WSGI handler, so connections are closed or kept as in production"""
+        user = User.objects.create_user(username=f'bench-connections-{os.getpid()}')
+        UserProfile.objects.create(user=user)
+        if options['shipments']:
+            columns = shipment_columns(options['shipments'], seed=0)
+            columns['order_no'] = [f'BENCH-{i}' for i in range(options['shipments'])]
+            insert_chunk(columns, user)
+        token = str(tokens_for(user).access_token)
+        connections.close_all()
+
+        # Every connect (a pool checkout included) and the server connections behind them
+        connects = []
+
+        def opened(sender, connection, **kwargs):
+            server = connection.connection.info.backend_pid if connection.vendor == 'postgresql' else None
+            connects.append((connection.alias, server))
+        connection_created.connect(opened)
+
+        results = {}
+        try:
+            with override_settings(DEBUG=False, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, '127.0.0.1']):
+                handler = WSGIHandler()
+                for name, path, query in ENDPOINTS:
+                    results[name] = self.run_endpoint(handler, path, query, token, options['requests'], connects)
+        finally:
+            connection_created.disconnect(opened)
+            user.delete()
+            connections.close_all()
+        return results
+
+    def run_endpoint(self, handler, path, query, token, requests, connects):
+        queries = {}
+
+        def count(alias):
+            def wrapper(execute, sql, params, many, context):
+                queries[alias] = queries.get(alias, 0) + 1
+                return execute(sql, params, many, context)
+            return wrapper
+
+        connects.clear()
+        latencies = []
+        with contextlib.ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count(connection.alias)))
+            for _ in range(requests):
+                environ = {
+                    'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query,
+                    'HTTP_AUTHORIZATION': f'Bearer {token}',
+                }
+                wsgiref.util.setup_testing_defaults(environ)
+                cache.clear()
+                start = time.perf_counter()
+                response = handler(environ, lambda status, headers: None)
+                try:
+                    b''.join(response)
+                finally:
+                    # Sends request_finished, which closes or keeps the connections
+                    response.close()
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    raise CommandError(f'{path}: HTTP {response.status_code}')
+
+        seconds = sum(latencies)
+        return {
+            'requests': requests,
+            'requests_per_sec': round(requests / seconds, 1),
+            'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'connects': len(connects),
+            # Distinct PostgreSQL server processes the requests ran on
+            'backends': len(set(connects)),
+            'queries': queries,
+        }
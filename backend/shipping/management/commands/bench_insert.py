@@ -0,0 +1,54 @@
+import tempfile
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import router, transaction
+from shipping.bulk import supports_copy
+from shipping.ingest import DEFAULT_CHUNK_SIZE, read_manifest, parse_chunk, insert_chunk
+from shipping.models import ShipmentRecord
+from shipping.synthetic import write_manifest
+
+
+class Command(BaseCommand):
+    help = 'Benchmark manifest import rows/sec: COPY FROM STDIN vs batched bulk_create'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+        parser.add_argument('--methods', nargs='+', choices=['copy', 'bulk_create'], default=None)
+        parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        methods = options['methods']
+        if methods is None:
+            methods = ['bulk_create']
+            if supports_copy(router.db_for_write(ShipmentRecord)):
+                methods.append('copy')
+
+        for rows in options['rows']:
+            with tempfile.NamedTemporaryFile('w+', suffix='.csv') as manifest:
+                write_manifest(manifest, rows, seed=options['seed'])
+
+                results = {}
+                for method in methods:
+                    manifest.seek(0)
+                    # Everything is rolled back so each run starts from the same table
+                    with transaction.atomic():
+                        user = User.objects.create_user(username=f'bench-insert-{method}')
+                        start = time.perf_counter()
+                        inserted = 0
+                        for chunk in read_manifest(manifest, chunksize=options['chunksize']):
+                            columns, _, _ = parse_chunk(chunk)
+                            inserted += insert_chunk(columns, user, batch_size=options['chunksize'], method=method)
+                        elapsed = time.perf_counter() - start
+                        transaction.set_rollback(True)
+
+                    results[method] = inserted / elapsed
+                    self.stdout.write(
+                        f'{rows:>8} rows  {method:<12} {elapsed:8.3f}s  {results[method]:>10,.0f} rows/s'
+                    )
+
+                if len(results) == 2:
+                    self.stdout.write(self.style.SUCCESS(
+                        f'{rows:>8} rows  COPY speedup x{results["copy"] / results["bulk_create"]:.1f}'
+                    ))
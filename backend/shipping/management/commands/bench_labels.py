@@ -0,0 +1,56 @@
+import io
+import shutil
+import tempfile
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from shipping.ingest import parse_manifest
+from shipping.labels import render_labels, labels_response
+from shipping.pdf import LABEL_FIELDS, LABEL_FORMATS
+from shipping.synthetic import write_manifest
+
+
+class Command(BaseCommand):
+    help = 'Benchmark label rendering: serial, process pool and cached'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--labels', type=int, nargs='+', default=[1000, 10000])
+        parser.add_argument('--format', choices=LABEL_FORMATS, default='4x6')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        label_format = options['format']
+        user = User(pk=0)
+
+        for count in options['labels']:
+            text = io.StringIO()
+            write_manifest(text, count, seed=options['seed'])
+            labels = []
+            for records, _ in parse_manifest(io.StringIO(text.getvalue()), user):
+                for record in records:
+                    label = {field: getattr(record, field) for field in LABEL_FIELDS}
+                    label['id'] = len(labels) + 1
+                    labels.append(label)
+
+            timings = {}
+            for mode, workers in (('serial', 1), ('pool', options['workers'])):
+                cache_dir = tempfile.mkdtemp(prefix='bench-labels-')
+                try:
+                    with override_settings(LABEL_CACHE_DIR=cache_dir, LABEL_WORKERS=workers):
+                        start = time.perf_counter()
+                        paths = render_labels(labels, label_format)
+                        timings[mode] = time.perf_counter() - start
+
+                        if mode == 'pool':
+                            start = time.perf_counter()
+                            paths = render_labels(labels, label_format)
+                            size = sum(len(part) for part in labels_response(labels, paths, label_format).streaming_content)
+                            timings['cached + merge'] = time.perf_counter() - start
+                finally:
+                    shutil.rmtree(cache_dir, ignore_errors=True)
+
+            self.stdout.write(f'{count:>8} labels ({label_format}), merged PDF {size / 1e6:.1f} MB')
+            for mode, elapsed in timings.items():
+                self.stdout.write(f'  {mode:<16}{elapsed:8.3f}s {count / elapsed:>12,.0f} labels/s')
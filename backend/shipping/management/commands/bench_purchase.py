@@ -0,0 +1,116 @@
+import random
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.db.models import Sum
+from shipping.models import Purchase, ShipmentRecord, UserProfile
+from shipping.purchases import purchase_records, PurchaseError
+
+
+class Command(BaseCommand):
+    help = 'Load test purchase_records with many parallel purchasers against one account'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--purchasers', type=int, default=16)
+        parser.add_argument('--records', type=int, default=2000)
+        parser.add_argument('--batch', type=int, default=20, help='Records per purchase')
+        parser.add_argument('--purchases', type=int, default=50, help='Purchases per purchaser')
+        parser.add_argument('--balance-ratio', type=float, default=0.8,
+                            help='Starting balance as a fraction of the cost of every record')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark user afterwards')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        user = User.objects.create_user(username=f'bench-purchase-{uuid.uuid4().hex[:8]}')
+        ShipmentRecord.objects.bulk_create([
+            ShipmentRecord(
+                user=user,
+                to_first_name='Salina', to_last_name='Dixon', to_address='61 Sunny Trail Rd',
+                to_city='Wallace', to_zip='28466', to_state='NC',
+                length=6, width=6, height=6,
+                order_no=f'BENCH-{i}',
+                shipping_price=Decimal(rng.randint(250, 2000)).scaleb(-2),
+            )
+            for i in range(options['records'])
+        ], batch_size=5000)
+        ids = list(ShipmentRecord.objects.filter(user=user).values_list('id', flat=True))
+        cost = ShipmentRecord.objects.filter(user=user).aggregate(total=Sum('shipping_price'))['total']
+        opening = (cost * Decimal(str(options['balance_ratio']))).quantize(Decimal('0.01'))
+        UserProfile.objects.create(user=user, account_balance=opening)
+
+        # Overlapping random batches; every request is sent twice with the
+        # same key to exercise replays
+        plans = [
+            [rng.sample(ids, min(options['batch'], len(ids))) for _ in range(options['purchases'])]
+            for _ in range(options['purchasers'])
+        ]
+
+        def purchaser(batches):
+            stats = {'latencies': [], 'charged': 0, 'replayed': 0, 'refused': 0, 'failed': 0}
+            try:
+                for record_ids in batches:
+                    key = uuid.uuid4().hex
+                    for _ in range(2):
+                        start = time.perf_counter()
+                        try:
+                            _, replayed = purchase_records(user, record_ids, idempotency_key=key)
+                        except PurchaseError:
+                            stats['refused'] += 1
+                        except Exception as e:
+                            stats['failed'] += 1
+                            stats.setdefault('error', repr(e))
+                        else:
+                            stats['replayed' if replayed else 'charged'] += 1
+                        stats['latencies'].append(time.perf_counter() - start)
+            finally:
+                close_old_connections()
+            return stats
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['purchasers']) as pool:
+            results = list(pool.map(purchaser, plans))
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(t for r in results for t in r['latencies'])
+        totals = {key: sum(r[key] for r in results) for key in ('charged', 'replayed', 'refused', 'failed')}
+        self.stdout.write(
+            f"{options['purchasers']} purchasers, {len(latencies)} requests in {elapsed:.2f}s "
+            f"({len(latencies) / elapsed:,.0f} req/s); p50 {statistics.median(latencies) * 1000:.1f}ms, "
+            f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f}ms"
+        )
+        self.stdout.write(', '.join(f'{key} {value}' for key, value in totals.items()))
+        for r in results:
+            if 'error' in r:
+                self.stdout.write(f"  first failure: {r['error']}")
+                break
+
+        # Every charge must be accounted for exactly once
+        closing = UserProfile.objects.get(user=user).account_balance
+        purchases = Purchase.objects.filter(user=user).aggregate(total=Sum('total'), records=Sum('records_processed'))
+        processed = ShipmentRecord.objects.filter(user=user, status='processed').aggregate(total=Sum('shipping_price'))
+        processed_count = ShipmentRecord.objects.filter(user=user, status='processed').count()
+        charged = opening - closing
+        self.stdout.write(f'balance {opening} -> {closing}; charged {charged} for {processed_count} labels')
+
+        try:
+            if closing < 0:
+                raise CommandError('Balance went negative')
+            if charged != (purchases['total'] or 0) or charged != (processed['total'] or 0):
+                raise CommandError(
+                    f"Charged {charged}, purchases total {purchases['total']}, processed records {processed['total']}"
+                )
+            if processed_count != (purchases['records'] or 0):
+                raise CommandError(f"{processed_count} records processed, {purchases['records']} purchased")
+            if totals['charged'] != Purchase.objects.filter(user=user).count():
+                raise CommandError('A purchase was charged without being recorded')
+        finally:
+            if not options['keep']:
+                user.delete()
+
+        self.stdout.write(self.style.SUCCESS('No lost updates or double charges'))
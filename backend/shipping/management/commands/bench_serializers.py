@@ -0,0 +1,52 @@
+import io
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from shipping.ingest import parse_manifest
+from shipping.models import ShipmentRecord
+from shipping.serializers import ShipmentRecordSerializer, ShipmentRecordListSerializer
+from shipping.synthetic import write_manifest
+
+
+class Command(BaseCommand):
+    help = 'Benchmark ShipmentRecordSerializer against the .values() list serializer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        renderer = JSONRenderer()
+
+        for rows in options['rows']:
+            # Seed inside a transaction that is rolled back afterwards
+            with transaction.atomic():
+                user = User.objects.create_user(username=f'bench-serializers-{rows}')
+                text = io.StringIO()
+                write_manifest(text, rows, seed=options['seed'])
+                for records, _ in parse_manifest(io.StringIO(text.getvalue()), user):
+                    ShipmentRecord.objects.bulk_create(records, batch_size=5000)
+                shipments = ShipmentRecord.objects.filter(user=user)
+
+                start = time.perf_counter()
+                slow = renderer.render(ShipmentRecordSerializer(shipments, many=True).data)
+                slow_elapsed = time.perf_counter() - start
+
+                start = time.perf_counter()
+                fast = renderer.render(ShipmentRecordListSerializer(
+                    ShipmentRecordListSerializer.rows(shipments), many=True
+                ).data)
+                fast_elapsed = time.perf_counter() - start
+
+                transaction.set_rollback(True)
+
+            if slow != fast:
+                raise CommandError(f'{rows} rows: serializer outputs differ')
+
+            self.stdout.write(
+                f'{rows:>8} rows  model serializer {slow_elapsed:7.3f}s  '
+                f'values serializer {fast_elapsed:7.3f}s  '
+                f'speedup x{slow_elapsed / fast_elapsed:.1f}  ({len(fast):,} identical bytes)'
+            )
@@ -0,0 +1,208 @@
+# backend/shipping/management/commands/seed_data.py
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router, transaction
+from django.utils import timezone
+from shipping.bulk import supports_copy
+from shipping.ingest import insert_chunk
+from shipping.models import SavedAddress, SavedPackage, ShipmentRecord, UserProfile
+from shipping.synthetic import shipment_columns
+
+# Presets every seeded user starts with
+SAVED_ADDRESSES = [
+    {
+        'name': 'Print TTS - San Dimas',
+        'first_name': 'Print',
+        'last_name': 'TTS',
+        'address_line1': '502 W Arrow Hwy',
+        'address_line2': 'STE P',
+        'city': 'San Dimas',
+        'state': 'CA',
+        'zip_code': '91773',
+        'phone': '909-123-4567'
+    },
+    {
+        'name': 'Print TTS - Claremont',
+        'first_name': 'Print',
+        'last_name': 'TTS',
+        'address_line1': '500 W Foothill Blvd',
+        'address_line2': 'STE P',
+        'city': 'Claremont',
+        'state': 'CA',
+        'zip_code': '91711',
+        'phone': '909-234-5678'
+    },
+    {
+        'name': 'Print TTS - Ontario',
+        'first_name': 'Print',
+        'last_name': 'TTS',
+        'address_line1': '1170 Grove Ave',
+        'address_line2': '',
+        'city': 'Ontario',
+        'state': 'CA',
+        'zip_code': '91764',
+        'phone': '909-345-6789'
+    }
+]
+
+SAVED_PACKAGES = [
+    {
+        'name': 'Light Package',
+        'length': 6,
+        'width': 6,
+        'height': 6,
+        'weight_lbs': 1,
+        'weight_oz': 0
+    },
+    {
+        'name': '8 Oz Item',
+        'length': 4,
+        'width': 4,
+        'height': 4,
+        'weight_lbs': 0,
+        'weight_oz': 8
+    },
+    {
+        'name': 'Standard Box',
+        'length': 12,
+        'width': 12,
+        'height': 12,
+        'weight_lbs': 2,
+        'weight_oz': 0
+    }
+]
+
+# Users created per bulk_create
+USER_BATCH_SIZE = 5000
+
+
+def seed_shipments(task, start, end, user_ids, per_user, seed, now):
+    """
+    Insert rows [start, end) of the users x shipments grid in one
+    transaction. Row r is shipment r % per_user of the user at r // per_user;
+    `user_ids` starts at the user of row `start`. Row values depend only
+    on (seed, task).
+    """
+    rows = range(start, end)
+    first_user = start // per_user
+    columns = shipment_columns(len(rows), seed=[seed, task], now=now)
+    columns['user_id'] = [user_ids[r // per_user - first_user] for r in rows]
+    columns['order_no'] = [f'SEED-{seed}-{r % per_user}' for r in rows]
+    columns['item_sku'] = [f'SKU-{r % 500}' for r in rows]
+    with transaction.atomic(using=router.db_for_write(ShipmentRecord)):
+        return insert_chunk(columns, None)
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed users with saved addresses and packages, and optionally many synthetic shipments each; '
+        'for example --users 1000 --shipments 10000 for 10M shipments'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1, help='Users to seed')
+        parser.add_argument('--shipments', type=int, default=0, help='Shipments per user')
+        parser.add_argument('--prefix', default='seed', help='Seeded usernames are <prefix>-<n>')
+        parser.add_argument('--password', default='seed-password', help='Password of every seeded user')
+        parser.add_argument('--seed', type=int, default=0, help='Same seed and batch size, same shipments')
+        parser.add_argument('--batch-size', type=int, default=50000, help='Shipments inserted per transaction')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Processes inserting shipments (always 1 without PostgreSQL COPY)')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['shipments'] < 0 or options['batch_size'] < 1:
+            raise CommandError('--users and --batch-size must be positive, --shipments not negative')
+
+        user_ids = self.seed_users(options)
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {len(user_ids)} users with {len(SAVED_ADDRESSES)} addresses and {len(SAVED_PACKAGES)} packages each'
+        ))
+        if not user_ids or not options['shipments']:
+            return
+
+        total = len(user_ids) * options['shipments']
+        start = time.perf_counter()
+        written = self.seed_shipments(user_ids, options)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {written} of {total} shipments in {elapsed:.1f}s ({written / elapsed:,.0f} rows/s)'
+        ))
+
+    def seed_users(self, options):
+        """Create the missing <prefix>-<n> users and their presets; returns the new users' ids"""
+        usernames = [f'{options["prefix"]}-{n}' for n in range(1, options['users'] + 1)]
+        # Filtered in Python: an IN list of a million names is too long for some databases
+        seeded = User.objects.filter(username__startswith=f'{options["prefix"]}-')
+        existing = set(seeded.values_list('username', flat=True)).intersection(usernames)
+        if existing:
+            self.stdout.write(f'Skipping {len(existing)} users that already exist')
+
+        # One hash for everyone: hashing per user would dominate seeding
+        password = make_password(options['password'])
+        with transaction.atomic():
+            User.objects.bulk_create(
+                [User(username=name, password=password) for name in usernames if name not in existing],
+                batch_size=USER_BATCH_SIZE,
+            )
+            # bulk_create only returns primary keys on some databases
+            wanted = set(usernames) - existing
+            ids = {name: pk for pk, name in seeded.values_list('pk', 'username') if name in wanted}
+            user_ids = [ids[name] for name in usernames if name in ids]
+            UserProfile.objects.bulk_create(
+                [UserProfile(user_id=user_id) for user_id in user_ids], batch_size=USER_BATCH_SIZE
+            )
+            SavedAddress.objects.bulk_create(
+                [SavedAddress(user_id=user_id, **address) for user_id in user_ids for address in SAVED_ADDRESSES],
+                batch_size=USER_BATCH_SIZE,
+            )
+            SavedPackage.objects.bulk_create(
+                [SavedPackage(user_id=user_id, **package) for user_id in user_ids for package in SAVED_PACKAGES],
+                batch_size=USER_BATCH_SIZE,
+            )
+        return user_ids
+
+    def seed_shipments(self, user_ids, options):
+        per_user = options['shipments']
+        total = len(user_ids) * per_user
+        batch_size = options['batch_size']
+        now = timezone.now()
+        tasks = []
+        for task, start in enumerate(range(0, total, batch_size)):
+            end = min(start + batch_size, total)
+            tasks.append((
+                task, start, end, user_ids[start // per_user:(end - 1) // per_user + 1],
+                per_user, options['seed'], now,
+            ))
+
+        workers = min(options['workers'] or 1, len(tasks))
+        if not supports_copy(router.db_for_write(ShipmentRecord)):
+            # SQLite allows one writer at a time
+            workers = 1
+
+        written = 0
+        if workers == 1:
+            for task in tasks:
+                written += seed_shipments(*task)
+                self.report(written, total)
+            return written
+
+        # Workers open their own connections; none may be shared across processes.
+        # The initializer must not import this module: it needs the app registry.
+        connections.close_all()
+        with ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup
+        ) as executor:
+            futures = [executor.submit(seed_shipments, *task) for task in tasks]
+            for future in futures:
+                written += future.result()
+                self.report(written, total)
+        return written
+
+    def report(self, written, total):
+        self.stderr.write(f'{written}/{total} shipments ({written / total:.0%})')
@@ -0,0 +1,270 @@
+"""
+Per-view request metrics in the Prometheus text format.
+
+MetricsMiddleware times every request and keeps, per view: a latency
+histogram, SQL queries (count, time and a per-request histogram), response
+payload bytes and the rows views report through record_rows(). Streamed
+responses are measured until their last chunk is sent. /api/metrics/
+renders the totals. They live in process memory, so with several worker
+processes each one is scraped on its own.
+
+With METRICS_PROFILE_DIR set, a sample of requests (METRICS_PROFILE_RATE)
+runs under cProfile, and those slower than METRICS_PROFILE_MIN_SECONDS
+are dumped there as .prof files for pstats or snakeviz.
+"""
+import contextvars
+import cProfile
+import hmac
+import os
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from django.utils import timezone
+
+# Upper bounds of the histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 500)
+
+_current = contextvars.ContextVar('shipping_request_stats', default=None)
+
+
+class RequestStats:
+    """What one request has cost so far"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.payload_bytes = 0
+        self.rows = defaultdict(int)
+
+
+def record_rows(count, stage):
+    """
+    Count rows handled by the current request at `stage`: 'parsed' from
+    an upload, 'written' to the database or 'serialized' into the
+    response. A no-op outside a request.
+    """
+    stats = _current.get()
+    if stats is not None:
+        stats.rows[stage] += count
+
+def count_query(execute, sql, params, many, context):
+    """Database execute wrapper adding each query to the current request's stats"""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.query_seconds += time.perf_counter() - start
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket', {**labels, 'le': f'{bound:g}'}, cumulative
+        yield f'{name}_bucket', {**labels, 'le': '+Inf'}, self.count
+        yield f'{name}_sum', labels, self.total
+        yield f'{name}_count', labels, self.count
+
+
+class Registry:
+    """Per-process metric totals, keyed by label values"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.latency = {}
+        self.queries_per_request = {}
+        self.queries = defaultdict(int)
+        self.query_seconds = defaultdict(float)
+        self.payload_bytes = defaultdict(int)
+        self.rows = defaultdict(int)
+
+    def observe(self, view, method, status_code, stats):
+        elapsed = time.perf_counter() - stats.started
+        with self.lock:
+            self.requests[view, method, str(status_code)] += 1
+            self.latency.setdefault((view, method), Histogram(LATENCY_BUCKETS)).observe(elapsed)
+            self.queries_per_request.setdefault(view, Histogram(QUERY_COUNT_BUCKETS)).observe(stats.queries)
+            self.queries[view] += stats.queries
+            self.query_seconds[view] += stats.query_seconds
+            self.payload_bytes[view] += stats.payload_bytes
+            for stage, count in stats.rows.items():
+                self.rows[view, stage] += count
+
+    def families(self):
+        """(name, type, help, samples) for every metric, samples as (name, labels, value)"""
+        with self.lock:
+            yield 'shipping_requests_total', 'counter', 'Requests by view, method and status', [
+                ('shipping_requests_total', {'view': v, 'method': m, 'status': s}, n)
+                for (v, m, s), n in sorted(self.requests.items())
+            ]
+            yield 'shipping_request_duration_seconds', 'histogram', 'Time to the last byte of the response', [
+                sample for (v, m), histogram in sorted(self.latency.items())
+                for sample in histogram.samples('shipping_request_duration_seconds', {'view': v, 'method': m})
+            ]
+            yield 'shipping_db_queries_per_request', 'histogram', 'SQL queries run by one request', [
+                sample for v, histogram in sorted(self.queries_per_request.items())
+                for sample in histogram.samples('shipping_db_queries_per_request', {'view': v})
+            ]
+            yield 'shipping_db_queries_total', 'counter', 'SQL queries', [
+                ('shipping_db_queries_total', {'view': v}, n) for v, n in sorted(self.queries.items())
+            ]
+            yield 'shipping_db_query_seconds_total', 'counter', 'Time spent in SQL queries', [
+                ('shipping_db_query_seconds_total', {'view': v}, n) for v, n in sorted(self.query_seconds.items())
+            ]
+            yield 'shipping_response_bytes_total', 'counter', 'Response payload bytes', [
+                ('shipping_response_bytes_total', {'view': v}, n) for v, n in sorted(self.payload_bytes.items())
+            ]
+            yield 'shipping_rows_total', 'counter', 'Shipment rows parsed, written and serialized', [
+                ('shipping_rows_total', {'view': v, 'stage': s}, n) for (v, s), n in sorted(self.rows.items())
+            ]
+
+    def render(self):
+        lines = []
+        for name, kind, help_text, samples in self.families():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for sample, labels, value in samples:
+                label_text = ','.join(f'{key}="{escape_label(value)}"' for key, value in labels.items())
+                lines.append(f'{sample}{{{label_text}}} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def format_value(value):
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+registry = Registry()
+
+# cProfile can only run one profile at a time per process
+_profile_lock = threading.Lock()
+
+
+class MetricsMiddleware:
+    """Record metrics for every request; put it first in MIDDLEWARE"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        for connection in connections.all():
+            if count_query not in connection.execute_wrappers:
+                # At the bottom of the stack: execute_wrapper() contexts pop
+                # the last wrapper, which must stay theirs
+                connection.execute_wrappers.insert(0, count_query)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        profiler = self.start_profile()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+            if profiler is not None:
+                self.finish_profile(profiler, request, stats)
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else 'unmatched'
+
+        def finish():
+            registry.observe(view, request.method, response.status_code, stats)
+
+        if response.streaming:
+            response.streaming_content = self.measure_stream(response.streaming_content, stats, finish)
+        else:
+            stats.payload_bytes = len(response.content)
+            finish()
+        return response
+
+    def measure_stream(self, content, stats, finish):
+        """Pass the body through, counting its bytes and queries, and record the request at the end"""
+        iterator = iter(content)
+        try:
+            while True:
+                token = _current.set(stats)
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    _current.reset(token)
+                stats.payload_bytes += len(chunk)
+                yield chunk
+        finally:
+            finish()
+
+    def start_profile(self):
+        if not settings.METRICS_PROFILE_DIR or random.random() >= settings.METRICS_PROFILE_RATE:
+            return None
+        if not _profile_lock.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler (a debugger, coverage) is active
+            _profile_lock.release()
+            return None
+        return profiler
+
+    def finish_profile(self, profiler, request, stats):
+        """Dump the view's profile if it was slow; streamed bodies are not included"""
+        try:
+            profiler.disable()
+            elapsed = time.perf_counter() - stats.started
+            if elapsed < settings.METRICS_PROFILE_MIN_SECONDS:
+                return
+            match = getattr(request, 'resolver_match', None)
+            view = re.sub(r'[^A-Za-z0-9_-]+', '_', match.view_name if match is not None else 'unmatched')
+            os.makedirs(settings.METRICS_PROFILE_DIR, exist_ok=True)
+            profiler.dump_stats(os.path.join(
+                settings.METRICS_PROFILE_DIR,
+                f'{timezone.now():%Y%m%dT%H%M%S%f}-{request.method}-{view}-{elapsed * 1000:.0f}ms.prof'
+            ))
+        finally:
+            _profile_lock.release()
+
+
+def metrics_view(request):
+    """
+    The totals in the Prometheus text format. Scrapers send
+    `Authorization: Bearer <METRICS_TOKEN>`; without a token configured
+    the endpoint is only served with DEBUG on.
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        given = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not hmac.compare_digest(given.encode(), token.encode()):
+            return HttpResponse('Invalid metrics token\n', status=401, content_type='text/plain')
+    elif not settings.DEBUG:
+        return HttpResponse(status=404)
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,17 @@
+# Generated by Django 6.0.2 on 2026-10-16 23:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shipping', '0004_importjob'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='shipmentrecord',
+            options={'ordering': ['-created_at', '-id']},
+        ),
+    ]
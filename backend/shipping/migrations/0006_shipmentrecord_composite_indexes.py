@@ -0,0 +1,33 @@
+# Generated by Django 6.0.2 on 2026-10-16 23:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shipping', '0005_alter_shipmentrecord_ordering'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='shipmentrecord',
+            name='user',
+            field=models.ForeignKey(db_index=False, default=1, on_delete=django.db.models.deletion.CASCADE, related_name='shipments', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='shipmentrecord',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='shipment_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shipmentrecord',
+            index=models.Index(fields=['user', 'status'], name='shipment_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shipmentrecord',
+            index=models.Index(fields=['user', 'order_no'], name='shipment_user_order_no_idx'),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 6.0.2 on 2026-10-17 00:20
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+# Duplicate groups listed when the migration refuses to run
+REPORTED_DUPLICATES = 20
+
+
+def check_duplicate_orders(apps, schema_editor):
+    """
+    Earlier uploads could store the same order twice. Which copy is right
+    is for the account owner to decide, so rather than rewriting order
+    numbers, stop with a list of the duplicates to merge or renumber
+    before the unique constraint can be added.
+    """
+    ShipmentRecord = apps.get_model('shipping', 'ShipmentRecord')
+    duplicates = (
+        ShipmentRecord.objects.values('user', 'order_no', 'item_sku')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+        .order_by('user', 'order_no', 'item_sku')
+    )
+    total = duplicates.count()
+    if not total:
+        return
+    lines = []
+    for group in duplicates[:REPORTED_DUPLICATES]:
+        ids = ShipmentRecord.objects.filter(
+            user=group['user'], order_no=group['order_no'], item_sku=group['item_sku']
+        ).order_by('id').values_list('id', flat=True)
+        lines.append(
+            f"  user {group['user']}, order_no {group['order_no']!r}, item_sku {group['item_sku']!r}: "
+            f"records {', '.join(map(str, ids))}"
+        )
+    if total > REPORTED_DUPLICATES:
+        lines.append(f'  ... and {total - REPORTED_DUPLICATES} more')
+    raise RuntimeError(
+        f'Found {total} (user, order_no, item_sku) stored more than once. Delete or renumber the extra records, '
+        'then run the migration again:\n' + '\n'.join(lines)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shipping', '0007_purchase'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='shipmentrecord',
+            name='shipment_user_order_no_idx',
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='mode',
+            field=models.CharField(choices=[('create', 'Create, skipping existing orders'), ('upsert', 'Create or update existing orders')], default='create', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='rows_skipped',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='rows_updated',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(check_duplicate_orders, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='shipmentrecord',
+            constraint=models.UniqueConstraint(fields=('user', 'order_no', 'item_sku'), name='shipment_user_order_sku_uniq'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-17 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shipping', '0009_shipment_changes_feed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shipmentrecord',
+            name='address_status',
+            field=models.CharField(choices=[('unverified', 'Unverified'), ('valid', 'Valid'), ('corrected', 'Corrected'), ('mismatch', 'City or state does not match ZIP'), ('unknown_zip', 'Unknown ZIP'), ('invalid', 'Invalid')], default='unverified', max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-17 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shipping', '0011_importjob_chunked_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='appending_since',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 6.0.2 on 2026-10-17 19:40
+
+from django.db import migrations, models
+
+
+def count_stored_errors(apps, schema_editor):
+    """Earlier jobs stored every error, so their count is the list's length"""
+    ImportJob = apps.get_model('shipping', 'ImportJob')
+    for job in ImportJob.objects.exclude(errors=[]).only('id', 'errors').iterator():
+        ImportJob.objects.filter(pk=job.pk).update(error_count=len(job.errors))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shipping', '0012_importjob_appending_since'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='error_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_stored_errors, migrations.RunPython.noop),
+    ]
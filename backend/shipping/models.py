@@ -1,9 +1,25 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.contrib.postgres.fields import ArrayField
+from rest_framework.utils.encoders import JSONEncoder
 import uuid
 import os
 from django.utils import timezone
+from .rates import get_rate_engine
+
+def format_address(first_name, last_name, address, address2, city, state, zip_code):
+    """One-line address as shown in the shipment tables"""
+    parts = [f"{first_name} {last_name}"]
+    parts.append(address)
+    if address2:
+        parts.append(address2)
+    parts.append(f"{city}, {state} {zip_code}")
+    return ", ".join(parts)
+
+def format_package(length, width, height, weight_lbs, weight_oz):
+    dims = f"{length}x{width}x{height} inches"
+    weight = f"{weight_lbs} lb {weight_oz} oz" if weight_lbs > 0 else f"{weight_oz} oz"
+    return f"{dims}, {weight}"
 
 class UserProfile(models.Model):
     """Extended user profile"""
@@ -40,6 +56,18 @@ class SavedAddress(models.Model):
             parts.append(self.address_line2)
         parts.append(f"{self.city}, {self.state} {self.zip_code}")
         return ", ".join(parts)
+    
+    def shipment_fields(self, prefix='from'):
+        """ShipmentRecord field values that apply this address as ship-from (or ship-to)"""
+        return {
+            f'{prefix}_first_name': self.first_name,
+            f'{prefix}_last_name': self.last_name,
+            f'{prefix}_address': self.address_line1,
+            f'{prefix}_address2': self.address_line2,
+            f'{prefix}_city': self.city,
+            f'{prefix}_state': self.state,
+            f'{prefix}_zip': self.zip_code,
+        }
 
 class SavedPackage(models.Model):
     """Saved package presets"""
@@ -65,6 +93,16 @@ class SavedPackage(models.Model):
         if self.weight_lbs > 0:
             return f"{self.weight_lbs} lb {self.weight_oz} oz"
         return f"{self.weight_oz} oz"
+    
+    def shipment_fields(self):
+        """ShipmentRecord field values that apply this package"""
+        return {
+            'length': self.length,
+            'width': self.width,
+            'height': self.height,
+            'weight_lbs': self.weight_lbs,
+            'weight_oz': self.weight_oz,
+        }
 
 class ShipmentRecord(models.Model):
     """Individual shipment record"""
@@ -73,9 +111,20 @@ class ShipmentRecord(models.Model):
         ('processed', 'Processed'),
         ('error', 'Error'),
     ]
+
+    # Result of checking the ship-to city, state and ZIP (see addresses.py)
+    ADDRESS_STATUS_CHOICES = [
+        ('unverified', 'Unverified'),
+        ('valid', 'Valid'),
+        ('corrected', 'Corrected'),
+        ('mismatch', 'City or state does not match ZIP'),
+        ('unknown_zip', 'Unknown ZIP'),
+        ('invalid', 'Invalid'),
+    ]
     
     # User association
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='shipments', default=1)
+    # No separate index: every composite index in Meta leads with user
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='shipments', default=1, db_index=False)
     
     # Ship From
     from_first_name = models.CharField(max_length=100, blank=True)
@@ -94,6 +143,7 @@ class ShipmentRecord(models.Model):
     to_city = models.CharField(max_length=100)
     to_zip = models.CharField(max_length=50)
     to_state = models.CharField(max_length=50)
+    address_status = models.CharField(max_length=20, choices=ADDRESS_STATUS_CHOICES, default='unverified')
     
     # Package Details
     weight_lbs = models.IntegerField(default=0)
@@ -117,11 +167,24 @@ class ShipmentRecord(models.Model):
     # Status
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     
-    # Timestamps
+    # Timestamps; set-based updates must set updated_at themselves
     created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
+        indexes = [
+            # Default list ordering and keyset pages
+            models.Index(fields=['user', '-created_at', '-id'], name='shipment_user_created_idx'),
+            models.Index(fields=['user', 'status'], name='shipment_user_status_idx'),
+            # Changes feed
+            models.Index(fields=['user', 'updated_at'], name='shipment_user_updated_idx'),
+        ]
+        constraints = [
+            # Duplicate detection and upserts on re-uploaded manifests; also
+            # serves order_no lookups
+            models.UniqueConstraint(fields=['user', 'order_no', 'item_sku'], name='shipment_user_order_sku_uniq'),
+        ]
     
     def __str__(self):
         return f"Shipment {self.order_no} - {self.user.username}"
@@ -129,30 +192,124 @@ class ShipmentRecord(models.Model):
     def get_from_address_formatted(self):
         if not self.from_first_name:
             return "Not provided"
-        parts = [f"{self.from_first_name} {self.from_last_name}"]
-        parts.append(self.from_address)
-        if self.from_address2:
-            parts.append(self.from_address2)
-        parts.append(f"{self.from_city}, {self.from_state} {self.from_zip}")
-        return ", ".join(parts)
+        return format_address(
+            self.from_first_name, self.from_last_name, self.from_address, self.from_address2,
+            self.from_city, self.from_state, self.from_zip
+        )
     
     def get_to_address_formatted(self):
-        parts = [f"{self.to_first_name} {self.to_last_name}"]
-        parts.append(self.to_address)
-        if self.to_address2:
-            parts.append(self.to_address2)
-        parts.append(f"{self.to_city}, {self.to_state} {self.to_zip}")
-        return ", ".join(parts)
+        return format_address(
+            self.to_first_name, self.to_last_name, self.to_address, self.to_address2,
+            self.to_city, self.to_state, self.to_zip
+        )
     
     def get_package_details(self):
-        dims = f"{self.length}x{self.width}x{self.height} inches"
-        weight = f"{self.weight_lbs} lb {self.weight_oz} oz" if self.weight_lbs > 0 else f"{self.weight_oz} oz"
-        return f"{dims}, {weight}"
+        return format_package(self.length, self.width, self.height, self.weight_lbs, self.weight_oz)
     
     def calculate_shipping_price(self):
-        """Calculate shipping price based on weight and dimensions"""
-        total_oz = (self.weight_lbs * 16) + self.weight_oz
-        if self.shipping_service == 'priority':
-            return 5.00 + (total_oz * 0.10)
-        else:  # ground
-            return 2.50 + (total_oz * 0.05)
\ No newline at end of file
+        """Calculate shipping price from the active rate table (None if unpriceable)"""
+        return get_rate_engine().quote_one(
+            self.shipping_service, self.weight_lbs, self.weight_oz, self.from_zip, self.to_zip
+        )
+    
+    @staticmethod
+    def shipping_price_expression(service=None, weight_lbs=None, weight_oz=None):
+        """
+        calculate_shipping_price as a database expression, when the rate
+        table allows it; see BaseRateEngine.price_expression
+        """
+        return get_rate_engine().price_expression(service, weight_lbs, weight_oz)
+
+class ShipmentTombstone(models.Model):
+    """
+    A deleted shipment, kept so the changes feed can report the deletion.
+    A tombstone without a record_id stands for all of the user's shipments
+    deleted at once.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='shipment_tombstones', db_index=False)
+    record_id = models.BigIntegerField(null=True, blank=True)
+    deleted_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        ordering = ['deleted_at']
+        indexes = [
+            models.Index(fields=['user', 'deleted_at'], name='tombstone_user_deleted_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Deleted shipment {self.record_id or 'all'} - {self.user.username}"
+
+class ImportJob(models.Model):
+    """Background CSV import and its progress"""
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    MODE_CHOICES = [
+        ('create', 'Create, skipping existing orders'),
+        ('upsert', 'Create or update existing orders'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='import_jobs')
+    file = models.FileField(upload_to='imports/')
+    filename = models.CharField(max_length=255, blank=True)
+    mode = models.CharField(max_length=20, choices=MODE_CHOICES, default='create')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    
+    # Progress, updated after every chunk
+    rows_parsed = models.PositiveIntegerField(default=0)
+    rows_inserted = models.PositiveIntegerField(default=0)
+    rows_updated = models.PositiveIntegerField(default=0)
+    rows_skipped = models.PositiveIntegerField(default=0)
+    # The first row errors (see jobs.MAX_JOB_ERRORS) and how many there were
+    errors = models.JSONField(default=list, blank=True)
+    error_count = models.PositiveIntegerField(default=0)
+    message = models.TextField(blank=True)
+    
+    # Chunked uploads (see uploads.py): declared size, bytes on disk, bytes
+    # imported, when the worker importing them took over, and when the
+    # append being written started
+    upload_size = models.PositiveBigIntegerField(null=True, blank=True)
+    bytes_received = models.PositiveBigIntegerField(default=0)
+    bytes_parsed = models.PositiveBigIntegerField(default=0)
+    parsing_since = models.DateTimeField(null=True, blank=True)
+    appending_since = models.DateTimeField(null=True, blank=True)
+    
+    # Timestamps
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Import {self.filename} - {self.status}"
+
+class Purchase(models.Model):
+    """
+    A completed label purchase. Requests sent with an idempotency key are
+    answered from `response` when retried instead of being charged again.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='purchases')
+    idempotency_key = models.CharField(max_length=255, null=True, blank=True)
+    request_hash = models.CharField(max_length=64)
+    label_format = models.CharField(max_length=20, default='letter')
+    records_processed = models.PositiveIntegerField(default=0)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    response = models.JSONField(default=dict, encoder=JSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'idempotency_key'], name='purchase_user_idempotency_key'),
+        ]
+    
+    def __str__(self):
+        return f"Purchase of {self.records_processed} labels by {self.user.username}"
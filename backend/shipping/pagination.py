@@ -0,0 +1,135 @@
+import base64
+import json
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination over (sort field, id).
+
+    The cursor carries the sort value and id of the last row served, so
+    every page is a bounded index range scan no matter how deep it is.
+    That only holds for sort fields with an index on (filter, field, id),
+    so ordering_fields must list no others. Only forward paging is
+    supported.
+    """
+    page_size = 100
+    max_page_size = 1000
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    ordering_fields = []
+    default_ordering = None
+    invalid_cursor_message = 'Invalid cursor'
+
+    def is_requested(self, request):
+        """Clients opt in by sending a cursor or a page size"""
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_ordering(self, request):
+        """Return (field name, descending) from ?ordering=, e.g. '-created_at'"""
+        ordering = request.query_params.get(self.ordering_query_param) or self.default_ordering
+        field = ordering.lstrip('-')
+        if field not in self.ordering_fields:
+            raise ValidationError({
+                self.ordering_query_param: f'Must be one of {self.ordering_fields}, optionally prefixed with "-"'
+            })
+        return field, ordering.startswith('-')
+
+    def order_queryset(self, queryset, request):
+        field, descending = self.get_ordering(request)
+        prefix = '-' if descending else ''
+        return queryset.order_by(f'{prefix}{field}', f'{prefix}id')
+
+    def keyset_filter(self, field, descending, value, pk):
+        """Rows strictly after (value, pk) in the given ordering"""
+        op = 'lt' if descending else 'gt'
+        return Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'id__{op}': pk})
+
+    def encode_cursor(self, ordering, value, pk):
+        payload = json.dumps({'o': ordering, 'v': value, 'id': pk}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+            return payload['o'], payload['v'], int(payload['id'])
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        field, descending = self.get_ordering(request)
+        self.ordering = f'{"-" if descending else ""}{field}'
+        self.model_field = queryset.model._meta.get_field(field)
+
+        queryset = self.order_queryset(queryset, request)
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            ordering, value, pk = cursor
+            if ordering != self.ordering:
+                raise NotFound(self.invalid_cursor_message)
+            try:
+                value = self.model_field.to_python(value)
+                if value is None:
+                    raise ValueError('Cursor has no sort value')
+                queryset = queryset.filter(self.keyset_filter(field, descending, value, pk))
+            except (DjangoValidationError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+
+        rows = list(queryset[:self.page_size_value + 1])
+        self.has_next = len(rows) > self.page_size_value
+        self.page = rows[:self.page_size_value]
+        return self.page
+
+    def get_next_cursor(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        # Pages may hold model instances or .values() rows
+        if isinstance(last, dict):
+            value, pk = last[self.model_field.name], last['id']
+        else:
+            value, pk = self.model_field.value_from_object(last), last.pk
+        value = value.isoformat() if hasattr(value, 'isoformat') else str(value)
+        return self.encode_cursor(self.ordering, value, pk)
+
+    def get_next_link(self):
+        cursor = self.get_next_cursor()
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'cursor': self.get_next_cursor(),
+            'results': data,
+        })
+
+
+class ShipmentCursorPagination(KeysetPagination):
+    # Served by shipment_user_created_idx in either direction
+    ordering_fields = ['created_at']
+    default_ordering = '-created_at'
@@ -0,0 +1,181 @@
+"""
+Shipping label rendering to PDF.
+
+Kept free of Django imports so label pool workers can import it without
+setting up the app registry. Labels are text and vector lines in the
+standard Helvetica fonts, so pages are written directly as PDF content
+streams and need no PDF library.
+"""
+import os
+import threading
+import zlib
+
+POINTS_PER_INCH = 72
+
+# Page size in points by label format; 'a4' matches the frontend's options
+PAGE_SIZES = {
+    'letter': (612, 792),
+    'a4': (595, 842),
+    '4x6': (288, 432),
+}
+
+LABEL_FORMATS = list(PAGE_SIZES)
+
+# Bump whenever the layout changes so cached pages are not reused
+LAYOUT_VERSION = 1
+
+# 4x6in label area; sheet formats print it in the top left corner
+LABEL_WIDTH = 4 * POINTS_PER_INCH
+LABEL_HEIGHT = 6 * POINTS_PER_INCH
+SHEET_MARGIN = POINTS_PER_INCH / 2
+
+LABEL_FIELDS = [
+    'id', 'order_no', 'shipping_service',
+    'from_first_name', 'from_last_name', 'from_address', 'from_address2',
+    'from_city', 'from_state', 'from_zip',
+    'to_first_name', 'to_last_name', 'to_address', 'to_address2',
+    'to_city', 'to_state', 'to_zip',
+    'weight_lbs', 'weight_oz', 'length', 'width', 'height',
+]
+
+
+def pdf_string(text):
+    """A PDF literal string in WinAnsiEncoding"""
+    data = str(text).encode('cp1252', errors='replace')
+    data = data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+    return b'(' + data.replace(b'\r', b' ').replace(b'\n', b' ') + b')'
+
+def address_lines(label, prefix):
+    lines = [
+        f"{label[f'{prefix}_first_name']} {label[f'{prefix}_last_name']}".strip(),
+        label[f'{prefix}_address'],
+        label[f'{prefix}_address2'],
+        f"{label[f'{prefix}_city']}, {label[f'{prefix}_state']} {label[f'{prefix}_zip']}",
+    ]
+    return [line for line in lines if line and line.strip(', ')]
+
+def label_content(label, label_format):
+    """Uncompressed content stream drawing one label"""
+    page_width, page_height = PAGE_SIZES[label_format]
+    if label_format == '4x6':
+        left, bottom = 0, 0
+    else:
+        left, bottom = SHEET_MARGIN, page_height - SHEET_MARGIN - LABEL_HEIGHT
+    right = left + LABEL_WIDTH
+    top = bottom + LABEL_HEIGHT
+    ops = []
+
+    def text(x, y, size, value, bold=False):
+        font = b'/F2' if bold else b'/F1'
+        ops.append(b'BT %s %d Tf %.1f %.1f Td %s Tj ET' % (font, size, x, y, pdf_string(value)))
+
+    def rule(y):
+        ops.append(b'%.1f %.1f m %.1f %.1f l S' % (left + 9, y, right - 9, y))
+
+    ops.append(b'1 w %.1f %.1f %.1f %.1f re S' % (left + 6, bottom + 6, LABEL_WIDTH - 12, LABEL_HEIGHT - 12))
+
+    y = top - 24
+    text(left + 14, y, 7, 'FROM:', bold=True)
+    for line in address_lines(label, 'from') or ['Not provided']:
+        y -= 10
+        text(left + 14, y, 8, line)
+
+    service = (label['shipping_service'] or 'ground').upper()
+    ops.append(b'%.1f %.1f %.1f %.1f re f' % (right - 110, top - 46, 96, 28))
+    ops.append(b'1 g')
+    text(right - 102, top - 37, 13, service, bold=True)
+    ops.append(b'0 g')
+
+    y = top - 104
+    rule(y + 14)
+    text(left + 14, y, 9, 'SHIP TO:', bold=True)
+    for i, line in enumerate(address_lines(label, 'to')):
+        y -= 18
+        text(left + 24, y, 13, line, bold=i == 0)
+
+    y = bottom + 96
+    rule(y + 14)
+    weight = f"{label['weight_lbs']} lb {label['weight_oz']} oz" if label['weight_lbs'] else f"{label['weight_oz']} oz"
+    text(left + 14, y, 9, f"Weight: {weight}")
+    text(left + 14, y - 13, 9, f"Dimensions: {label['length']}x{label['width']}x{label['height']} in")
+    text(left + 14, y - 26, 9, f"Order: {label['order_no']}", bold=True)
+    text(left + 14, y - 52, 7, f"Ref #{label['id']}")
+    return b'\n'.join(ops)
+
+def render_page(label, label_format):
+    """Compressed content stream for one label"""
+    return zlib.compress(label_content(label, label_format), 6)
+
+def render_pages(jobs, label_format):
+    """
+    Render (path, label) jobs and write each page atomically to its path.
+    Runs in label pool worker processes; returns the number written.
+    """
+    directories = set()
+    for path, label in jobs:
+        directory = os.path.dirname(path)
+        if directory not in directories:
+            os.makedirs(directory, exist_ok=True)
+            directories.add(directory)
+        # Unique per thread: a download and a warmup may render the same page at once
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as file:
+            file.write(render_page(label, label_format))
+        os.replace(tmp, path)
+    return len(jobs)
+
+
+def iter_pdf(pages, count, label_format):
+    """
+    Yield a PDF document of `count` pages from an iterable of compressed
+    content streams, one write per page so memory stays flat.
+    """
+    width, height = PAGE_SIZES[label_format]
+    offsets = []
+    position = 0
+
+    def chunk(*objects):
+        nonlocal position
+        out = []
+        for number, body in objects:
+            offsets.append(position + sum(len(part) for part in out))
+            out.append(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+        data = b''.join(out)
+        position += len(data)
+        return data
+
+    header = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+    position = len(header)
+    # Objects 1-4 are the catalog, page tree and fonts; page i is object
+    # 5 + 2i and its content stream 6 + 2i
+    kids = b' '.join(b'%d 0 R' % (5 + 2 * i) for i in range(count))
+    yield header + chunk(
+        (1, b'<< /Type /Catalog /Pages 2 0 R >>'),
+        (2, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, count)),
+        (3, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>'),
+        (4, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>'),
+    )
+
+    page = (
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] '
+        b'/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %%d 0 R >>' % (width, height)
+    )
+    written = 0
+    for i, stream in enumerate(pages):
+        yield chunk(
+            (5 + 2 * i, page % (6 + 2 * i)),
+            (6 + 2 * i, b'<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream' % (len(stream), stream)),
+        )
+        written += 1
+    if written != count:
+        raise ValueError(f'Expected {count} pages, got {written}')
+
+    size = len(offsets) + 1
+    xref = [b'xref\n0 %d\n0000000000 65535 f \n' % size]
+    xref.extend(b'%010d 00000 n \n' % offset for offset in offsets)
+    yield b''.join(xref) + b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (size, position)
+
+def pdf_document(pages, label_format):
+    """A whole PDF document as bytes"""
+    pages = list(pages)
+    return b''.join(iter_pdf(pages, len(pages), label_format))
@@ -0,0 +1,66 @@
+"""
+Per-user read-through cache for saved address and package presets.
+
+Each user has a version counter per preset kind; cached lists are keyed
+by it and it doubles as the list's ETag. Writes bump the counter, which
+orphans the cached list instead of having to find and delete it.
+
+Only a cache shared by every worker process is used: with a per-process
+one, a write would leave the other workers serving the old list and ETag.
+"""
+import time
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+
+def version_key(kind, user_id):
+    return f'shipping:{kind}:version:{user_id}'
+
+def shared_cache():
+    """Whether the default cache is shared between worker processes"""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+def preset_version(kind, user_id):
+    """The current version, starting a counter if there is none; None without a shared cache"""
+    if not shared_cache():
+        return None
+    key = version_key(kind, user_id)
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock so a counter lost to eviction or a restart
+        # never hands out an ETag a client saw before
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+def bump_preset_version(kind, user_id):
+    """Invalidate the user's cached list once the current transaction commits"""
+    key = version_key(kind, user_id)
+
+    def bump():
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+    transaction.on_commit(bump)
+
+def preset_etag(kind, version):
+    return f'"{kind}-{version}"'
+
+def cached_presets(kind, user_id, build):
+    """
+    (version, data) for the user's list, calling `build` to produce the
+    data on a miss. The version is None when nothing can be cached.
+    """
+    version = preset_version(kind, user_id)
+    if version is None:
+        return None, build()
+    key = f'shipping:{kind}:{user_id}:{version}'
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, settings.PRESET_CACHE_TTL)
+    return version, data
@@ -0,0 +1,109 @@
+import hashlib
+import json
+from decimal import Decimal
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from .bulk import update_returning
+from .models import Purchase, ShipmentRecord, UserProfile
+
+
+class PurchaseError(Exception):
+    """A refused purchase; `data` and `status` make up the error response"""
+
+    def __init__(self, data, status):
+        super().__init__(data['error'])
+        self.data = data
+        self.status = status
+
+
+def request_hash(record_ids, label_format, lookups=None):
+    """Fingerprint of a purchase request, to catch reused idempotency keys"""
+    if lookups is not None:
+        payload = json.dumps([{'filter': lookups}, label_format], sort_keys=True)
+    else:
+        payload = json.dumps([sorted(set(record_ids)), label_format])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def purchase_records(user, record_ids, label_format='letter', idempotency_key=None, lookups=None):
+    """
+    Charge `user` for their pending records among `record_ids`, or
+    matching the filter `lookups` instead, and mark them processed, in one
+    transaction. Returns (response data, replayed).
+
+    Records are locked in id order, then claimed with a conditional UPDATE
+    (status='pending') that also returns their prices, and the balance is debited with a
+    conditional F() UPDATE, so concurrent purchases can neither charge a
+    record twice nor overdraw the account. A retried request with the same
+    idempotency key gets the stored response back instead of a new charge.
+    """
+    fingerprint = request_hash(record_ids, label_format, lookups)
+    purchase = Purchase(
+        user=user, idempotency_key=idempotency_key,
+        request_hash=fingerprint, label_format=label_format
+    )
+
+    with transaction.atomic():
+        if idempotency_key:
+            # The unique key is taken before any work is done; a concurrent
+            # request with the same key waits here until this one finishes
+            try:
+                with transaction.atomic():
+                    purchase.save()
+            except IntegrityError:
+                existing = Purchase.objects.get(user=user, idempotency_key=idempotency_key)
+                if existing.request_hash != fingerprint:
+                    raise PurchaseError(
+                        {'error': 'Idempotency key was already used for a different purchase'}, 422
+                    )
+                return existing.response, True
+
+        records = ShipmentRecord.objects.filter(user=user)
+        if lookups is not None:
+            # A filter only ever selects pending records
+            records = records.filter(**lookups).filter(status='pending')
+        else:
+            records = records.filter(id__in=record_ids)
+        # Lock the selection in id order first: purchases whose selections
+        # overlap then queue up behind each other instead of deadlocking
+        # on rows the UPDATE would lock in whatever order it scans them
+        selected = len(records.select_for_update().order_by('id').values_list('id', flat=True))
+        claimed = list(update_returning(
+            records.filter(status='pending'),
+            {'status': 'processed', 'updated_at': timezone.now()},
+            fields=['id', 'shipping_price']
+        ))
+        if not claimed:
+            raise PurchaseError({'error': 'No pending records found'}, 404)
+        total = sum((row['shipping_price'] for row in claimed), Decimal('0.00'))
+
+        debited = list(update_returning(
+            UserProfile.objects.filter(user=user, account_balance__gte=total),
+            {'account_balance': F('account_balance') - total},
+            fields=['account_balance']
+        ))
+        if not debited:
+            available = UserProfile.objects.filter(user=user).values_list('account_balance', flat=True).first()
+            raise PurchaseError({
+                'error': 'Insufficient balance',
+                'required': total,
+                'available': available if available is not None else Decimal('0.00'),
+            }, 400)
+
+        processed_ids = sorted(row['id'] for row in claimed)
+        data = {
+            'message': f'Successfully purchased {len(claimed)} labels',
+            'total': total,
+            'label_format': label_format,
+            'records_processed': len(claimed),
+            # The user's selected records that were no longer pending
+            'records_skipped': selected - len(claimed),
+            'record_ids': processed_ids,
+            'new_balance': debited[0]['account_balance'],
+        }
+        purchase.records_processed = len(claimed)
+        purchase.total = total
+        purchase.response = data
+        purchase.save()
+
+    return data, False
@@ -0,0 +1,278 @@
+import threading
+from decimal import Decimal
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import models
+from django.db.models import Case, ExpressionWrapper, F, Q, Value, When
+from django.db.models.lookups import GreaterThanOrEqual, LessThanOrEqual
+from django.utils.module_loading import import_string
+
+ZONES = 8
+MAX_WEIGHT_OZ = 70 * 16
+
+# Heaviest shipment an open-ended table prices (10,000 lb)
+OPEN_ENDED_MAX_WEIGHT_OZ = 10000 * 16
+
+# Origin used for zoning when a shipment has no ship-from ZIP (San Dimas)
+DEFAULT_ORIGIN_ZIP = '91773'
+
+
+def ounce_brackets(max_oz=MAX_WEIGHT_OZ):
+    """One bracket per ounce, starting at 0 oz"""
+    return list(range(0, max_oz + 1))
+
+def retail_brackets(max_oz=MAX_WEIGHT_OZ):
+    """4 oz steps up to a pound, then one bracket per pound"""
+    return [4, 8, 12] + list(range(16, max_oz + 1, 16))
+
+
+# Versioned rate tables. Prices are integer cents: a shipment is priced at
+# the top of the first bracket (upper bound, in ounces) its weight fits in,
+# as base[zone] + per_oz[zone] * bracket. Weights above the last bracket
+# have no rate, unless the table is open-ended: then they are priced at
+# their own weight, up to OPEN_ENDED_MAX_WEIGHT_OZ. Negative pounds or
+# ounces never have a rate. Services not listed price as ground.
+RATE_TABLES = {
+    # The original linear formulas, identical in every zone and for any weight
+    '2026-02': {
+        'brackets': ounce_brackets(),
+        'open_ended': True,
+        'services': {
+            'ground': {'base': [250] * ZONES, 'per_oz': [5] * ZONES},
+            'priority': {'base': [500] * ZONES, 'per_oz': [10] * ZONES},
+        },
+    },
+    # Zoned retail brackets
+    '2026-10': {
+        'brackets': retail_brackets(),
+        'services': {
+            'ground': {
+                'base': [250, 265, 280, 300, 325, 350, 380, 410],
+                'per_oz': [5, 5, 5, 6, 6, 7, 7, 8],
+            },
+            'priority': {
+                'base': [500, 520, 545, 575, 610, 650, 700, 760],
+                'per_oz': [10, 10, 11, 11, 12, 13, 14, 15],
+            },
+        },
+    },
+}
+
+
+class RateTable:
+    """A rate table materialized into a (service, bracket, zone) array of cents"""
+
+    def __init__(self, version, spec):
+        self.version = version
+        self.services = list(spec['services'])
+        self.service_index = {name: i for i, name in enumerate(self.services)}
+        self.brackets = np.asarray(spec['brackets'], dtype=np.int32)
+        self.open_ended = spec.get('open_ended', False)
+
+        base = np.array([spec['services'][name]['base'] for name in self.services], dtype=np.int32)
+        per_oz = np.array([spec['services'][name]['per_oz'] for name in self.services], dtype=np.int32)
+        self.base = base.astype(np.int64)
+        self.per_oz = per_oz.astype(np.int64)
+        self.cents = base[:, None, :] + per_oz[:, None, :] * self.brackets[None, :, None]
+
+        # Services whose price is base + per_oz * weight everywhere can be
+        # priced by the database as well
+        contiguous = np.array_equal(self.brackets, np.arange(len(self.brackets)))
+        self.linear = {}
+        for i, name in enumerate(self.services):
+            if contiguous and (base[i] == base[i, 0]).all() and (per_oz[i] == per_oz[i, 0]).all():
+                self.linear[name] = (int(base[i, 0]), int(per_oz[i, 0]))
+
+    @property
+    def max_weight_oz(self):
+        """Heaviest weight with a rate"""
+        return OPEN_ENDED_MAX_WEIGHT_OZ if self.open_ended else int(self.brackets[-1])
+
+    def lookup(self, services, total_oz, zones):
+        """Return (cents, valid) arrays; weights outside the table are invalid"""
+        fallback = self.service_index.get('ground', 0)
+        service_idx = np.fromiter(
+            (self.service_index.get(name, fallback) for name in services),
+            dtype=np.intp, count=len(total_oz)
+        )
+        total_oz = np.asarray(total_oz, dtype=np.int64)
+        zone_idx = np.asarray(zones) - 1
+        over = total_oz > self.brackets[-1]
+        valid = (total_oz >= 0) & (total_oz <= self.max_weight_oz)
+        bracket_idx = np.searchsorted(self.brackets, np.where(valid & ~over, total_oz, 0), side='left')
+        cents = self.cents[service_idx, bracket_idx, zone_idx].astype(np.int64)
+        if self.open_ended and over.any():
+            beyond = self.base[service_idx, zone_idx] + self.per_oz[service_idx, zone_idx] * total_oz
+            cents = np.where(over, beyond, cents)
+        return cents, valid
+
+
+def zip_prefixes(zips, default):
+    """Leading three digits of each ZIP as ints; anything else uses `default`"""
+    heads = pd.Series(list(zips), dtype=object).fillna('').astype(str).str.strip().str.slice(0, 3)
+    numbers = pd.to_numeric(heads.where(heads.str.fullmatch(r'\d{3}')), errors='coerce')
+    return numbers.fillna(default).to_numpy(dtype=np.int32)
+
+def zones_for(from_zips, to_zips, origin_zip=None):
+    """
+    USPS-style zones 1-8 approximated from ZIP prefixes: same 3-digit
+    prefix is zone 1, same 2-digit prefix zone 2, otherwise 3 plus the
+    distance between the national areas (first digit), capped at 8.
+    """
+    origin = int((origin_zip or DEFAULT_ORIGIN_ZIP)[:3])
+    source = zip_prefixes(from_zips, origin)
+    dest = zip_prefixes(to_zips, origin)
+    zones = np.minimum(3 + np.abs(source // 100 - dest // 100), ZONES)
+    zones = np.where(source // 10 == dest // 10, 2, zones)
+    zones = np.where(source == dest, 1, zones)
+    return zones.astype(np.int32)
+
+# Largest batch accepted by the quote endpoint
+MAX_QUOTE_BATCH = 10000
+
+QUOTE_FIELDS = ['shipping_service', 'weight_lbs', 'weight_oz', 'from_zip', 'to_zip']
+
+
+def cents_to_decimal(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+class BaseRateEngine:
+    """
+    Interface for SHIPPING_RATE_ENGINE implementations.
+
+    `quote` prices a whole batch at once and returns numpy arrays of
+    (cents, zones, valid) aligned with its inputs.
+    """
+    version = None
+    services = ()
+
+    def quote(self, services, weight_lbs, weight_oz, from_zips, to_zips):
+        raise NotImplementedError
+
+    def price_expression(self, service=None, weight_lbs=None, weight_oz=None):
+        """
+        Database expression pricing `service` (each row's own when None)
+        from the weight columns, or from the given weights; None if the
+        database cannot price it.
+        """
+        return None
+
+    def quote_one(self, service, weight_lbs, weight_oz, from_zip='', to_zip=''):
+        """Decimal price for a single shipment, or None if it cannot be priced"""
+        cents, _, valid = self.quote([service], [weight_lbs], [weight_oz], [from_zip], [to_zip])
+        return cents_to_decimal(cents[0]) if valid[0] else None
+
+
+class TableRateEngine(BaseRateEngine):
+    """Prices from one of RATE_TABLES (SHIPPING_RATE_TABLE by default)"""
+
+    def __init__(self, version=None, origin_zip=None):
+        self.version = version or getattr(settings, 'SHIPPING_RATE_TABLE', '2026-02')
+        self.origin_zip = origin_zip or getattr(settings, 'SHIPPING_ORIGIN_ZIP', DEFAULT_ORIGIN_ZIP)
+        self.table = RateTable(self.version, RATE_TABLES[self.version])
+        self.services = tuple(self.table.services)
+
+    def quote(self, services, weight_lbs, weight_oz, from_zips, to_zips):
+        weight_lbs = np.asarray(weight_lbs, dtype=np.int64)
+        weight_oz = np.asarray(weight_oz, dtype=np.int64)
+        zones = zones_for(from_zips, to_zips, self.origin_zip)
+        cents, valid = self.table.lookup(services, weight_lbs * 16 + weight_oz, zones)
+        return cents, zones, valid & (weight_lbs >= 0) & (weight_oz >= 0)
+
+    def price_expression(self, service=None, weight_lbs=None, weight_oz=None):
+        lbs = F('weight_lbs') if weight_lbs is None else Value(weight_lbs)
+        oz = F('weight_oz') if weight_oz is None else Value(weight_oz)
+        total_oz = lbs * 16 + oz
+        # The weights quote() accepts; other rows keep their price, as in reprice_rows
+        priceable = Q(
+            GreaterThanOrEqual(lbs, 0), GreaterThanOrEqual(oz, 0),
+            LessThanOrEqual(total_oz, self.table.max_weight_oz),
+        )
+
+        def price(name):
+            linear = self.table.linear.get(name)
+            if linear is None:
+                return None
+            base, per_oz = linear
+            output_field = models.DecimalField(max_digits=10, decimal_places=2)
+            return Case(
+                When(priceable, then=ExpressionWrapper(
+                    Value(cents_to_decimal(base)) + total_oz * Value(cents_to_decimal(per_oz)),
+                    output_field=output_field
+                )),
+                default=F('shipping_price'),
+                output_field=output_field
+            )
+
+        if service is not None:
+            return price(service if service in self.table.service_index else 'ground')
+
+        # Each row's own service; anything not in the table prices as ground,
+        # as in RateTable.lookup
+        prices = {name: price(name) for name in self.services}
+        if None in prices.values():
+            return None
+        fallback = 'ground' if 'ground' in prices else self.services[0]
+        return Case(
+            *[When(shipping_service=name, then=expression) for name, expression in prices.items() if name != fallback],
+            default=prices[fallback],
+            output_field=models.DecimalField(max_digits=10, decimal_places=2)
+        )
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_rate_engine():
+    """Process-wide rate engine, built (and its table loaded) on first use"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            path = getattr(settings, 'SHIPPING_RATE_ENGINE', 'shipping.rates.TableRateEngine')
+            _engine = import_string(path)()
+    return _engine
+
+def quote_shipments(shipments, engine=None):
+    """
+    Quote a list of {shipping_service, weight_lbs, weight_oz, from_zip,
+    to_zip} dicts in one engine call. Returns one {'price', 'zone'} or
+    {'error'} dict per shipment, in input order.
+    """
+    engine = engine or get_rate_engine()
+    frame = pd.DataFrame.from_records(shipments, columns=QUOTE_FIELDS)
+    services = frame['shipping_service'].fillna('ground').astype(str)
+    # Missing weights count as 0, like the model defaults; anything else
+    # that is not a number is an error
+    weights = []
+    bad_weight = np.zeros(len(frame), dtype=bool)
+    # Non-finite, negative or absurd weights have no rate; they are zeroed
+    # before the integer cast, which would wrap them around
+    unpriceable = np.zeros(len(frame), dtype=bool)
+    for field in ('weight_lbs', 'weight_oz'):
+        values = pd.to_numeric(frame[field], errors='coerce')
+        bad_weight |= (values.isna() & frame[field].notna()).to_numpy()
+        values = values.fillna(0).to_numpy(dtype='float64')
+        out_of_range = ~np.isfinite(values) | (values < 0) | (values > OPEN_ENDED_MAX_WEIGHT_OZ)
+        unpriceable |= out_of_range
+        weights.append(np.trunc(np.where(out_of_range, 0, values)).astype(np.int64))
+
+    cents, zones, valid = engine.quote(
+        services.tolist(), *weights,
+        frame['from_zip'].fillna('').tolist(), frame['to_zip'].fillna('').tolist()
+    )
+    valid = valid & ~unpriceable
+
+    quotes = []
+    for i, service in enumerate(services):
+        if engine.services and service not in engine.services:
+            quotes.append({'error': f'Unknown shipping_service: {service}'})
+        elif bad_weight[i]:
+            quotes.append({'error': 'weight_lbs and weight_oz must be numbers'})
+        elif not valid[i]:
+            quotes.append({'error': 'No rate for this weight'})
+        else:
+            quotes.append({'price': f'{cents_to_decimal(cents[i]):f}', 'zone': int(zones[i])})
+    return quotes
@@ -0,0 +1,70 @@
+"""
+Read replica routing.
+
+Views decorated with replica_reads() read from READ_REPLICA_DATABASE, when
+one is configured; everything else, and every write, stays on the
+primary. Only read-only views whose clients tolerate replication lag are
+decorated: a replica read right after a write may not see it yet. The
+changes feed is not, since a sync token must never skip a committed change.
+"""
+import contextvars
+import functools
+from django.conf import settings
+
+_replica_reads = contextvars.ContextVar('shipping_replica_reads', default=False)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get():
+            return settings.READ_REPLICA_DATABASE
+        return None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        replica = settings.READ_REPLICA_DATABASE
+        if replica and {obj1._state.db, obj2._state.db} <= {'default', replica}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == settings.READ_REPLICA_DATABASE:
+            return False
+        return None
+
+
+def iter_replica_reads(content):
+    """Pass a streamed body through, reading from the replica while each chunk is produced"""
+    iterator = iter(content)
+    while True:
+        token = _replica_reads.set(True)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _replica_reads.reset(token)
+        yield chunk
+
+def replica_reads(view):
+    """
+    Route the view's reads to the replica, including the queries a
+    streaming response runs after the view has returned. Goes beneath
+    @api_view so authentication still reads from the primary.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not settings.READ_REPLICA_DATABASE:
+            return view(*args, **kwargs)
+        token = _replica_reads.set(True)
+        try:
+            response = view(*args, **kwargs)
+        finally:
+            _replica_reads.reset(token)
+        if response.streaming:
+            response.streaming_content = iter_replica_reads(response.streaming_content)
+        return response
+    return wrapper
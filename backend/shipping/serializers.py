@@ -1,7 +1,12 @@
+import decimal
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
-from .models import SavedAddress, SavedPackage, ShipmentRecord, UserProfile
+from django.utils import timezone
+from .models import (
+    SavedAddress, SavedPackage, ShipmentRecord, UserProfile, ImportJob,
+    format_address, format_package
+)
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -60,7 +65,7 @@ class ShipmentRecordSerializer(serializers.ModelSerializer):
     class Meta:
         model = ShipmentRecord
         fields = '__all__'
-        read_only_fields = ['user', 'created_at', 'updated_at']
+        read_only_fields = ['user', 'address_status', 'created_at', 'updated_at']
     
     def get_from_address_formatted(self, obj):
         return obj.get_from_address_formatted()
@@ -71,8 +76,96 @@ class ShipmentRecordSerializer(serializers.ModelSerializer):
     def get_package_details(self, obj):
         return obj.get_package_details()
 
+class ShipmentRecordListSerializer(serializers.BaseSerializer):
+    """
+    Read-only fast path for list endpoints.
+
+    Works on `.values()` rows (use `rows()` to build them) and produces the
+    same output as ShipmentRecordSerializer without going through DRF's
+    per-field machinery.
+    """
+    computed_fields = ['from_address_formatted', 'to_address_formatted', 'package_details']
+
+    @classmethod
+    def rows(cls, queryset):
+        """Values queryset with every column the serializer reads"""
+        return queryset.values(*[
+            field.name for field in ShipmentRecord._meta.concrete_fields
+        ])
+
+    def get_converters(self):
+        """
+        Returns (output names, value converters, computed fields); names are
+        in ShipmentRecordSerializer output order.
+        """
+        if getattr(self, '_converters', None) is None:
+            names = []
+            converters = []
+            computed = []
+            for name, field in ShipmentRecordSerializer().fields.items():
+                names.append(name)
+                if name in self.computed_fields:
+                    computed.append((name, getattr(self, f'get_{name}')))
+                elif isinstance(field, serializers.DecimalField):
+                    converters.append((name, self.decimal_converter(field)))
+                elif isinstance(field, serializers.DateTimeField):
+                    converters.append((name, self.datetime_converter(field)))
+            self._converters = names, converters, computed
+        return self._converters
+
+    def decimal_converter(self, field):
+        exponent = decimal.Decimal(1).scaleb(-field.decimal_places)
+
+        def convert(value):
+            return f'{value.quantize(exponent):f}'
+        return convert
+
+    def datetime_converter(self, field):
+        tz = field.default_timezone()
+
+        def convert(value):
+            if tz is None or timezone.is_naive(value):
+                return field.to_representation(value)
+            value = value.astimezone(tz).isoformat()
+            if value.endswith('+00:00'):
+                value = value[:-6] + 'Z'
+            return value
+        return convert
+
+    def to_representation(self, row):
+        names, converters, computed = self.get_converters()
+        # Placeholders keep every key in output order; values are filled below
+        data = {name: row.get(name) for name in names}
+        for name, convert in converters:
+            if data[name] is not None:
+                data[name] = convert(data[name])
+        for name, compute in computed:
+            data[name] = compute(row)
+        return data
+
+    def get_from_address_formatted(self, row):
+        if not row['from_first_name']:
+            return "Not provided"
+        return format_address(
+            row['from_first_name'], row['from_last_name'], row['from_address'], row['from_address2'],
+            row['from_city'], row['from_state'], row['from_zip']
+        )
+
+    def get_to_address_formatted(self, row):
+        return format_address(
+            row['to_first_name'], row['to_last_name'], row['to_address'], row['to_address2'],
+            row['to_city'], row['to_state'], row['to_zip']
+        )
+
+    def get_package_details(self, row):
+        return format_package(
+            row['length'], row['width'], row['height'], row['weight_lbs'], row['weight_oz']
+        )
+
 class BulkShipmentUpdateSerializer(serializers.Serializer):
-    record_ids = serializers.ListField(child=serializers.IntegerField())
+    # Either record_ids or filter; see filters.select_shipments
+    record_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    filter = serializers.DictField(required=False)
     
     # Ship From fields (optional)
     from_first_name = serializers.CharField(required=False, allow_blank=True)
@@ -93,4 +186,15 @@ class BulkShipmentUpdateSerializer(serializers.Serializer):
     # Shipping service (optional)
     shipping_service = serializers.CharField(required=False, allow_blank=True)
     status = serializers.CharField(required=False)
-    shipping_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
\ No newline at end of file
+    shipping_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ImportJob
+        fields = [
+            'id', 'filename', 'mode', 'status', 'rows_parsed', 'rows_inserted',
+            'rows_updated', 'rows_skipped', 'errors', 'error_count', 'message',
+            'upload_size', 'bytes_received', 'bytes_parsed',
+            'created_at', 'started_at', 'finished_at',
+        ]
+        read_only_fields = fields
@@ -0,0 +1,99 @@
+from collections.abc import Iterator
+from django.db.models import QuerySet
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+from .metrics import record_rows
+from .serializers import ShipmentRecordListSerializer
+
+# Rows fetched per server-side cursor round-trip and rendered per write
+STREAM_CHUNK_SIZE = 2000
+
+# Placeholder for the streamed array inside an envelope
+RECORDS = object()
+
+
+class ZipSink:
+    """
+    Write-only buffer for zipfile. It has no tell(), so zipfile treats it
+    as an unseekable stream and writes entries strictly in order; call
+    drain() to take what has been written so far.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def iter_json_array(rows, serializer, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Yield a JSON array of serialized rows a batch at a time.
+
+    Pass a lazy iterable (e.g. `.iterator()`) so only one batch is held in
+    memory; the bytes match what JSONRenderer would produce for the whole
+    list.
+    """
+    renderer = JSONRenderer()
+    yield b'['
+    first = True
+    batch = []
+    for row in rows:
+        batch.append(serializer.to_representation(row))
+        if len(batch) >= chunk_size:
+            record_rows(len(batch), 'serialized')
+            yield (b'' if first else b',') + renderer.render(batch)[1:-1]
+            first = False
+            batch = []
+    if batch:
+        record_rows(len(batch), 'serialized')
+        yield (b'' if first else b',') + renderer.render(batch)[1:-1]
+    yield b']'
+
+def iter_json_object(items, renderer):
+    """Yield a JSON object whose values may themselves be byte iterators"""
+    yield b'{'
+    for i, (key, value) in enumerate(items):
+        yield (b',' if i else b'') + renderer.render(key) + b':'
+        if isinstance(value, Iterator):
+            yield from value
+        elif value is None:
+            yield b'null'
+        else:
+            yield renderer.render(value)
+    yield b'}'
+
+def streaming_shipments_response(shipments, envelope=None, status=200):
+    """
+    Stream a ShipmentRecord queryset, or an iterable of `.values()` rows,
+    as a JSON array.
+
+    With `envelope`, a list of (key, value) pairs, the body is a JSON object
+    instead and the array is written where the value is RECORDS, e.g.
+    [('message', ...), ('records', RECORDS), ('errors', [...])].
+    """
+    renderer = JSONRenderer()
+    if isinstance(shipments, QuerySet):
+        rows = ShipmentRecordListSerializer.rows(shipments).iterator(chunk_size=STREAM_CHUNK_SIZE)
+    else:
+        rows = shipments
+    records = iter_json_array(rows, ShipmentRecordListSerializer())
+
+    if envelope is None:
+        body = records
+    else:
+        body = iter_json_object(
+            [(key, records if value is RECORDS else value) for key, value in envelope],
+            renderer
+        )
+
+    return StreamingHttpResponse(body, content_type='application/json', status=status)
@@ -0,0 +1,50 @@
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Sum
+from .models import ShipmentRecord, UserProfile
+
+
+def summary_key(user_id):
+    return f'shipping:summary:{user_id}'
+
+def build_summary(user):
+    """Counts and totals by status in one grouped aggregate, plus the balance"""
+    counts = {value: 0 for value, _ in ShipmentRecord.STATUS_CHOICES}
+    totals = {value: Decimal('0.00') for value, _ in ShipmentRecord.STATUS_CHOICES}
+    groups = (
+        ShipmentRecord.objects.filter(user=user)
+        .order_by()
+        .values('status')
+        .annotate(count=Count('id'), total=Sum('shipping_price'))
+    )
+    for group in groups:
+        counts[group['status']] = group['count']
+        totals[group['status']] = group['total'] or Decimal('0.00')
+
+    balance = UserProfile.objects.filter(user=user).values_list('account_balance', flat=True).first()
+    return {
+        'total_shipments': sum(counts.values()),
+        'status_counts': counts,
+        'pending_cost': f'{totals["pending"]:.2f}',
+        'purchased_cost': f'{totals["processed"]:.2f}',
+        'account_balance': f'{balance:.2f}' if balance is not None else None,
+    }
+
+def shipment_summary(user):
+    """The user's summary from the cache, computed on a miss"""
+    key = summary_key(user.pk)
+    summary = cache.get(key)
+    if summary is None:
+        summary = build_summary(user)
+        cache.set(key, summary, settings.SHIPMENT_SUMMARY_TTL)
+    return summary
+
+def invalidate_summary(user):
+    """
+    Drop the cached summary once the current transaction commits, so a
+    request reading in between cannot cache the old numbers again.
+    """
+    key = summary_key(user.pk)
+    transaction.on_commit(lambda: cache.delete(key))
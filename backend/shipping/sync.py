@@ -0,0 +1,99 @@
+"""
+Incremental sync for shipment lists.
+
+A client keeps the token from its last sync and asks for what changed
+since: records whose updated_at is newer, plus the ids of records deleted
+since, from their tombstones. Without a token, or when the changes cannot
+be reconstructed, the answer is a reset: the full list, replacing
+whatever the client holds.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .bulk import delete_returning
+from .models import ShipmentRecord, ShipmentTombstone
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def encode_token(moment):
+    """Sync token for a point in time: microseconds since the epoch"""
+    return str((moment - _EPOCH) // _MICROSECOND)
+
+def decode_token(token):
+    """Point in time for a sync token; raises ValueError if malformed"""
+    microseconds = int(token)
+    if microseconds < 0:
+        raise ValueError(token)
+    return _EPOCH + microseconds * _MICROSECOND
+
+
+def record_deletions(user, record_ids=None):
+    """
+    Tombstone deleted records, or all of the user's records when
+    `record_ids` is None, and drop tombstones the feed no longer needs.
+    """
+    now = timezone.now()
+    tombstones = ShipmentTombstone.objects.filter(user=user)
+    if record_ids is None:
+        # Earlier tombstones are implied by the reset
+        tombstones.delete()
+        ShipmentTombstone.objects.create(user=user, deleted_at=now)
+        return
+    tombstones.filter(deleted_at__lt=now - timedelta(days=settings.SHIPMENT_TOMBSTONE_DAYS)).delete()
+    ShipmentTombstone.objects.bulk_create(
+        [ShipmentTombstone(user=user, record_id=pk, deleted_at=now) for pk in record_ids],
+        batch_size=5000
+    )
+
+def delete_shipments(user, records):
+    """Delete a queryset of the user's shipments, leaving tombstones; returns the count"""
+    with transaction.atomic():
+        ids = delete_returning(records.filter(user=user))
+        if ids:
+            record_deletions(user, ids)
+    return len(ids)
+
+def clear_shipments(user):
+    """Delete every shipment of the user with a single reset tombstone; returns the count"""
+    with transaction.atomic():
+        count, _ = ShipmentRecord.objects.filter(user=user).delete()
+        if count:
+            record_deletions(user)
+    return count
+
+
+def shipment_changes(user, since=None):
+    """
+    Changes to the user's shipments after `since` (a datetime, or None
+    for everything). Returns (token, reset, deleted_ids, records) where
+    `records` is a queryset of the current rows to upsert.
+
+    Writes are stamped before their transaction commits, so the next token
+    trails the clock by SHIPMENT_SYNC_OVERLAP seconds: rows committed
+    within that window are sent again rather than missed. Writes must
+    commit within the overlap of stamping their rows; long transactions
+    such as import_manifest() stamp them again right before committing.
+    """
+    now = timezone.now()
+    records = ShipmentRecord.objects.filter(user=user)
+    tombstones = ShipmentTombstone.objects.filter(user=user)
+
+    horizon = now - timedelta(seconds=settings.SHIPMENT_SYNC_OVERLAP)
+    token = encode_token(max(horizon, since) if since is not None else horizon)
+
+    # Tokens older than the tombstone retention may have lost deletions
+    reset = (
+        since is None
+        or since < now - timedelta(days=settings.SHIPMENT_TOMBSTONE_DAYS)
+        or tombstones.filter(record_id__isnull=True, deleted_at__gt=since).exists()
+    )
+    if reset:
+        return token, True, [], records
+
+    deleted = list(
+        tombstones.filter(deleted_at__gt=since).order_by().values_list('record_id', flat=True)
+    )
+    return token, False, deleted, records.filter(updated_at__gt=since).order_by('updated_at', 'id')
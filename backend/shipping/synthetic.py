@@ -0,0 +1,170 @@
+import csv
+import functools
+from datetime import timedelta
+import numpy as np
+from django.utils import timezone
+from .addresses import get_zip_index
+from .ingest import TEMPLATE_CATEGORY_ROW, TEMPLATE_COLUMN_ROW
+from .rates import cents_to_decimal, get_rate_engine
+
+# Small pools drawn from to build realistic-looking manifests
+FIRST_NAMES = [
+    'James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda',
+    'David', 'Elizabeth', 'William', 'Barbara', 'Salina', 'Susan', 'Joseph', 'Jessica',
+]
+LAST_NAMES = [
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis',
+    'Rodriguez', 'Martinez', 'Dixon', 'Lopez', 'Wilson', 'Anderson', 'Thomas', 'Moore',
+]
+STREETS = [
+    'Sunny Trail Rd', 'W Arrow Hwy', 'W Foothill Blvd', 'Grove Ave', 'Main St',
+    'Oak St', 'Maple Ave', 'Cedar Ln', 'Park Blvd', 'Lakeview Dr',
+]
+
+# (city, state, zip prefix) weighted roughly by population
+CITIES = [
+    ('Los Angeles', 'CA', '900'), ('San Dimas', 'CA', '917'), ('Houston', 'TX', '770'),
+    ('Dallas', 'TX', '752'), ('Miami', 'FL', '331'), ('Orlando', 'FL', '328'),
+    ('New York', 'NY', '100'), ('Buffalo', 'NY', '142'), ('Chicago', 'IL', '606'),
+    ('Philadelphia', 'PA', '191'), ('Columbus', 'OH', '432'), ('Atlanta', 'GA', '303'),
+    ('Wallace', 'NC', '284'), ('Seattle', 'WA', '981'), ('Phoenix', 'AZ', '850'),
+    ('Denver', 'CO', '802'),
+]
+CITY_WEIGHTS = np.array([12, 3, 7, 6, 6, 4, 10, 3, 6, 5, 4, 5, 2, 4, 4, 3], dtype=float)
+CITY_WEIGHTS /= CITY_WEIGHTS.sum()
+
+FROM_ADDRESS = ['Print', 'TTS', '502 W Arrow Hwy', 'STE P', 'San Dimas', '91773', 'CA']
+
+# Ship-to states weighted by population (hundred thousands, 2020 census)
+STATE_WEIGHTS = {
+    'CA': 395, 'TX': 291, 'FL': 215, 'NY': 202, 'PA': 130, 'IL': 128, 'OH': 118, 'GA': 107,
+    'NC': 104, 'MI': 101, 'NJ': 93, 'VA': 86, 'WA': 77, 'AZ': 72, 'MA': 70, 'TN': 69,
+    'IN': 68, 'MD': 62, 'MO': 62, 'WI': 59, 'CO': 58, 'MN': 57, 'SC': 51, 'AL': 50,
+    'LA': 47, 'KY': 45, 'OR': 42, 'OK': 40, 'CT': 36, 'UT': 33, 'IA': 32, 'NV': 31,
+    'AR': 30, 'MS': 30, 'KS': 29, 'NM': 21, 'NE': 20, 'ID': 18, 'WV': 18, 'HI': 15,
+    'NH': 14, 'ME': 14, 'RI': 11, 'MT': 11, 'DE': 10, 'SD': 9, 'ND': 8, 'AK': 7,
+    'DC': 7, 'VT': 6, 'WY': 6,
+}
+
+# Share of shipments by service and by status
+SERVICE_WEIGHTS = {'ground': 0.7, 'priority': 0.3}
+STATUS_WEIGHTS = {'pending': 0.3, 'processed': 0.65, 'error': 0.05}
+
+# How far back created_at is spread
+CREATED_WITHIN = timedelta(days=90)
+
+
+def manifest_rows(count, seed=0, start=0):
+    """Yield `count` deterministic data rows in download_template column order"""
+    rng = np.random.default_rng(seed)
+    first = rng.integers(0, len(FIRST_NAMES), count)
+    last = rng.integers(0, len(LAST_NAMES), count)
+    street = rng.integers(0, len(STREETS), count)
+    house = rng.integers(1, 9999, count)
+    apt = rng.integers(0, 4, count)
+    city = rng.choice(len(CITIES), count, p=CITY_WEIGHTS)
+    zip_suffix = rng.integers(0, 100, count)
+    plus4 = rng.integers(0, 10000, count)
+    has_from = rng.random(count) < 0.3
+    # Most parcels are light; a long tail goes up to ~20 lb
+    total_oz = np.minimum(rng.lognormal(3.0, 0.9, count), 320).astype(int) + 1
+    dims = rng.integers(4, 24, (count, 3))
+
+    for i in range(count):
+        city_name, state, prefix = CITIES[city[i]]
+        yield (FROM_ADDRESS if has_from[i] else [''] * 7) + [
+            FIRST_NAMES[first[i]],
+            LAST_NAMES[last[i]],
+            f'{house[i]} {STREETS[street[i]]}',
+            f'Apt {house[i] + apt[i]}' if apt[i] == 0 else '',
+            city_name,
+            f'{prefix}{zip_suffix[i]:02d}-{plus4[i]:04d}',
+            state,
+            total_oz[i] // 16,
+            total_oz[i] % 16,
+            dims[i, 0],
+            dims[i, 1],
+            dims[i, 2],
+            f'555-{(start + i) % 10000:04d}',
+            '',
+            f'ORD-{seed}-{start + i}',
+            f'SKU-{(start + i) % 500}',
+        ]
+
+def write_manifest(output, count, seed=0):
+    """Write a synthetic manifest with the template header rows to a text stream"""
+    writer = csv.writer(output)
+    writer.writerow(TEMPLATE_CATEGORY_ROW)
+    writer.writerow(TEMPLATE_COLUMN_ROW)
+    writer.writerows(manifest_rows(count, seed=seed))
+
+
+@functools.lru_cache(maxsize=None)
+def state_zip_codes():
+    """(states, population weights, array of real five-digit ZIP codes per state)"""
+    index = get_zip_index()
+    states = [state for state in STATE_WEIGHTS if state in index.state_codes]
+    codes = [np.flatnonzero(index.state_of == index.state_codes.index(state)) for state in states]
+    weights = np.array([STATE_WEIGHTS[state] for state in states], dtype=float)
+    return states, weights / weights.sum(), codes
+
+def shipment_columns(count, seed=0, now=None):
+    """
+    `count` deterministic shipments as parsed column arrays (see
+    ingest.parse_chunk), without user_id, order_no and item_sku. Ship-to
+    addresses are real city/state/ZIP combinations; services, statuses and
+    created_at (over the last CREATED_WITHIN) follow the weights above.
+    """
+    rng = np.random.default_rng(seed)
+    now = now or timezone.now()
+    index = get_zip_index()
+    states, state_weights, state_codes = state_zip_codes()
+
+    state = rng.choice(len(states), count, p=state_weights)
+    zip_code = np.empty(count, dtype=np.int64)
+    for i, codes in enumerate(state_codes):
+        rows = np.flatnonzero(state == i)
+        zip_code[rows] = codes[rng.integers(0, len(codes), len(rows))]
+    city_names = np.array(index.city_names, dtype=object)
+
+    first = rng.integers(0, len(FIRST_NAMES), count)
+    last = rng.integers(0, len(LAST_NAMES), count)
+    street = rng.integers(0, len(STREETS), count)
+    house = rng.integers(1, 9999, count)
+    apt = rng.integers(0, 4, count)
+    has_from = rng.random(count) < 0.3
+    total_oz = np.minimum(rng.lognormal(3.0, 0.9, count), 320).astype(np.int64) + 1
+    dims = rng.integers(4, 24, (count, 3)).astype(float)
+    phone = rng.integers(0, 10000, count)
+    service = rng.choice(list(SERVICE_WEIGHTS), count, p=list(SERVICE_WEIGHTS.values()))
+    status = rng.choice(list(STATUS_WEIGHTS), count, p=list(STATUS_WEIGHTS.values()))
+    age = rng.integers(0, int(CREATED_WITHIN.total_seconds()), count)
+
+    zips = [f'{code:05d}' for code in zip_code.tolist()]
+    from_zip = np.where(has_from, FROM_ADDRESS[5], '')
+    cents, _, _ = get_rate_engine().quote(service, total_oz // 16, total_oz % 16, from_zip, zips)
+
+    columns = {}
+    for i, field in enumerate((
+        'from_first_name', 'from_last_name', 'from_address', 'from_address2',
+        'from_city', 'from_zip', 'from_state',
+    )):
+        columns[field] = np.where(has_from, FROM_ADDRESS[i], '').tolist()
+    columns['to_first_name'] = np.array(FIRST_NAMES, dtype=object)[first].tolist()
+    columns['to_last_name'] = np.array(LAST_NAMES, dtype=object)[last].tolist()
+    columns['to_address'] = [f'{h} {STREETS[s]}' for h, s in zip(house.tolist(), street.tolist())]
+    columns['to_address2'] = [f'Apt {h}' if a == 0 else '' for h, a in zip(house.tolist(), apt.tolist())]
+    columns['to_city'] = city_names[index.city_of[zip_code]].tolist()
+    columns['to_zip'] = zips
+    columns['to_state'] = np.array(states, dtype=object)[state].tolist()
+    columns['address_status'] = ['valid'] * count
+    columns['weight_lbs'] = (total_oz // 16).tolist()
+    columns['weight_oz'] = (total_oz % 16).tolist()
+    columns['length'], columns['width'], columns['height'] = dims.T.tolist()
+    columns['phone_num1'] = [f'555-{p:04d}' for p in phone.tolist()]
+    columns['phone_num2'] = [''] * count
+    columns['shipping_service'] = service.tolist()
+    columns['shipping_price'] = [cents_to_decimal(c) for c in cents.tolist()]
+    columns['status'] = status.tolist()
+    columns['created_at'] = [now - timedelta(seconds=seconds) for seconds in age.tolist()]
+    return columns
@@ -1,3 +1,1715 @@
-from django.test import TestCase
+import csv
+import decimal
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+import zipfile
+from unittest import mock
+from xml.etree import ElementTree
+import django
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, router
+from django.http import StreamingHttpResponse
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.connection import ConnectionDoesNotExist
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from .models import ImportJob, Purchase, SavedAddress, SavedPackage, ShipmentRecord, ShipmentTombstone, UserProfile
+from .addresses import normalize_address
+from .authentication import user_cache
+from .bulk import reprice_rows, supports_copy
+from . import ingest, jobs, labels, pdf, summary, uploads
+from .ingest import (
+    TEMPLATE_CATEGORY_ROW, TEMPLATE_COLUMN_ROW, import_manifest, parse_manifest, read_manifest, parse_chunk,
+    insert_chunk,
+)
+from .management.commands.bench_ingest import legacy_parse
+from .labels import cache_path, labels_response, prune_label_cache, purchased_labels, render_labels
+from .pagination import ShipmentCursorPagination
+from .rates import TableRateEngine, get_rate_engine
+from .routers import replica_reads
+from .serializers import ShipmentRecordSerializer, ShipmentRecordListSerializer
+from .sync import encode_token
+from .synthetic import shipment_columns, write_manifest
+from .uploads import (
+    APPEND_LEASE, PARSE_LEASE, UploadError, append_upload, create_upload, finalize_upload, import_received,
+    run_upload_import,
+)
 
-# Create your tests here.
+SHIPMENT_TABLE = ShipmentRecord._meta.db_table
+
+
+class ShipmentQueryPlanTests(TestCase):
+    """
+    EXPLAIN the shipment access paths used by the views against a seeded
+    dataset and fail if any of them falls back to a sequential scan.
+    """
+    USERS = 10
+    SHIPMENTS_PER_USER = 3000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(username=f'plan-{i}', password='x')
+            for i in range(cls.USERS)
+        ]
+        now = timezone.now()
+        statuses = ['pending'] * 8 + ['processed', 'error']
+        records = [
+            ShipmentRecord(
+                user=user,
+                to_first_name='Salina',
+                to_last_name='Dixon',
+                to_address='61 Sunny Trail Rd',
+                to_city='Wallace',
+                to_zip='28466',
+                to_state='NC',
+                length=6, width=6, height=6,
+                order_no=f'ORD-{user.pk}-{i}',
+                status=statuses[i % len(statuses)],
+                created_at=now - timezone.timedelta(minutes=i // 100),
+            )
+            for user in cls.users
+            for i in range(cls.SHIPMENTS_PER_USER)
+        ]
+        ShipmentRecord.objects.bulk_create(records, batch_size=5000)
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {SHIPMENT_TABLE}')
+        cls.user = cls.users[3]
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, plan)
+        self.assertNotIn(f'Seq Scan on {SHIPMENT_TABLE}', plan)
+        for line in plan.splitlines():
+            if f'SCAN {SHIPMENT_TABLE}' in line:
+                self.assertIn('USING', line, plan)
+
+    def test_list_uses_user_created_index(self):
+        shipments = ShipmentRecord.objects.filter(user=self.user)
+        self.assertUsesIndex(shipments[:101], 'shipment_user_created_idx')
+
+    def test_deep_keyset_page_uses_user_created_index(self):
+        last = ShipmentRecord.objects.filter(user=self.user)[2500]
+        paginator = ShipmentCursorPagination()
+        shipments = ShipmentRecord.objects.filter(user=self.user).order_by('-created_at', '-id').filter(
+            paginator.keyset_filter('created_at', True, last.created_at, last.pk)
+        )
+        self.assertUsesIndex(shipments[:101], 'shipment_user_created_idx')
+
+    def test_status_filter_uses_user_status_index(self):
+        shipments = ShipmentRecord.objects.filter(user=self.user, status='error')
+        self.assertUsesIndex(shipments.order_by(), 'shipment_user_status_idx')
+
+    def test_order_no_filter_uses_unique_order_index(self):
+        shipments = ShipmentRecord.objects.filter(user=self.user, order_no=f'ORD-{self.user.pk}-42')
+        # SQLite builds unique constraints as anonymous autoindexes
+        index_name = 'sqlite_autoindex' if connection.vendor == 'sqlite' else 'shipment_user_order_sku_uniq'
+        self.assertUsesIndex(shipments.order_by(), index_name)
+
+    def test_changes_feed_uses_user_updated_index(self):
+        since = ShipmentRecord.objects.filter(user=self.user).latest('updated_at').updated_at
+        shipments = ShipmentRecord.objects.filter(user=self.user, updated_at__gt=since).order_by('updated_at', 'id')
+        self.assertUsesIndex(shipments, 'shipment_user_updated_idx')
+
+    def test_record_ids_lookup_uses_primary_key(self):
+        ids = list(ShipmentRecord.objects.filter(user=self.user).values_list('id', flat=True)[:50])
+        shipments = ShipmentRecord.objects.filter(id__in=ids, user=self.user).order_by()
+        plan = shipments.explain()
+        self.assertNotIn(f'Seq Scan on {SHIPMENT_TABLE}', plan)
+        for line in plan.splitlines():
+            if f'SCAN {SHIPMENT_TABLE}' in line:
+                self.assertIn('USING', line, plan)
+
+
+class ShipmentPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='pages', password='x')
+        now = timezone.now()
+        # Five rows share each created_at, so pages split ties
+        ShipmentRecord.objects.bulk_create([
+            ShipmentRecord(
+                user=cls.user, order_no=f'ORD-{i}', to_state='NC', length=6, width=6, height=6,
+                status='error' if i % 3 == 0 else 'pending',
+                created_at=now - timezone.timedelta(minutes=i // 5),
+            )
+            for i in range(23)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, **params):
+        return self.client.get('/api/shipments/', params)
+
+    def walk(self, **params):
+        ids = []
+        cursor = None
+        while True:
+            response = self.get(page_size=4, **params, **({'cursor': cursor} if cursor else {}))
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 4)
+            ids.extend(row['id'] for row in response.data['results'])
+            cursor = response.data['cursor']
+            if cursor is None:
+                return ids
+
+    def expected(self, *ordering, **filters):
+        shipments = ShipmentRecord.objects.filter(user=self.user, **filters).order_by(*ordering)
+        return list(shipments.values_list('id', flat=True))
+
+    def test_pages_cover_every_row_once_across_ties(self):
+        self.assertEqual(self.walk(), self.expected('-created_at', '-id'))
+        self.assertEqual(self.walk(ordering='created_at'), self.expected('created_at', 'id'))
+
+    def test_filters_apply_to_every_page(self):
+        self.assertEqual(self.walk(status='error'), self.expected('-created_at', '-id', status='error'))
+        self.assertEqual(self.walk(order_no='ORD-7'), self.expected('id', order_no='ORD-7'))
+
+    def test_bad_cursors_and_orderings_are_rejected(self):
+        cursor = self.get(page_size=4).data['cursor']
+        paginator = ShipmentCursorPagination()
+        for bad in [
+            'not-a-cursor',
+            paginator.encode_cursor('-created_at', None, 1),
+            paginator.encode_cursor('-created_at', 'yesterday', 1),
+            paginator.encode_cursor('-created_at', timezone.now().isoformat(), 'x'),
+        ]:
+            self.assertEqual(self.get(cursor=bad).status_code, 404, bad)
+        # A cursor only continues the ordering it was issued for
+        self.assertEqual(self.get(cursor=cursor, ordering='created_at').status_code, 404)
+        self.assertEqual(self.get(page_size=4, ordering='order_no').status_code, 400)
+
+
+class ShipmentRecordListSerializerTests(TestCase):
+    """The .values() fast path must render exactly like ShipmentRecordSerializer"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = user = User.objects.create_user(username='serializer', password='x')
+        ShipmentRecord.objects.bulk_create([
+            ShipmentRecord(
+                user=user,
+                from_first_name=from_first_name,
+                from_last_name='TTS',
+                from_address='502 W Arrow Hwy',
+                from_address2=address2,
+                from_city='San Dimas',
+                from_zip='91773',
+                from_state='CA',
+                to_first_name='Salina',
+                to_last_name='Dixon',
+                to_address='61 Sunny Trail Rd',
+                to_address2=address2,
+                to_city='Wallace',
+                to_zip='28466-9087',
+                to_state='NC',
+                weight_lbs=weight_lbs,
+                weight_oz=7,
+                length=12.5, width=6, height=0.25,
+                order_no=f'ORD-{i}',
+                shipping_price=3.85,
+            )
+            for i, (from_first_name, address2, weight_lbs) in enumerate([
+                ('Print', 'STE P', 2),
+                ('', '', 0),
+                ('Print', '', 0),
+            ])
+        ])
+
+    def render_model_serializer(self):
+        shipments = ShipmentRecord.objects.filter(user=self.user)
+        return JSONRenderer().render(ShipmentRecordSerializer(shipments, many=True).data)
+
+    def test_matches_model_serializer(self):
+        shipments = ShipmentRecord.objects.filter(user=self.user)
+        actual = JSONRenderer().render(ShipmentRecordListSerializer(
+            ShipmentRecordListSerializer.rows(shipments), many=True
+        ).data)
+        self.assertEqual(actual, self.render_model_serializer())
+
+    def test_streamed_list_matches_model_serializer(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/shipments/')
+        self.assertTrue(response.streaming)
+        self.assertEqual(b''.join(response.streaming_content), self.render_model_serializer())
+
+
+class BulkUpdateShipmentsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='bulk', password='x')
+        ShipmentRecord.objects.bulk_create([
+            ShipmentRecord(
+                user=cls.user,
+                to_first_name='Salina', to_last_name='Dixon', to_address='61 Sunny Trail Rd',
+                to_city='Wallace', to_zip='28466', to_state='NC',
+                weight_lbs=i % 3, weight_oz=i % 16,
+                length=6, width=6, height=6,
+                order_no=f'ORD-{i}',
+            )
+            for i in range(200)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def bulk_update(self, record_ids, **data):
+        if record_ids is not None:
+            data['record_ids'] = record_ids
+        response = self.client.patch('/api/shipments/bulk/update/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_service_change_reprices_from_weights(self):
+        ids = list(ShipmentRecord.objects.filter(user=self.user).values_list('id', flat=True))
+        rows = self.bulk_update(ids, shipping_service='priority', from_city='Claremont')
+
+        self.assertEqual(len(rows), len(ids))
+        for record in ShipmentRecord.objects.filter(user=self.user):
+            self.assertEqual(record.shipping_service, 'priority')
+            self.assertEqual(record.from_city, 'Claremont')
+            self.assertEqual(record.shipping_price, record.calculate_shipping_price())
+
+    def test_rows_come_back_in_model_order(self):
+        expected = list(ShipmentRecord.objects.filter(user=self.user).values_list('id', flat=True))
+        rows = self.bulk_update(expected[::-1], from_city='Claremont')
+        self.assertEqual([row['id'] for row in rows], expected)
+
+        # Zoned tables are repriced from the returned rows, on their connection
+        with mock.patch('shipping.rates._engine', TableRateEngine('2026-10')):
+            rows = self.bulk_update(expected[:50], shipping_service='priority')
+            records = ShipmentRecord.objects.filter(pk__in=expected[:50])
+            prices = {record.pk: record.calculate_shipping_price() for record in records}
+        self.assertEqual([row['id'] for row in rows], expected[:50])
+        self.assertEqual({row['id']: decimal.Decimal(row['shipping_price']) for row in rows}, prices)
+
+        rows = list(ShipmentRecord.objects.filter(pk__in=expected[:5]).values())
+        with self.assertRaises(ConnectionDoesNotExist):
+            reprice_rows(ShipmentRecord, rows, TableRateEngine('2026-10'), using='elsewhere')
+
+    def test_update_and_delete_by_filter(self):
+        ShipmentRecord.objects.filter(user=self.user, weight_lbs=2).update(status='error')
+        rows = self.bulk_update(None, filter={'status': 'error'}, from_city='Claremont')
+        self.assertEqual(len(rows), ShipmentRecord.objects.filter(user=self.user, status='error').count())
+        self.assertEqual(ShipmentRecord.objects.filter(user=self.user, from_city='Claremont').count(), len(rows))
+
+        response = self.client.post(
+            '/api/shipments/bulk/delete/', {'filter': {'status': ['error', 'processed']}}, format='json'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(ShipmentRecord.objects.filter(user=self.user).count(), 200 - len(rows))
+
+    def test_filter_selection_is_validated(self):
+        for data, error in (
+            ({'filter': {}}, 'filter must be an object with at least one field'),
+            ({'filter': {'to_zip': '28466'}}, 'Unknown filter fields: to_zip; use status, shipping_service, to_state, order_no, address_status'),
+            ({'filter': {'status': ['']}}, 'filter status must be a non-empty string or list of strings'),
+            ({'filter': {'status': 'error'}, 'record_ids': [1]}, 'Give either record_ids or filter, not both'),
+        ):
+            response = self.client.post('/api/shipments/bulk/delete/', data, format='json')
+            self.assertEqual((response.status_code, response.json()), (400, {'error': error}))
+        self.assertEqual(ShipmentRecord.objects.filter(user=self.user).count(), 200)
+
+    def test_round_trips_do_not_grow_with_selection(self):
+        ids = list(ShipmentRecord.objects.filter(user=self.user).values_list('id', flat=True))
+        query_counts = []
+        for selection in (ids[:5], ids):
+            with CaptureQueriesContext(connection) as queries:
+                self.bulk_update(selection, status='error')
+            query_counts.append(len(queries))
+        self.assertEqual(query_counts[0], query_counts[1])
+
+
+class RateEngineTests(TestCase):
+
+    def test_default_table_matches_linear_formula(self):
+        engine = TableRateEngine('2026-02')
+        # Including weights past the last bracket, up to the open-ended cap
+        lbs = [0, 0, 1, 3, 69, 70, 100, 1000]
+        oz = [0, 7, 0, 15, 16, 1, 0, 3]
+        for service, base, per_oz in (('ground', '2.50', '0.05'), ('priority', '5.00', '0.10')):
+            cents, _, valid = engine.quote([service] * 8, lbs, oz, ['91773'] * 8, ['28466'] * 8)
+            self.assertTrue(valid.all())
+            for i in range(8):
+                expected = decimal.Decimal(base) + (lbs[i] * 16 + oz[i]) * decimal.Decimal(per_oz)
+                self.assertEqual(engine.quote_one(service, lbs[i], oz[i]), expected)
+
+    def test_zoned_table_rounds_up_to_bracket(self):
+        engine = TableRateEngine('2026-10')
+        same_area = engine.quote_one('ground', 0, 5, '91773', '91711')
+        self.assertEqual(same_area, engine.quote_one('ground', 0, 8, '91773', '91711'))
+        self.assertLess(same_area, engine.quote_one('ground', 0, 8, '91773', '02134'))
+        self.assertIsNone(engine.quote_one('ground', 71, 0, '91773', '02134'))
+        self.assertIsNone(engine.price_expression('ground'))
+
+    def test_manifest_weight_limit_follows_the_table(self):
+        manifest = io.StringIO()
+        write_manifest(manifest, 1, seed=1)
+        manifest.seek(0)
+        chunk = next(read_manifest(manifest))
+        chunk[14], chunk[15] = '100', '0'
+
+        columns, _, errors = parse_chunk(chunk)
+        self.assertEqual((columns['shipping_price'], errors), ([decimal.Decimal('82.50')], []))
+        # Zoned retail tables stop at 70 lb
+        with mock.patch('shipping.rates._engine', TableRateEngine('2026-10')):
+            columns, _, errors = parse_chunk(chunk)
+        self.assertEqual(columns['shipping_price'], [])
+        self.assertEqual(errors, [{'row': 2, 'error': 'no ground rate for this weight'}])
+
+    def test_quote_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='quote', password='x'))
+        response = client.post('/api/rates/quote/', {'shipments': [
+            {'shipping_service': 'priority', 'weight_lbs': 1, 'weight_oz': 2, 'to_zip': '28466'},
+            {'shipping_service': 'ground', 'weight_lbs': 'heavy'},
+            {'shipping_service': 'overnight'},
+            {'weight_lbs': 80},
+            {'weight_oz': -1},
+            {'weight_lbs': 1e300},
+            {'weight_lbs': 'inf'},
+            {'weight_oz': 1e17},
+            {'weight_lbs': -1, 'weight_oz': 20},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['quotes'], [
+            {'price': '6.80', 'zone': 8},
+            {'error': 'weight_lbs and weight_oz must be numbers'},
+            {'error': 'Unknown shipping_service: overnight'},
+            {'price': '66.50', 'zone': 1},
+        ] + [{'error': 'No rate for this weight'}] * 5)
+
+    def test_price_expression_keeps_price_of_unpriceable_weights(self):
+        user = User.objects.create_user(username='expression', password='x')
+        ShipmentRecord.objects.bulk_create([
+            ShipmentRecord(
+                user=user, to_zip='28466', length=6, width=6, height=6, order_no=f'ORD-{i}',
+                weight_lbs=lbs, weight_oz=oz, shipping_price=decimal.Decimal('1.00')
+            )
+            for i, (lbs, oz) in enumerate(((1, 0), (-1, 20), (0, -1), (10001, 0)))
+        ])
+        ShipmentRecord.objects.filter(user=user).update(
+            shipping_price=ShipmentRecord.shipping_price_expression()
+        )
+        self.assertEqual(
+            list(ShipmentRecord.objects.filter(user=user).order_by('id').values_list('shipping_price', flat=True)),
+            [decimal.Decimal('3.30')] + [decimal.Decimal('1.00')] * 3
+        )
+
+    def test_update_reprices_from_normalized_address(self):
+        user = User.objects.create_user(username='reprice', password='x')
+        shipment = ShipmentRecord.objects.create(
+            user=user, from_zip='02110', to_city='Wallace', to_state='NC', to_zip='28466',
+            length=6, width=6, height=6, weight_lbs=1, weight_oz=0, shipping_price=decimal.Decimal('1.00')
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+        with mock.patch('shipping.rates._engine', TableRateEngine('2026-10')):
+            # A spreadsheet-mangled Boston ZIP: priced as 02134, not as 213xx
+            response = client.put(
+                f'/api/shipments/{shipment.pk}/', {'to_city': 'Boston', 'to_state': 'MA', 'to_zip': '2134'},
+                format='json'
+            )
+            self.assertEqual(response.status_code, 200)
+            shipment.refresh_from_db()
+            self.assertEqual(shipment.to_zip, '02134')
+            self.assertEqual(shipment.shipping_price, shipment.calculate_shipping_price())
+            self.assertNotEqual(
+                shipment.shipping_price, get_rate_engine().quote_one('ground', 1, 0, shipment.from_zip, '2134')
+            )
+
+            response = client.put(f'/api/shipments/{shipment.pk}/', {'weight_lbs': 3}, format='json')
+            shipment.refresh_from_db()
+            self.assertEqual(shipment.shipping_price, get_rate_engine().quote_one('ground', 3, 0, shipment.from_zip, '02134'))
+
+
+def create_purchase_account(username, balance, prices):
+    user = User.objects.create_user(username=username, password='x')
+    UserProfile.objects.create(user=user, account_balance=balance)
+    ShipmentRecord.objects.bulk_create([
+        ShipmentRecord(
+            user=user,
+            to_first_name='Salina', to_last_name='Dixon', to_address='61 Sunny Trail Rd',
+            to_city='Wallace', to_zip='28466', to_state='NC',
+            length=6, width=6, height=6,
+            order_no=f'ORD-{i}',
+            shipping_price=price,
+        )
+        for i, price in enumerate(prices)
+    ])
+    return user
+
+
+class PurchaseShipmentsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_purchase_account('purchase', decimal.Decimal('20.00'), ['4.00'] * 4 + ['9.00'])
+        cls.ids = list(ShipmentRecord.objects.filter(user=cls.user).order_by('id').values_list('id', flat=True))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def purchase(self, record_ids, key=None):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.client.post('/api/purchase/', {'record_ids': record_ids}, format='json', **headers)
+
+    def balance(self):
+        return UserProfile.objects.get(user=self.user).account_balance
+
+    def test_charges_pending_records_once(self):
+        ShipmentRecord.objects.filter(pk=self.ids[0]).update(status='processed')
+        response = self.purchase(self.ids[:3])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['records_processed'], 2)
+        self.assertEqual(response.data['records_skipped'], 1)
+        self.assertEqual(self.balance(), decimal.Decimal('12.00'))
+
+        self.assertEqual(self.purchase(self.ids[:3]).status_code, 404)
+        self.assertEqual(self.balance(), decimal.Decimal('12.00'))
+
+    def test_skipped_counts_only_own_records(self):
+        other = create_purchase_account('purchase-other', decimal.Decimal('20.00'), ['4.00'])
+        other_id = ShipmentRecord.objects.get(user=other).pk
+        ShipmentRecord.objects.filter(pk=self.ids[0]).update(status='processed')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.purchase(self.ids[:2] + [other_id, 10 ** 9])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['records_processed'], response.data['records_skipped']), (1, 1))
+        self.assertEqual(ShipmentRecord.objects.get(pk=other_id).status, 'pending')
+        if connection.features.has_select_for_update:
+            # Rows are locked in id order before the claiming UPDATE
+            locks = [query['sql'] for query in queries if 'FOR UPDATE' in query['sql']]
+            self.assertEqual(len(locks), 1)
+            self.assertIn('ORDER BY', locks[0])
+
+    def test_boolean_ids_are_refused(self):
+        for url in ('/api/purchase/', '/api/labels/'):
+            response = self.client.post(url, {'record_ids': [True, self.ids[0]]}, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data, {'error': 'record_ids must be a list of integers'})
+        self.assertEqual(self.balance(), decimal.Decimal('20.00'))
+
+    def test_retry_with_idempotency_key_is_not_charged_again(self):
+        first = self.purchase(self.ids[:2], key='retry-1')
+        retry = self.purchase(self.ids[:2], key='retry-1')
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(self.balance(), decimal.Decimal('12.00'))
+
+        self.assertEqual(self.purchase(self.ids[2:4], key='retry-1').status_code, 422)
+
+    def test_insufficient_balance_changes_nothing(self):
+        response = self.purchase(self.ids, key='too-much')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['required'], decimal.Decimal('25.00'))
+        self.assertEqual(self.balance(), decimal.Decimal('20.00'))
+        self.assertFalse(ShipmentRecord.objects.filter(user=self.user, status='processed').exists())
+        self.assertFalse(Purchase.objects.filter(user=self.user).exists())
+
+    def test_purchase_by_filter(self):
+        ShipmentRecord.objects.filter(pk=self.ids[4]).update(to_state='CA')
+        ShipmentRecord.objects.filter(pk=self.ids[0]).update(status='processed')
+        request = {'filter': {'status': 'pending', 'to_state': 'NC'}}
+        response = self.client.post('/api/purchase/', request, format='json', HTTP_IDEMPOTENCY_KEY='by-filter')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['record_ids'], self.ids[1:4])
+        self.assertEqual(self.balance(), decimal.Decimal('8.00'))
+
+        retry = self.client.post('/api/purchase/', request, format='json', HTTP_IDEMPOTENCY_KEY='by-filter')
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        request['filter']['to_state'] = 'CA'
+        other = self.client.post('/api/purchase/', request, format='json', HTTP_IDEMPOTENCY_KEY='by-filter')
+        self.assertEqual(other.status_code, 422)
+
+
+@unittest.skipIf(connection.vendor == 'sqlite', 'SQLite test databases do not allow concurrent writers')
+class PurchaseConcurrencyTests(TransactionTestCase):
+    """Many parallel purchasers against one account"""
+    PURCHASERS = 12
+    PURCHASES = 10
+
+    def test_parallel_purchases_never_overcharge(self):
+        prices = [decimal.Decimal(250 + i % 7 * 100).scaleb(-2) for i in range(300)]
+        user = create_purchase_account('parallel', sum(prices[:200]), prices)
+        ids = list(ShipmentRecord.objects.filter(user=user).values_list('id', flat=True))
+        barrier = threading.Barrier(self.PURCHASERS)
+        failures = []
+
+        def purchaser(n):
+            client = APIClient()
+            client.force_authenticate(user)
+            barrier.wait()
+            try:
+                for i in range(self.PURCHASES):
+                    # Overlapping selections, each sent twice with the same key
+                    selection = ids[(n * 7 + i * 13) % 280:][:20]
+                    key = uuid.uuid4().hex
+                    for _ in range(2):
+                        response = client.post(
+                            '/api/purchase/', {'record_ids': selection}, format='json',
+                            HTTP_IDEMPOTENCY_KEY=key
+                        )
+                        if response.status_code not in (200, 400, 404):
+                            failures.append(response.status_code)
+            except Exception as e:
+                failures.append(repr(e))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=purchaser, args=(n,)) for n in range(self.PURCHASERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(failures, [])
+        processed = ShipmentRecord.objects.filter(user=user, status='processed')
+        charged = sum(prices[:200]) - UserProfile.objects.get(user=user).account_balance
+        self.assertGreaterEqual(charged, 0)
+        self.assertEqual(charged, sum(processed.values_list('shipping_price', flat=True)))
+        self.assertEqual(charged, sum(Purchase.objects.filter(user=user).values_list('total', flat=True)))
+        self.assertEqual(
+            processed.count(),
+            sum(Purchase.objects.filter(user=user).values_list('records_processed', flat=True))
+        )
+
+
+class LabelDownloadTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_purchase_account('labels', decimal.Decimal('100.00'), ['4.00'] * 3)
+        cls.ids = list(ShipmentRecord.objects.filter(user=cls.user).order_by('id').values_list('id', flat=True))
+        ShipmentRecord.objects.filter(pk__in=cls.ids[:2]).update(status='processed')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.cache_dir = cache_dir.name
+        settings_override = override_settings(LABEL_CACHE_DIR=self.cache_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # No background sweeps of the page cache unless a test asks for one
+        pruned = mock.patch.object(labels, '_last_prune', time.monotonic())
+        pruned.start()
+        self.addCleanup(pruned.stop)
+
+    def download(self, **data):
+        response = self.client.post('/api/labels/', {'record_ids': self.ids, **data}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def cached_pages(self):
+        return sorted(
+            os.path.join(root, name) for root, _, names in os.walk(self.cache_dir) for name in names
+        )
+
+    def test_pdf_has_a_page_per_purchased_record(self):
+        document = self.download(label_format='4x6')
+        self.assertTrue(document.startswith(b'%PDF-1.4'))
+        self.assertTrue(document.endswith(b'%%EOF\n'))
+        self.assertEqual(document.count(b'/Type /Page '), 2)
+        self.assertIn(b'/MediaBox [0 0 288 432]', document)
+
+    def test_repeat_downloads_are_served_from_cache(self):
+        first = self.download()
+        pages = self.cached_pages()
+        mtimes = [os.stat(path).st_mtime_ns for path in pages]
+        self.assertEqual(len(pages), 2)
+
+        self.assertEqual(self.download(), first)
+        self.assertEqual([os.stat(path).st_mtime_ns for path in self.cached_pages()], mtimes)
+
+        ShipmentRecord.objects.filter(pk=self.ids[0]).update(to_city='Burgaw')
+        self.assertNotEqual(self.download(), first)
+        self.assertEqual(len(self.cached_pages()), 2)
+
+    def test_cache_is_pruned_by_age_and_size(self):
+        labels_by_id = {label['id']: label for label in purchased_labels(self.user.pk, self.ids)}
+        render_labels(list(labels_by_id.values()), 'letter')
+        render_labels(list(labels_by_id.values()), '4x6')
+        pages = self.cached_pages()
+        self.assertEqual(len(pages), 4)
+        now = time.time()
+        for age, path in zip((40, 3, 2, 1), pages):
+            os.utime(path, (now - age * 86400, now - age * 86400))
+        abandoned = os.path.join(os.path.dirname(pages[0]), 'x.page.1.1.tmp')
+        open(abandoned, 'wb').close()
+        os.utime(abandoned, (now - 40 * 86400, now - 40 * 86400))
+
+        with override_settings(LABEL_CACHE_MAX_BYTES=os.path.getsize(pages[3]) + os.path.getsize(pages[2])):
+            self.assertEqual(prune_label_cache(), 3)
+        self.assertEqual(self.cached_pages(), pages[2:])
+
+        # Sweeps run in the background, once per interval
+        executor = mock.Mock()
+        with mock.patch.object(labels, 'get_executor', return_value=executor), \
+                mock.patch.object(labels, '_last_prune', None):
+            self.download(label_format='4x6')
+            self.download(label_format='a4')
+        self.assertEqual(executor.submit.call_args_list, [mock.call(prune_label_cache)])
+
+    def test_pool_workers_are_spawned_with_django_set_up(self):
+        with mock.patch.object(labels, 'ProcessPoolExecutor') as executor, \
+                mock.patch.object(labels, '_pool', None):
+            labels.get_label_pool()
+        kwargs = executor.call_args.kwargs
+        self.assertEqual(kwargs['mp_context'].get_start_method(), 'spawn')
+        self.assertIs(kwargs['initializer'], django.setup)
+
+    def test_page_pruned_during_a_download_is_rendered_again(self):
+        labels_for_user = purchased_labels(self.user.pk, self.ids)
+        paths = render_labels(labels_for_user, '4x6')
+        document = b''.join(labels_response(labels_for_user, paths, '4x6').streaming_content)
+        os.remove(paths[1])
+        self.assertEqual(b''.join(labels_response(labels_for_user, paths, '4x6').streaming_content), document)
+
+    def test_zip_has_a_pdf_per_label(self):
+        archive = zipfile.ZipFile(io.BytesIO(self.download(output='zip')))
+        self.assertEqual(archive.namelist(), [f'{pk}-ORD-{i}.pdf' for i, pk in enumerate(self.ids[:2])])
+        self.assertTrue(archive.read(archive.namelist()[0]).startswith(b'%PDF'))
+
+    def test_concurrent_renders_of_a_record_keep_each_others_pages(self):
+        labels = purchased_labels(self.user.pk, self.ids[:1])
+        writing = threading.Event()
+        second_done = threading.Event()
+        render_page = pdf.render_page
+
+        def slow_render_page(label, label_format):
+            # The first render holds its .tmp file open until the second render has finished
+            if threading.current_thread().name == 'first':
+                writing.set()
+                second_done.wait(5)
+            return render_page(label, label_format)
+
+        errors = []
+
+        def render(wait):
+            try:
+                if wait:
+                    writing.wait(5)
+                render_labels(labels, '4x6')
+            except Exception as e:
+                errors.append(e)
+            finally:
+                if wait:
+                    second_done.set()
+
+        with mock.patch.object(pdf, 'render_page', slow_render_page):
+            threads = [threading.Thread(target=render, args=(False,), name='first'),
+                       threading.Thread(target=render, args=(True,), name='second')]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual([os.path.basename(path) for path in self.cached_pages()],
+                         [os.path.basename(cache_path(labels[0], '4x6'))])
+
+
+class ExportShipmentsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_purchase_account('export', decimal.Decimal('0.00'), ['3.85', '4.10', '7.25'])
+        ShipmentRecord.objects.filter(user=cls.user, order_no='ORD-1').update(
+            status='error', to_address2='Apt "B", <rear>'
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def export(self, file_type, **params):
+        response = self.client.get(f'/api/shipments/export/{file_type}/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_csv_reimports_as_the_same_shipments(self):
+        content = self.export('csv')
+        self.assertTrue(content.startswith(b'From,'))
+        records = [record for records, errors in parse_manifest(io.BytesIO(content), self.user) for record in records]
+
+        fields = ['to_first_name', 'to_address2', 'to_zip', 'weight_lbs', 'length', 'order_no']
+        exported = sorted(tuple(str(getattr(record, name)) for name in fields) for record in records)
+        stored = sorted(
+            tuple(str(value) for value in row)
+            for row in ShipmentRecord.objects.filter(user=self.user).values_list(*fields)
+        )
+        self.assertEqual(len(exported), 3)
+        self.assertEqual([row[:4] for row in exported], [row[:4] for row in stored])
+
+    def test_export_applies_list_filters(self):
+        rows = self.export('csv', status='error').decode().splitlines()
+        self.assertEqual(len(rows), 3)
+        self.assertTrue(rows[2].endswith(',ground,4.10,error'))
+
+    def test_xlsx_worksheet(self):
+        archive = zipfile.ZipFile(io.BytesIO(self.export('xlsx', status='error')))
+        namespace = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+        sheet = ElementTree.fromstring(archive.read('xl/worksheets/sheet1.xml'))
+        rows = sheet.findall('s:sheetData/s:row', namespace)
+        self.assertEqual(len(rows), 3)
+        cells = {cell.get('r'): cell for cell in rows[2]}
+        self.assertEqual(cells['K3'].find('s:is/s:t', namespace).text, 'Apt "B", <rear>')
+        self.assertEqual(cells['Y3'].find('s:v', namespace).text, '4.10')
+
+    def test_unknown_format(self):
+        self.assertEqual(self.client.get('/api/shipments/export/pdf/').status_code, 404)
+
+
+class InsertChunkTests(TestCase):
+    """COPY and bulk_create must store identical rows"""
+
+    def insert(self, method):
+        user = User.objects.create_user(username=f'insert-{method}', password='x')
+        manifest = io.StringIO()
+        write_manifest(manifest, 500, seed=3)
+        manifest.seek(0)
+        inserted = sum(
+            insert_chunk(parse_chunk(chunk)[0], user, method=method)
+            for chunk in read_manifest(manifest, chunksize=200)
+        )
+        self.assertEqual(inserted, 500)
+        fields = [
+            field.name for field in ShipmentRecord._meta.concrete_fields
+            if field.name not in ('id', 'user', 'created_at', 'updated_at')
+        ]
+        return list(ShipmentRecord.objects.filter(user=user).order_by('id').values_list(*fields))
+
+    @unittest.skipUnless(supports_copy('default'), 'COPY needs PostgreSQL with psycopg 3')
+    def test_copy_matches_bulk_create(self):
+        self.assertEqual(self.insert('copy'), self.insert('bulk_create'))
+
+    def test_default_method(self):
+        self.assertEqual(len(self.insert(None)), 500)
+
+
+def manifest_row(order_no, lbs='1', oz='2', length='6', width='6', height='6', first_name='Salina'):
+    return [''] * 7 + [
+        first_name, 'Dixon', '61 Sunny Trail Rd', '', 'Wallace', '28466', 'NC',
+        lbs, oz, length, width, height, '555-0100', '', order_no, 'SKU-1',
+    ]
+
+
+class LegacyParseParityTests(TestCase):
+    """parse_chunk accepts, prices and rejects rows as the original upload loop did"""
+    FIELDS = ['order_no', 'weight_lbs', 'weight_oz', 'length', 'width', 'height', 'shipping_price']
+
+    def parse(self, rows):
+        manifest = io.StringIO()
+        writer = csv.writer(manifest)
+        writer.writerows([TEMPLATE_CATEGORY_ROW, TEMPLATE_COLUMN_ROW, *rows])
+        data = manifest.getvalue().encode()
+
+        records, legacy_errors = legacy_parse(io.BytesIO(data), User(username='legacy'))
+        # The legacy loop priced in floats, which the decimal column rounded on save
+        price_field = ShipmentRecord._meta.get_field('shipping_price')
+        for record in records:
+            record.shipping_price = price_field.to_python(record.shipping_price)
+        legacy = [tuple(getattr(record, field) for field in self.FIELDS) for record in records]
+        columns, _, errors = parse_chunk(read_manifest(io.BytesIO(data), chunksize=None))
+        parsed = list(zip(*(columns[field] for field in self.FIELDS))) if columns else []
+        return (legacy, legacy_errors), (parsed, errors)
+
+    def test_mixed_manifest_matches_legacy_loop(self):
+        legacy, parsed = self.parse([
+            manifest_row('A'),
+            manifest_row('B', lbs='abc'),
+            manifest_row('C', lbs='2.7', oz='-0.5'),
+            manifest_row('D', lbs='inf'),
+            manifest_row('E', oz='-inf'),
+            manifest_row('F', lbs='', oz=''),
+            manifest_row('G', length='x'),
+            manifest_row(''),
+            manifest_row('H', lbs='100'),
+            manifest_row('I', first_name=''),
+            [''] * 23,
+        ])
+        self.assertEqual(parsed, legacy)
+        self.assertEqual([row[0] for row in parsed[0]], ['A', 'B', 'C', 'F', 'G', 'ORDER-7', 'H', 'I'])
+        self.assertEqual(parsed[1], [
+            {'row': 5, 'error': 'cannot convert float infinity to integer'},
+            {'row': 6, 'error': 'cannot convert float infinity to integer'},
+        ])
+
+    def test_rows_the_database_would_refuse_are_row_errors(self):
+        (legacy, legacy_errors), (parsed, errors) = self.parse([
+            manifest_row('J', length=''),
+            manifest_row('K', height='nan'),
+            manifest_row('L', width='inf'),
+            manifest_row('M', length='1e6'),
+            manifest_row('N', lbs='1e12'),
+            manifest_row('O', lbs='-1'),
+        ])
+        # The legacy loop accepted all of them, with NaN, inf or a NULL price
+        self.assertEqual(([record[0] for record in legacy], legacy_errors), (list('JKLMNO'), []))
+        self.assertEqual([(row[0], row[3], row[5]) for row in parsed], [('J', 0.0, 6.0), ('K', 6.0, 0.0)])
+        self.assertEqual(errors, [
+            {'row': 4, 'error': 'width must be a finite number'},
+            {'row': 5, 'error': 'length exceeds 9999.99'},
+            {'row': 6, 'error': 'weight_lbs out of range'},
+            {'row': 7, 'error': 'no ground rate for this weight'},
+        ])
+
+
+class SeedDataTests(TestCase):
+    def seed(self, **options):
+        call_command('seed_data', prefix='load', workers=1, stdout=io.StringIO(), stderr=io.StringIO(), **options)
+
+    def test_seeds_users_with_shipments(self):
+        self.seed(users=3, shipments=40, batch_size=25)
+        users = User.objects.filter(username__startswith='load-')
+        self.assertEqual(users.count(), 3)
+        for user in users:
+            self.assertEqual(user.shipments.count(), 40)
+            self.assertEqual(user.saved_addresses.count(), 3)
+            self.assertEqual(user.saved_packages.count(), 3)
+            self.assertTrue(UserProfile.objects.filter(user=user).exists())
+        self.assertTrue(users[0].check_password('seed-password'))
+
+        # Ship-to addresses are real and pass validation unchanged
+        for record in ShipmentRecord.objects.all()[:50]:
+            self.assertEqual(
+                normalize_address(record.to_city, record.to_state, record.to_zip),
+                (record.to_city, record.to_state, record.to_zip, 'valid'),
+            )
+
+        # Existing users are left alone
+        self.seed(users=4, shipments=5)
+        self.assertEqual(User.objects.filter(username__startswith='load-').count(), 4)
+        self.assertEqual(ShipmentRecord.objects.count(), 125)
+
+    def test_shipments_are_deterministic(self):
+        now = timezone.now()
+        first = shipment_columns(200, seed=[1, 2], now=now)
+        self.assertEqual(first, shipment_columns(200, seed=[1, 2], now=now))
+        self.assertNotEqual(first, shipment_columns(200, seed=[1, 3], now=now))
+        self.assertLessEqual(set(first['shipping_service']), {'ground', 'priority'})
+        self.assertLessEqual(set(first['status']), {'pending', 'processed', 'error'})
+
+
+class UpsertImportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='upsert', password='x')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def manifest(self, rows, seed=5):
+        manifest = io.StringIO()
+        write_manifest(manifest, rows, seed=seed)
+        return manifest.getvalue()
+
+    def upload(self, content, **data):
+        upload = io.BytesIO(content.encode())
+        upload.name = 'manifest.csv'
+        response = self.client.post('/api/upload/', {'file': upload, **data}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        body = json.loads(b''.join(response.streaming_content))
+        self.errors = body['errors']
+        return body['created'], body['updated'], body['skipped']
+
+    def test_reupload_reports_existing_orders(self):
+        content = self.manifest(40)
+        self.assertEqual(self.upload(content), (40, 0, 0))
+        self.assertEqual(self.upload(content), (0, 0, 0))
+        order_nos = ShipmentRecord.objects.filter(user=self.user).order_by('id').values_list('order_no', flat=True)
+        self.assertEqual(self.errors, [
+            {'row': row, 'error': f'Order {order_no} already exists'} for row, order_no in enumerate(order_nos, 2)
+        ])
+        self.assertEqual(ShipmentRecord.objects.filter(user=self.user).count(), 40)
+
+    def test_upsert_updates_pending_and_skips_purchased(self):
+        content = self.manifest(40)
+        self.upload(content)
+        records = ShipmentRecord.objects.filter(user=self.user).order_by('id')
+        purchased, pending = records[0], records[1]
+        ShipmentRecord.objects.filter(pk=purchased.pk).update(status='processed', to_city='Kept')
+        ShipmentRecord.objects.filter(pk=pending.pk).update(to_city='Stale')
+
+        extra = self.manifest(41).splitlines()[-1]
+        self.assertEqual(self.upload(content + extra + '\n', mode='upsert'), (1, 39, 1))
+        self.assertEqual(ShipmentRecord.objects.get(pk=purchased.pk).to_city, 'Kept')
+        self.assertNotEqual(ShipmentRecord.objects.get(pk=pending.pk).to_city, 'Stale')
+        self.assertEqual(records.count(), 41)
+
+    def test_last_duplicate_row_in_a_manifest_wins(self):
+        lines = self.manifest(3).splitlines()
+        changed = lines[-1].split(',')
+        changed[11] = 'Last City'
+        content = '\n'.join(lines + [','.join(changed)]) + '\n'
+        self.assertEqual(self.upload(content), (3, 0, 1))
+        self.assertTrue(ShipmentRecord.objects.filter(user=self.user, to_city='Last City').exists())
+
+    def test_rows_without_order_numbers_never_collide(self):
+        lines = self.manifest(5).splitlines()
+        rows = [line.split(',') for line in lines[2:]]
+        for row in rows:
+            row[21] = ''
+        content = '\n'.join(lines[:2] + [','.join(row) for row in rows]) + '\n'
+        self.assertEqual(self.upload(content), (5, 0, 0))
+        self.assertEqual(self.upload(content), (5, 0, 0))
+
+    def test_query_count_does_not_grow_with_duplicates(self):
+        query_counts = []
+        for rows in (20, 400):
+            content = self.manifest(rows, seed=rows)
+            self.upload(content)
+            with CaptureQueriesContext(connection) as queries:
+                self.upload(content, mode='upsert')
+            # The upsert itself is batched by the backend's parameter limit
+            query_counts.append(len([q for q in queries if not q['sql'].startswith('INSERT')]))
+        self.assertEqual(query_counts[0], query_counts[1])
+
+
+class JWTAuthenticationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='jwt', password='secret-password')
+        cls.profile = UserProfile.objects.create(user=cls.user, account_balance=decimal.Decimal('25.00'))
+
+    def setUp(self):
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+        self.client = APIClient()
+        response = self.client.post('/api/auth/login/', {'username': 'jwt', 'password': 'secret-password'})
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+
+    def auth_queries(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response, [
+            q['sql'] for q in queries
+            if 'auth_user' in q['sql'] and 'shipping_shipmentrecord' not in q['sql']
+        ]
+
+    def test_polling_endpoints_authenticate_from_claims(self):
+        for path in ('/api/shipments/summary/', '/api/shipments/changes/'):
+            _, queries = self.auth_queries(path)
+            self.assertEqual(queries, [])
+
+    @override_settings(AUTH_USER_CACHE_TTL=0)
+    def test_profile_is_loaded_with_the_user(self):
+        response, queries = self.auth_queries('/api/auth/profile/')
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(response.data['profile']['account_balance'], '25.00')
+
+    def test_cached_users_cost_no_queries_until_they_change(self):
+        self.auth_queries('/api/auth/profile/')
+        response, queries = self.auth_queries('/api/auth/profile/')
+        self.assertEqual(queries, [])
+        self.assertEqual(response.data['user']['username'], 'jwt')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.account_balance = decimal.Decimal('30.00')
+            self.profile.save()
+        response, queries = self.auth_queries('/api/auth/profile/')
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(response.data['profile']['account_balance'], '30.00')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, 401)
+
+
+@override_settings(METRICS_TOKEN='secret')
+class MetricsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_purchase_account('metrics', decimal.Decimal('10.00'), ['4.00'] * 3)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def scrape(self):
+        response = self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if not line.startswith('#'):
+                sample, value = line.rsplit(' ', 1)
+                samples[sample] = float(value)
+        return samples
+
+    def test_views_are_measured(self):
+        before = self.scrape()
+        response = self.client.get('/api/shipments/')
+        body = b''.join(response.streaming_content)
+        self.client.get('/api/shipments/?page_size=2')
+        after = self.scrape()
+
+        def delta(sample):
+            return after.get(sample, 0) - before.get(sample, 0)
+
+        self.assertEqual(delta('shipping_requests_total{view="shipment-list",method="GET",status="200"}'), 2)
+        self.assertEqual(delta('shipping_request_duration_seconds_count{view="shipment-list",method="GET"}'), 2)
+        self.assertGreaterEqual(delta('shipping_db_queries_total{view="shipment-list"}'), 2)
+        self.assertGreater(delta('shipping_response_bytes_total{view="shipment-list"}'), len(body))
+        self.assertEqual(delta('shipping_rows_total{view="shipment-list",stage="serialized"}'), 5)
+
+    def test_metrics_need_the_token(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 401)
+        self.assertEqual(self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer guess').status_code, 401)
+        with override_settings(METRICS_TOKEN='', DEBUG=False):
+            self.assertEqual(self.client.get('/api/metrics/').status_code, 404)
+
+    def test_slow_requests_are_profiled(self):
+        profiles = tempfile.TemporaryDirectory()
+        self.addCleanup(profiles.cleanup)
+        with override_settings(METRICS_PROFILE_DIR=profiles.name, METRICS_PROFILE_RATE=1.0,
+                               METRICS_PROFILE_MIN_SECONDS=0):
+            self.client.get('/api/shipments/summary/')
+        with override_settings(METRICS_PROFILE_DIR=profiles.name, METRICS_PROFILE_RATE=1.0,
+                               METRICS_PROFILE_MIN_SECONDS=60):
+            self.client.get('/api/shipments/summary/')
+        dumps = os.listdir(profiles.name)
+        self.assertEqual(len(dumps), 1)
+        self.assertRegex(dumps[0], r'-GET-shipment-summary-\d+ms\.prof$')
+
+
+class ImportJobTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='imports', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def queue(self, rows=48):
+        """Queue a manifest of `rows` good rows and two bad ones; returns the job id"""
+        manifest = io.StringIO()
+        write_manifest(manifest, rows, seed=6)
+        csv.writer(manifest).writerows([manifest_row('BAD-1', lbs='inf'), manifest_row('BAD-2', oz='inf')])
+        upload = SimpleUploadedFile('manifest.csv', manifest.getvalue().encode(), content_type='text/csv')
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/api/imports/', {'file': upload, 'mode': 'create'})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual((response.data['status'], response.data['filename']), ('queued', 'manifest.csv'))
+        # The import is only handed to the worker pool once the job is committed
+        self.assertEqual(len(callbacks), 1)
+        return response.data['id']
+
+    def run_import(self, job_id, **kwargs):
+        # Worker threads drop their connections; here that would be the test's own
+        with mock.patch.object(jobs, 'close_old_connections'), mock.patch.object(jobs.connections, 'close_all'):
+            jobs.run_import(job_id, **kwargs)
+
+    def poll(self, job_id):
+        response = self.client.get(f'/api/imports/{job_id}/')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_job_reports_progress_per_chunk(self):
+        job_id = self.queue()
+        self.assertEqual((self.poll(job_id)['status'], self.poll(job_id)['rows_parsed']), ('queued', 0))
+
+        progress = []
+        import_rows = jobs.import_rows
+
+        def recording_import_rows(job, *args, **kwargs):
+            import_rows(job, *args, **kwargs)
+            progress.append((self.poll(job_id)['status'], self.poll(job_id)['rows_parsed']))
+
+        with mock.patch.object(jobs, 'import_rows', recording_import_rows):
+            self.run_import(job_id, chunksize=20)
+        self.assertEqual(progress, [('running', 20), ('running', 40), ('running', 50)])
+
+        job = self.poll(job_id)
+        self.assertEqual(
+            (job['status'], job['rows_parsed'], job['rows_inserted'], job['rows_skipped']),
+            ('completed', 50, 48, 0)
+        )
+        self.assertEqual(job['message'], 'Successfully imported 48 records')
+        self.assertEqual([error['row'] for error in job['errors']], [50, 51])
+        self.assertIsNotNone(job['started_at'])
+        self.assertIsNotNone(job['finished_at'])
+        self.assertEqual(ShipmentRecord.objects.filter(user=self.user).count(), 48)
+        self.assertEqual(ImportJob.objects.get(pk=job_id).file.name, '')
+
+        # Importing the same manifest again reports the existing orders
+        job_id = self.queue()
+        self.run_import(job_id, chunksize=20)
+        job = self.poll(job_id)
+        self.assertEqual((job['rows_inserted'], job['rows_skipped']), (0, 0))
+        self.assertEqual([error['row'] for error in job['errors']], list(range(2, 52)))
+        self.assertTrue(all(error['error'].endswith(' already exists') for error in job['errors'][:48]))
+
+    def test_stored_errors_are_capped(self):
+        self.run_import(self.queue())
+        # Importing again reports all 48 existing orders, plus the 2 bad rows
+        job_id = self.queue()
+        with mock.patch.object(jobs, 'MAX_JOB_ERRORS', 30), CaptureQueriesContext(connection) as queries:
+            self.run_import(job_id, chunksize=10)
+        updates = [
+            query['sql'] for query in queries
+            if query['sql'].startswith('UPDATE "shipping_importjob"') and 'error_count' in query['sql']
+        ]
+
+        job = self.poll(job_id)
+        self.assertEqual((job['error_count'], len(job['errors'])), (50, 30))
+        self.assertEqual([error['row'] for error in job['errors']], list(range(2, 32)))
+        # The list is written by the chunks that add to it, and not after that
+        self.assertEqual(['"errors"' in sql for sql in updates], [True] * 3 + [False] * 2)
+
+    def test_failed_job_keeps_committed_chunks(self):
+        job_id = self.queue()
+        import_rows = jobs.import_rows
+        calls = []
+
+        def failing_import_rows(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 2:
+                raise ValueError('Disk full')
+            import_rows(*args, **kwargs)
+
+        with mock.patch.object(jobs, 'import_rows', failing_import_rows):
+            self.run_import(job_id, chunksize=20)
+
+        job = self.poll(job_id)
+        self.assertEqual((job['status'], job['message'], job['rows_inserted']), ('failed', 'Disk full', 20))
+        self.assertIsNotNone(job['finished_at'])
+        self.assertEqual(ShipmentRecord.objects.filter(user=self.user).count(), 20)
+        self.assertEqual(ImportJob.objects.get(pk=job_id).file.name, '')
+
+    def test_jobs_are_private_to_their_user(self):
+        job_id = self.queue()
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user(username='imports-other', password='x'))
+        self.assertEqual(other.get(f'/api/imports/{job_id}/').status_code, 404)
+        self.assertEqual(other.get('/api/imports/').data, [])
+        self.assertEqual([job['id'] for job in self.client.get('/api/imports/').data], [job_id])
+
+    def test_requires_a_file_and_a_known_mode(self):
+        self.assertEqual(self.client.post('/api/imports/', {}).status_code, 400)
+        upload = SimpleUploadedFile('manifest.csv', b'', content_type='text/csv')
+        self.assertEqual(self.client.post('/api/imports/', {'file': upload, 'mode': 'merge'}).status_code, 400)
+        self.assertFalse(ImportJob.objects.exists())
+
+
+class ChunkedUploadTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='chunks', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def append(self, job_id, offset, data):
+        return self.client.put(
+            f'/api/imports/{job_id}/chunks/?offset={offset}', data, content_type='application/octet-stream'
+        )
+
+    def test_rows_are_imported_while_the_upload_arrives(self):
+        manifest = io.StringIO()
+        write_manifest(manifest, 50, seed=4)
+        content = manifest.getvalue().encode()
+        # Drop the final newline: the last row is only complete once finalized
+        content = content[:-1]
+        middle = len(content) // 2
+
+        response = self.client.post('/api/imports/uploads/', {'filename': 'big.csv', 'size': len(content)}, format='json')
+        self.assertEqual(response.status_code, 201)
+        job_id = response.data['id']
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(self.append(job_id, 0, content[:10]).data, {'bytes_received': 10})
+        self.assertEqual(len(callbacks), 1)
+        import_received(job_id)
+        self.assertEqual(ImportJob.objects.get(pk=job_id).bytes_parsed, 0)
+
+        self.append(job_id, 10, content[10:middle])
+        import_received(job_id)
+        complete_rows = content[:middle].count(b'\n') - 2
+        self.assertEqual(ShipmentRecord.objects.filter(user=self.user).count(), complete_rows)
+
+        # A resend from a stale offset is refused with the offset to resume from
+        response = self.append(job_id, 10, content[10:])
+        self.assertEqual((response.status_code, response.data['bytes_received']), (409, middle))
+        self.append(job_id, middle, content[middle:])
+        import_received(job_id)
+        self.assertEqual(ShipmentRecord.objects.filter(user=self.user).count(), 49)
+        self.assertEqual(ImportJob.objects.get(pk=job_id).status, 'uploading')
+
+        self.assertEqual(self.client.post(f'/api/imports/{job_id}/finalize/', {'size': 1}, format='json').status_code, 409)
+        response = self.client.post(f'/api/imports/{job_id}/finalize/', format='json')
+        self.assertEqual(response.status_code, 202)
+        import_received(job_id)
+
+        job = ImportJob.objects.get(pk=job_id)
+        self.assertEqual((job.status, job.rows_parsed, job.rows_inserted, job.file.name), ('completed', 50, 50, ''))
+        self.assertEqual(self.append(job_id, len(content), b'x').status_code, 409)
+
+    def test_body_is_written_outside_the_row_lock(self):
+        job = create_upload(self.user, 'big.csv')
+        savepoints = len(connection.savepoint_ids)
+        seen = []
+
+        class Body(io.BytesIO):
+            def read(body, size=-1):
+                if not seen:
+                    # No transaction is open, but the upload is reserved
+                    seen.append(len(connection.savepoint_ids))
+                    for attempt in (
+                        lambda: append_upload(job, 0, io.BytesIO(b'y'), 1),
+                        lambda: finalize_upload(job),
+                    ):
+                        with self.assertRaises(UploadError) as raised:
+                            attempt()
+                        self.assertEqual(raised.exception.status, 409)
+                return super().read(size)
+
+        job = append_upload(job, 0, Body(b'header\n'), 7)
+        self.assertEqual(seen, [savepoints])
+        job.refresh_from_db()
+        self.assertEqual((job.bytes_received, job.appending_since), (7, None))
+
+        # A reservation left by a dropped append runs out
+        ImportJob.objects.filter(pk=job.pk).update(appending_since=timezone.now() - APPEND_LEASE * 2)
+        self.assertEqual(append_upload(job, 7, io.BytesIO(b'more\n'), 5).bytes_received, 12)
+
+    def test_polling_restarts_an_import_whose_worker_died(self):
+        job = create_upload(self.user, 'big.csv')
+        executor = mock.Mock()
+        with mock.patch.object(uploads, 'get_executor', return_value=executor):
+            for job_status, parsing_since, restarted in (
+                ('uploading', None, False),
+                ('uploading', timezone.now(), False),
+                ('uploading', timezone.now() - PARSE_LEASE * 2, True),
+                ('running', timezone.now(), False),
+                # Finalized, but the worker died before taking the lease
+                ('running', None, True),
+                ('completed', None, False),
+            ):
+                executor.reset_mock()
+                ImportJob.objects.filter(pk=job.pk).update(status=job_status, parsing_since=parsing_since)
+                self.assertEqual(self.client.get(f'/api/imports/{job.pk}/').status_code, 200)
+                self.assertEqual(executor.submit.call_args_list, [mock.call(run_upload_import, job.pk)] if restarted else [])
+
+
+class AddressValidationTests(TestCase):
+
+    def test_normalize_address(self):
+        cases = [
+            (('Wallace', 'NC', '28466-9087'), ('Wallace', 'NC', '28466-9087', 'valid')),
+            (('st. louis', 'Missouri', '63101'), ('Saint Louis', 'MO', '63101', 'corrected')),
+            (('', 'california', '90012'), ('Los Angeles', 'CA', '90012', 'corrected')),
+            (('Boston', 'MA', '2134'), ('Boston', 'MA', '02134', 'corrected')),
+            (('Allston', 'MA', '021341234'), ('Allston', 'MA', '02134-1234', 'corrected')),
+            (('Miami', 'GA', '33101'), ('Miami', 'GA', '33101', 'mismatch')),
+            (('Nowhere', 'CA', '90012'), ('Nowhere', 'CA', '90012', 'mismatch')),
+            (('Aiea', 'HI', '00000'), ('Aiea', 'HI', '00000', 'unknown_zip')),
+            (('Springfield', 'ZZ', 'N/A'), ('Springfield', 'ZZ', 'N/A', 'invalid')),
+        ]
+        for address, expected in cases:
+            self.assertEqual(normalize_address(*address), expected)
+
+    def test_upload_and_edit_record_address_status(self):
+        user = User.objects.create_user(username='addresses', password='x')
+        client = APIClient()
+        client.force_authenticate(user)
+        manifest = io.StringIO()
+        write_manifest(manifest, 3, seed=2)
+        lines = manifest.getvalue().splitlines()
+        rows = [line.split(',') for line in lines[2:]]
+        for row, (city, zip_code, state) in zip(rows, [
+            ('Wallace', '28466', 'NC'), ('saint louis', '63101', 'mo'), ('Wallace', '28466', 'TX'),
+        ]):
+            row[11:14] = [city, zip_code, state]
+        upload = io.BytesIO(('\n'.join(lines[:2] + [','.join(row) for row in rows]) + '\n').encode())
+        upload.name = 'manifest.csv'
+        response = client.post('/api/upload/', {'file': upload}, format='multipart')
+        b''.join(response.streaming_content)
+
+        records = ShipmentRecord.objects.filter(user=user).order_by('order_no')
+        self.assertEqual(
+            list(records.values_list('to_city', 'to_state', 'address_status')),
+            [('Wallace', 'NC', 'valid'), ('Saint Louis', 'MO', 'corrected'), ('Wallace', 'TX', 'mismatch')],
+        )
+
+        mismatch = records[2]
+        response = client.put(f'/api/shipments/{mismatch.pk}/', {'to_state': 'north carolina'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['to_state'], response.data['address_status']), ('NC', 'corrected'))
+
+
+@override_settings(SHIPMENT_SYNC_OVERLAP=0)
+class ShipmentChangesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='changes', password='x')
+        cls.other = User.objects.create_user(username='changes-other', password='x')
+        manifest = io.StringIO()
+        write_manifest(manifest, 30, seed=9)
+        manifest.seek(0)
+        for chunk in read_manifest(manifest):
+            columns = parse_chunk(chunk)[0]
+            insert_chunk(columns, cls.user)
+            insert_chunk(columns, cls.other)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def changes(self, since=None):
+        response = self.client.get('/api/shipments/changes/', {'since': since} if since else {})
+        self.assertEqual(response.status_code, 200)
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_without_token_returns_everything(self):
+        body = self.changes()
+        self.assertTrue(body['reset'])
+        self.assertEqual(len(body['records']), 30)
+        self.assertIn('updated_at', body['records'][0])
+
+    def test_only_changed_and_deleted_rows_since_token(self):
+        token = self.changes()['token']
+        ids = list(ShipmentRecord.objects.filter(user=self.user).order_by('id').values_list('id', flat=True))
+
+        self.client.put(f'/api/shipments/{ids[0]}/', {'to_city': 'Edited'}, format='json')
+        self.client.patch('/api/shipments/bulk/update/', {'record_ids': ids[1:3], 'weight_oz': 3}, format='json')
+        self.client.post('/api/shipments/bulk/delete/', {'record_ids': ids[3:5]}, format='json')
+        self.client.delete(f'/api/shipments/{ids[5]}/delete/')
+        other_id = ShipmentRecord.objects.filter(user=self.other).values_list('id', flat=True)[0]
+        ShipmentRecord.objects.filter(pk=other_id).update(to_city='Elsewhere', updated_at=timezone.now())
+
+        body = self.changes(token)
+        self.assertFalse(body['reset'])
+        self.assertEqual(sorted(record['id'] for record in body['records']), ids[0:3])
+        self.assertEqual(sorted(body['deleted']), ids[3:6])
+
+        body = self.changes(body['token'])
+        self.assertEqual((body['records'], body['deleted']), ([], []))
+
+    def test_purchase_bumps_updated_at(self):
+        token = self.changes()['token']
+        record = ShipmentRecord.objects.filter(user=self.user).order_by('id').first()
+        UserProfile.objects.create(user=self.user, account_balance=1000)
+        response = self.client.post('/api/purchase/', {'record_ids': [record.pk]}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        body = self.changes(token)
+        self.assertEqual([(r['id'], r['status']) for r in body['records']], [(record.pk, 'processed')])
+
+    def test_rows_committed_after_a_token_was_issued_are_sent(self):
+        # A client syncs while a manifest import has stamped its rows but not yet committed
+        tokens = []
+        write = ingest.import_chunk
+
+        def import_chunk(*args, **kwargs):
+            counts = write(*args, **kwargs)
+            tokens.append(encode_token(timezone.now()))
+            return counts
+
+        manifest = io.StringIO()
+        write_manifest(manifest, 3, seed=10)
+        manifest = io.BytesIO(manifest.getvalue().replace('ORD-', 'LATE-').encode())
+        with mock.patch.object(ingest, 'import_chunk', import_chunk):
+            counts, _ = import_manifest(manifest, self.user)
+        self.assertEqual(counts['created'], 3)
+
+        body = self.changes(tokens[-1])
+        order_nos = sorted(record['order_no'] for record in body['records'])
+        self.assertEqual(order_nos, ['LATE-10-0', 'LATE-10-1', 'LATE-10-2'])
+
+    def test_delete_all_forces_a_reset(self):
+        token = self.changes()['token']
+        self.client.post('/api/shipments/bulk/delete/', {'record_ids': [
+            ShipmentRecord.objects.filter(user=self.user).values_list('id', flat=True)[0]
+        ]}, format='json')
+        self.client.delete('/api/shipments/delete-all/')
+        self.assertEqual(ShipmentTombstone.objects.filter(user=self.user).count(), 1)
+
+        body = self.changes(token)
+        self.assertTrue(body['reset'])
+        self.assertEqual((body['records'], body['deleted']), ([], []))
+
+    @override_settings(SHIPMENT_TOMBSTONE_DAYS=1)
+    def test_token_older_than_tombstones_forces_a_reset(self):
+        token = encode_token(timezone.now() - timezone.timedelta(days=2))
+        self.assertTrue(self.changes(token)['reset'])
+
+    def test_invalid_token(self):
+        response = self.client.get('/api/shipments/changes/', {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ReplicaRouterTests(TestCase):
+
+    def test_decorated_views_read_from_the_replica(self):
+        routed = []
+
+        def body():
+            routed.append(router.db_for_read(ShipmentRecord))
+            yield b'[]'
+
+        @replica_reads
+        def view():
+            routed.append(router.db_for_read(ShipmentRecord))
+            return StreamingHttpResponse(body())
+
+        with override_settings(READ_REPLICA_DATABASE='replica'):
+            response = view()
+            routed.append(router.db_for_read(ShipmentRecord))
+            b''.join(response.streaming_content)
+            # Writes always go to the primary
+            routed.append(router.db_for_write(ShipmentRecord))
+        self.assertEqual(routed, ['replica', 'default', 'replica', 'default'])
+
+    @override_settings(READ_REPLICA_DATABASE='default')
+    def test_routed_list_and_summary(self):
+        cache.clear()
+        user = create_purchase_account('replica', balance=10, prices=[2, 3])
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get('/api/shipments/')
+        self.assertEqual(len(json.loads(b''.join(response.streaming_content))), 2)
+
+        # The cached summary is never built from the replica
+        routed = []
+        build_summary = summary.build_summary
+
+        def routed_build_summary(user):
+            routed.append(router.db_for_read(ShipmentRecord))
+            return build_summary(user)
+
+        with override_settings(READ_REPLICA_DATABASE='replica'), \
+                mock.patch.object(summary, 'build_summary', routed_build_summary):
+            self.assertEqual(client.get('/api/shipments/summary/').json()['pending_cost'], '5.00')
+        self.assertEqual(routed, ['default'])
+
+
+class ShipmentSummaryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_purchase_account('summary', balance=100, prices=[5, 7, 11])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def summary(self):
+        response = self.client.get('/api/shipments/summary/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_counts_costs_and_balance(self):
+        self.assertEqual(self.summary(), {
+            'total_shipments': 3,
+            'status_counts': {'pending': 3, 'processed': 0, 'error': 0},
+            'pending_cost': '23.00',
+            'purchased_cost': '0.00',
+            'account_balance': '100.00',
+        })
+
+    def test_cached_until_a_write_invalidates_it(self):
+        self.summary()
+        with CaptureQueriesContext(connection) as queries:
+            self.summary()
+        self.assertEqual(len(queries), 0)
+
+        record_id = ShipmentRecord.objects.filter(user=self.user, shipping_price=5).get().pk
+        # Label warmup would render on a worker thread
+        with mock.patch('shipping.views.enqueue_label_warmup'), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/purchase/', {'record_ids': [record_id]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        summary = self.summary()
+        self.assertEqual(summary['status_counts']['processed'], 1)
+        self.assertEqual(summary['pending_cost'], '18.00')
+        self.assertEqual(summary['account_balance'], '95.00')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete('/api/shipments/delete-all/')
+        self.assertEqual(self.summary()['total_shipments'], 0)
+
+
+class PresetCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='presets', password='x')
+        cls.other = User.objects.create_user(username='presets-other', password='x')
+        SavedPackage.objects.create(user=cls.user, name='Small', length=6, width=6, height=6, weight_oz=8)
+
+    def setUp(self):
+        # Presets are only cached in a cache shared between processes
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        settings_override = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': cache_dir.name,
+        }})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_unchanged_list_is_served_from_cache_and_revalidated(self):
+        first = self.client.get('/api/packages/')
+        self.assertEqual([package['name'] for package in first.json()], ['Small'])
+        etag = first['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get('/api/packages/')
+            not_modified = self.client.get('/api/packages/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], etag)
+
+    def test_writes_change_the_etag(self):
+        etag = self.client.get('/api/addresses/')['ETag']
+        address = {
+            'name': 'Warehouse', 'first_name': 'Print', 'last_name': 'TTS',
+            'address_line1': '502 W Arrow Hwy', 'city': 'San Dimas', 'state': 'CA', 'zip_code': '91773',
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            created = self.client.post('/api/addresses/', address, format='json')
+        self.assertEqual(created.status_code, 201)
+
+        response = self.client.get('/api/addresses/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([a['name'] for a in response.json()], ['Warehouse'])
+
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/addresses/{created.json()["id"]}/', {'city': 'Pomona'}, format='json')
+        response = self.client.get('/api/addresses/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json()[0]['city'], 'Pomona')
+
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/addresses/{created.json()["id"]}/')
+        self.assertEqual(self.client.get('/api/addresses/', HTTP_IF_NONE_MATCH=etag).json(), [])
+
+    def test_lists_are_per_user(self):
+        self.client.get('/api/packages/')
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.get('/api/packages/').json(), [])
+
+    def test_per_process_cache_is_not_used(self):
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.client.get('/api/packages/')
+            # Another worker process adds a package; this one must not miss it
+            SavedPackage.objects.create(user=self.user, name='Large', length=12, width=12, height=12)
+            response = self.client.get('/api/packages/')
+        self.assertNotIn('ETag', response)
+        self.assertEqual(sorted(package['name'] for package in response.json()), ['Large', 'Small'])
+
+
+class ApplyPresetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='apply', password='x')
+        other = User.objects.create_user(username='apply-other', password='x')
+        ShipmentRecord.objects.bulk_create([
+            ShipmentRecord(
+                user=cls.user,
+                to_first_name='Salina', to_last_name='Dixon', to_address='61 Sunny Trail Rd',
+                to_city='Wallace', to_zip='28466', to_state=['NC', 'CA'][i % 2],
+                shipping_service=['ground', 'priority', 'express'][i % 3],
+                status='processed' if i < 4 else 'pending',
+                length=6, width=6, height=6,
+                order_no=f'ORD-{i}',
+            )
+            for i in range(60)
+        ])
+        cls.package = SavedPackage.objects.create(
+            user=cls.user, name='Box', length=12, width=10, height=4, weight_lbs=2, weight_oz=3
+        )
+        cls.address = SavedAddress.objects.create(
+            user=cls.user, name='Warehouse', first_name='Print', last_name='TTS',
+            address_line1='502 W Arrow Hwy', city='San Dimas', state='CA', zip_code='91773'
+        )
+        cls.other_package = SavedPackage.objects.create(
+            user=other, name='Box', length=1, width=1, height=1, weight_oz=1
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def apply(self, kind, expected_status=200, **data):
+        response = self.client.post(f'/api/shipments/bulk/apply-{kind}/', data, format='json')
+        self.assertEqual(response.status_code, expected_status)
+        if expected_status == 200:
+            return json.loads(b''.join(response.streaming_content))
+        return response.json()
+
+    def test_package_by_filter_reprices_in_one_update(self):
+        with CaptureQueriesContext(connection) as queries:
+            rows = self.apply('package', package_id=self.package.pk, filter={'to_state': 'CA'})
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('UPDATE')]), 1)
+
+        california = ShipmentRecord.objects.filter(user=self.user, to_state='CA')
+        self.assertEqual(len(rows), california.exclude(status='processed').count())
+        for record in california:
+            if record.status == 'processed':
+                self.assertEqual((record.weight_lbs, record.shipping_price), (0, 0))
+                continue
+            self.assertEqual((record.length, record.weight_lbs, record.weight_oz), (12, 2, 3))
+            self.assertEqual(record.shipping_price, record.calculate_shipping_price())
+        self.assertFalse(ShipmentRecord.objects.filter(user=self.user, to_state='NC', weight_lbs=2).exists())
+
+    def test_zoned_rates_reprice_from_returned_rows(self):
+        with mock.patch('shipping.rates._engine', TableRateEngine('2026-10')):
+            self.apply('package', package_id=self.package.pk, filter={'status': 'pending'})
+            for record in ShipmentRecord.objects.filter(user=self.user, status='pending'):
+                self.assertEqual(record.shipping_price, record.calculate_shipping_price())
+
+    def test_address_by_record_ids(self):
+        ids = list(ShipmentRecord.objects.filter(user=self.user, status='pending').values_list('id', flat=True)[:5])
+        rows = self.apply('address', address_id=self.address.pk, record_ids=ids)
+        self.assertEqual(sorted(row['id'] for row in rows), sorted(ids))
+        self.assertEqual(rows[0]['from_address_formatted'], 'Print TTS, 502 W Arrow Hwy, San Dimas, CA 91773')
+
+    def test_invalid_requests(self):
+        self.apply('package', 404, package_id=self.other_package.pk, record_ids=[1])
+        self.apply('address', 404, address_id='abc', record_ids=[1])
+        self.apply('address', 400, address_id=self.address.pk)
+        self.apply('address', 400, address_id=self.address.pk, filter={'to_zip': '28466'})
+        self.apply('address', 400, address_id=self.address.pk, filter={'status': ''})
+        self.apply('address', 404, address_id=self.address.pk, record_ids=[-1, -2])
@@ -0,0 +1,253 @@
+"""
+Chunked, resumable manifest uploads.
+
+An upload is an ImportJob in the 'uploading' state. The client appends
+the file piece by piece, each at the offset the server says it holds, so
+after a dropped connection it asks for the job and carries on from
+bytes_received. Pieces are streamed straight into the job's file on local
+disk. Finalizing checks the size and lets the import finish.
+
+Rows are imported while the rest of the file is still arriving. After
+every append a worker imports the complete rows between bytes_parsed and
+the last row boundary received. Each piece of rows is committed together
+with the new bytes_parsed, so nothing is imported twice. One worker at a
+time holds an upload's lease (parsing_since); appends that arrive
+meanwhile are picked up by that worker before it lets go. A worker that
+dies leaves its lease to run out, and polling the job then starts a new
+one.
+"""
+import io
+import os
+from datetime import timedelta
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from pandas.errors import EmptyDataError
+from .ingest import read_manifest
+from .jobs import get_executor, import_rows
+from .models import ImportJob
+
+# Largest piece accepted by one append
+MAX_UPLOAD_CHUNK = 64 * 1024 * 1024
+
+# Bytes read from the request per write
+COPY_BUFFER = 1024 * 1024
+
+# Bytes of received rows imported per transaction
+IMPORT_PIECE_SIZE = 4 * 1024 * 1024
+
+# A worker that has held an upload longer than this is presumed dead
+PARSE_LEASE = timedelta(minutes=10)
+
+# An append still being written after this long is presumed dropped
+APPEND_LEASE = timedelta(minutes=10)
+
+
+class UploadError(Exception):
+    """A chunked upload request that cannot be applied; `status` is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def create_upload(user, filename, mode='create', size=None):
+    """Start an upload with an empty file on disk"""
+    job = ImportJob(
+        user=user, filename=filename[:255], mode=mode, status='uploading',
+        upload_size=size, started_at=timezone.now(),
+    )
+    job.file.save(f'{job.pk}.csv', ContentFile(b''), save=False)
+    job.save()
+    return job
+
+def append_upload(job, offset, stream, length):
+    """
+    Write `length` bytes from `stream` at `offset`, which must be exactly
+    what the upload holds so far. Returns the job with bytes_received
+    updated; a connection dropped midway keeps what arrived.
+
+    The row is locked only to check the offset and reserve the upload
+    (appending_since); the body is written outside any transaction and
+    bytes_received committed in a second, short one.
+    """
+    if length > MAX_UPLOAD_CHUNK:
+        raise UploadError(f'Chunks are limited to {MAX_UPLOAD_CHUNK} bytes', status=413)
+    with transaction.atomic():
+        job = ImportJob.objects.select_for_update().get(pk=job.pk)
+        if job.status != 'uploading':
+            raise UploadError(f'Upload is {job.status}', status=409)
+        if offset != job.bytes_received:
+            raise UploadError(f'Expected offset {job.bytes_received}', status=409)
+        if job.upload_size is not None and offset + length > job.upload_size:
+            raise UploadError(f'Chunk goes past the declared size of {job.upload_size} bytes')
+        now = timezone.now()
+        if job.appending_since is not None and job.appending_since >= now - APPEND_LEASE:
+            raise UploadError('Another chunk is being appended', status=409)
+        job.appending_since = now
+        ImportJob.objects.filter(pk=job.pk).update(appending_since=now)
+
+    written = 0
+    try:
+        with open(job.file.path, 'r+b') as file:
+            # Drop anything an interrupted append left past the offset
+            file.seek(offset)
+            file.truncate()
+            while written < length:
+                piece = stream.read(min(COPY_BUFFER, length - written))
+                if not piece:
+                    break
+                file.write(piece)
+                written += len(piece)
+            file.flush()
+            os.fsync(file.fileno())
+    finally:
+        with transaction.atomic():
+            # Only while the reservation is still ours: an append that
+            # outlived APPEND_LEASE may have been taken over
+            released = ImportJob.objects.filter(pk=job.pk, appending_since=job.appending_since).update(
+                bytes_received=offset + written, appending_since=None
+            )
+            if released:
+                enqueue_upload_import(job)
+    if not released:
+        raise UploadError('Chunk took too long and was taken over by another append', status=409)
+    job.bytes_received = offset + written
+    job.appending_since = None
+    return job
+
+def finalize_upload(job, size=None):
+    """
+    Mark the upload complete so its last rows get imported. `size`, or the
+    size declared up front, must match what was received.
+    """
+    with transaction.atomic():
+        job = ImportJob.objects.select_for_update().get(pk=job.pk)
+        if job.status != 'uploading':
+            raise UploadError(f'Upload is {job.status}', status=409)
+        if job.appending_since is not None and job.appending_since >= timezone.now() - APPEND_LEASE:
+            raise UploadError('A chunk is still being appended', status=409)
+        expected = size if size is not None else job.upload_size
+        if expected is not None and expected != job.bytes_received:
+            raise UploadError(f'Received {job.bytes_received} of {expected} bytes', status=409)
+        job.status = 'running'
+        ImportJob.objects.filter(pk=job.pk).update(status='running')
+        enqueue_upload_import(job)
+    return job
+
+def resume_upload_import(job):
+    """
+    Re-enqueue the import of an upload whose worker is gone: its lease ran
+    out, or it was finalized and nobody holds one. Extra workers are
+    harmless, as only one at a time gets the lease.
+    """
+    if job.status not in ('uploading', 'running'):
+        return
+    if job.parsing_since is None:
+        stalled = job.status == 'running'
+    else:
+        stalled = job.parsing_since < timezone.now() - PARSE_LEASE
+    if stalled:
+        get_executor().submit(run_upload_import, job.pk)
+
+
+def complete_rows_length(data):
+    """Length of the complete CSV rows at the start of `data`: up to the last newline outside quotes"""
+    end = data.rfind(b'\n')
+    while end >= 0 and data.count(b'"', 0, end) % 2:
+        end = data.rfind(b'\n', 0, end)
+    return end + 1
+
+def header_length(data):
+    """Length of the two header rows, or 0 if they have not fully arrived"""
+    first = data.find(b'\n')
+    second = data.find(b'\n', first + 1) if first >= 0 else -1
+    return second + 1
+
+def import_received(job_id):
+    """
+    Import the upload's complete rows received so far, or everything once
+    it is finalized. Returns the (bytes_received, status) worked from.
+    """
+    jobs = ImportJob.objects.filter(pk=job_id)
+    job = ImportJob.objects.select_related('user').get(pk=job_id)
+    final = job.status == 'running'
+    # Stable across workers, so generated order numbers never depend on who parsed the row
+    order_prefix = f'ORDER-{job.pk.hex[:6]}'
+
+    with open(job.file.path, 'rb') as file:
+        while job.bytes_parsed < job.bytes_received:
+            file.seek(job.bytes_parsed)
+            data = file.read(min(job.bytes_received - job.bytes_parsed, IMPORT_PIECE_SIZE))
+            last = final and job.bytes_parsed + len(data) == job.bytes_received
+
+            if job.bytes_parsed == 0:
+                end = len(data) if last else header_length(data)
+                if not end:
+                    break
+                job.bytes_parsed = end
+                jobs.update(bytes_parsed=end)
+                continue
+
+            end = len(data) if last else complete_rows_length(data)
+            if not end:
+                if len(data) == IMPORT_PIECE_SIZE:
+                    raise ValueError(f'Row at byte {job.bytes_parsed} is longer than {IMPORT_PIECE_SIZE} bytes')
+                break
+            try:
+                chunk = read_manifest(io.BytesIO(data[:end]), chunksize=None, skiprows=0)
+            except EmptyDataError:
+                # Only blank lines
+                job.bytes_parsed += end
+                jobs.update(bytes_parsed=job.bytes_parsed)
+                continue
+            # Row numbers in errors and generated order numbers count from the top of the file
+            chunk.index += job.rows_parsed
+            job.bytes_parsed += end
+            import_rows(job, chunk, order_prefix, bytes_parsed=job.bytes_parsed)
+
+    if final and job.bytes_parsed == job.bytes_received:
+        jobs.update(
+            status='completed',
+            message=f'Successfully imported {job.rows_inserted} records',
+            finished_at=timezone.now(),
+        )
+        job.file.delete(save=False)
+        jobs.update(file='')
+    return job.bytes_received, job.status
+
+def enqueue_upload_import(job):
+    """Import what has arrived on the worker pool once the current transaction commits"""
+    transaction.on_commit(lambda: get_executor().submit(run_upload_import, job.pk))
+
+def run_upload_import(job_id):
+    """Take the upload's lease and import until no more rows have arrived"""
+    close_old_connections()
+    jobs = ImportJob.objects.filter(pk=job_id, status__in=['uploading', 'running'])
+    try:
+        while True:
+            now = timezone.now()
+            claimed = jobs.filter(
+                Q(parsing_since__isnull=True) | Q(parsing_since__lt=now - PARSE_LEASE)
+            ).update(parsing_since=now)
+            if not claimed:
+                # The worker holding the lease picks up what this one was queued for
+                return
+            try:
+                bytes_received, job_status = import_received(job_id)
+            except Exception as e:
+                job = ImportJob.objects.get(pk=job_id)
+                if job.file:
+                    job.file.delete(save=False)
+                jobs.update(status='failed', message=str(e), finished_at=timezone.now(), file='')
+                return
+            finally:
+                ImportJob.objects.filter(pk=job_id).update(parsing_since=None)
+
+            # Appends or a finalize that came in while the lease was held
+            if not jobs.exclude(bytes_received=bytes_received, status=job_status).exists():
+                return
+    finally:
+        # Idle worker threads keep no connection (or pool slot) open
+        connections.close_all()
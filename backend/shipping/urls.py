@@ -1,5 +1,6 @@
 from django.urls import path
 from . import views
+from .metrics import metrics_view
 
 urlpatterns = [
     # Authentication
@@ -18,18 +19,35 @@ urlpatterns = [
     
     # Shipments
     path('shipments/', views.get_shipments, name='shipment-list'),
+    path('shipments/summary/', views.get_shipment_summary, name='shipment-summary'),
+    path('shipments/changes/', views.get_shipment_changes, name='shipment-changes'),
+    path('shipments/export/<str:file_type>/', views.export_shipments, name='shipment-export'),
     path('shipments/<int:pk>/', views.update_shipment, name='shipment-detail'),
     path('shipments/<int:pk>/delete/', views.delete_shipment, name='shipment-delete'),
     path('shipments/bulk/update/', views.bulk_update_shipments, name='shipment-bulk-update'),
     path('shipments/bulk/delete/', views.bulk_delete_shipments, name='shipment-bulk-delete'),
+    path('shipments/bulk/apply-address/', views.apply_address, name='shipment-apply-address'),
+    path('shipments/bulk/apply-package/', views.apply_package, name='shipment-apply-package'),
     path('shipments/delete-all/', views.delete_all_shipments, name='delete_all_shipments'),
 
     # Upload
     path('upload/', views.upload_csv, name='upload-csv'),
+    path('imports/', views.import_jobs, name='import-list'),
+    path('imports/uploads/', views.start_upload, name='import-upload'),
+    path('imports/<uuid:pk>/', views.import_job_detail, name='import-detail'),
+    path('imports/<uuid:pk>/chunks/', views.upload_chunk, name='import-upload-chunk'),
+    path('imports/<uuid:pk>/finalize/', views.upload_finalize, name='import-upload-finalize'),
     
     # Purchase
     path('purchase/', views.purchase_shipments, name='purchase'),
+    path('labels/', views.download_labels, name='labels'),
+    
+    # Rates
+    path('rates/quote/', views.quote_rates, name='rates-quote'),
     
     # Template
     path('template/', views.download_template, name='download-template'),
+    
+    # Request metrics (Prometheus)
+    path('metrics/', metrics_view, name='metrics'),
 ]
\ No newline at end of file
@@ -1,36 +1,44 @@
 import csv
 import io
-import pandas as pd
 from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
 from django.db import transaction
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
+from django.utils import timezone
 from rest_framework import status, generics
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
-from .models import SavedAddress, SavedPackage, ShipmentRecord, UserProfile
+from .authentication import StatelessJWTAuthentication, tokens_for, forget_user
+from .models import SavedAddress, SavedPackage, ShipmentRecord, UserProfile, ImportJob
 from .serializers import (
     UserSerializer, RegisterSerializer, UserProfileSerializer,
     SavedAddressSerializer, SavedPackageSerializer, 
-    ShipmentRecordSerializer, BulkShipmentUpdateSerializer
+    ShipmentRecordSerializer, ShipmentRecordListSerializer, BulkShipmentUpdateSerializer,
+    ImportJobSerializer
 )
 from .permissions import IsOwner
-
-# Helper functions for safe conversion
-def safe_int(value, default=0):
-    try:
-        return int(float(value))
-    except (ValueError, TypeError):
-        return default
-
-def safe_float(value, default=0.0):
-    try:
-        return float(value)
-    except (ValueError, TypeError):
-        return default
+from .ingest import import_manifest, IMPORT_MODES, TEMPLATE_CATEGORY_ROW, TEMPLATE_COLUMN_ROW
+from .jobs import enqueue_import
+from .uploads import create_upload, append_upload, finalize_upload, resume_upload_import, UploadError
+from .filters import filter_shipments, is_id_list, select_shipments, selection_lookups, SelectionError
+from .pagination import ShipmentCursorPagination
+from .streaming import streaming_shipments_response, RECORDS
+from .export import export_response, EXPORT_FORMATS
+from .bulk import ordered_rows, update_returning, reprice_rows
+from .rates import get_rate_engine, quote_shipments, MAX_QUOTE_BATCH, QUOTE_FIELDS
+from .purchases import purchase_records, PurchaseError
+from .labels import purchased_labels, render_labels, labels_response, enqueue_label_warmup
+from .pdf import LABEL_FORMATS
+from .sync import shipment_changes, decode_token, delete_shipments, clear_shipments
+from .summary import shipment_summary, invalidate_summary
+from .presets import cached_presets, bump_preset_version, preset_etag
+from .addresses import normalize_address
+from .metrics import record_rows
+from .routers import replica_reads
 
 # ============== AUTHENTICATION VIEWS ==============
 
@@ -42,7 +50,7 @@ def register(request):
         user = serializer.save()
         
         # Generate tokens
-        refresh = RefreshToken.for_user(user)
+        refresh = tokens_for(user)
         
         return Response({
             'user': UserSerializer(user).data,
@@ -60,7 +68,7 @@ def login_view(request):
     user = authenticate(username=username, password=password)
     
     if user:
-        refresh = RefreshToken.for_user(user)
+        refresh = tokens_for(user)
         return Response({
             'user': UserSerializer(user).data,
             'refresh': str(refresh),
@@ -93,40 +101,75 @@ def get_user_profile(request):
         'profile': UserProfileSerializer(profile).data
     })
 
+# ============== PRESET CACHE ==============
+
+class PresetVersionMixin:
+    """Bump the user's preset version on every write"""
+    preset_kind = None
+    
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+        bump_preset_version(self.preset_kind, self.request.user.pk)
+    
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        bump_preset_version(self.preset_kind, self.request.user.pk)
+    
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        bump_preset_version(self.preset_kind, self.request.user.pk)
+
+class CachedPresetListMixin(PresetVersionMixin):
+    """List presets from the per-user cache, answering If-None-Match with 304"""
+    
+    def list(self, request, *args, **kwargs):
+        version, data = cached_presets(
+            self.preset_kind, request.user.pk,
+            lambda: list(self.get_serializer(self.get_queryset(), many=True).data)
+        )
+        if version is None:
+            return Response(data)
+        
+        etag = preset_etag(self.preset_kind, version)
+        response = get_conditional_response(request._request, etag=etag) or Response(data)
+        response['ETag'] = etag
+        # Let browsers keep the list but revalidate it on every use
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Authorization'])
+        return response
+
 # ============== SAVED ADDRESSES ==============
 
-class SavedAddressList(generics.ListCreateAPIView):
+class SavedAddressList(CachedPresetListMixin, generics.ListCreateAPIView):
     serializer_class = SavedAddressSerializer
     permission_classes = [IsAuthenticated]
+    preset_kind = 'addresses'
     
     def get_queryset(self):
         return SavedAddress.objects.filter(user=self.request.user)
-    
-    def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
 
-class SavedAddressDetail(generics.RetrieveUpdateDestroyAPIView):
+class SavedAddressDetail(PresetVersionMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = SavedAddressSerializer
     permission_classes = [IsAuthenticated, IsOwner]
+    preset_kind = 'addresses'
     
     def get_queryset(self):
         return SavedAddress.objects.filter(user=self.request.user)
 
 # ============== SAVED PACKAGES ==============
 
-class SavedPackageList(generics.ListCreateAPIView):
+class SavedPackageList(CachedPresetListMixin, generics.ListCreateAPIView):
     serializer_class = SavedPackageSerializer
     permission_classes = [IsAuthenticated]
+    preset_kind = 'packages'
     
     def get_queryset(self):
         return SavedPackage.objects.filter(user=self.request.user)
-    
-    def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
 
-class SavedPackageDetail(generics.RetrieveUpdateDestroyAPIView):
+class SavedPackageDetail(PresetVersionMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = SavedPackageSerializer
     permission_classes = [IsAuthenticated, IsOwner]
+    preset_kind = 'packages'
     
     def get_queryset(self):
         return SavedPackage.objects.filter(user=self.request.user)
@@ -135,11 +178,68 @@ class SavedPackageDetail(generics.RetrieveUpdateDestroyAPIView):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def get_shipments(request):
-    """Get all shipments for current user"""
-    shipments = ShipmentRecord.objects.filter(user=request.user)
-    serializer = ShipmentRecordSerializer(shipments, many=True)
-    return Response(serializer.data)
+    """Get shipments for current user, cursor-paginated when ?page_size or ?cursor is given"""
+    shipments = filter_shipments(
+        ShipmentRecord.objects.filter(user=request.user),
+        request.query_params
+    )
+    
+    paginator = ShipmentCursorPagination()
+    if paginator.is_requested(request):
+        page = paginator.paginate_queryset(ShipmentRecordListSerializer.rows(shipments), request)
+        serializer = ShipmentRecordListSerializer(page, many=True)
+        record_rows(len(page), 'serialized')
+        return paginator.get_paginated_response(serializer.data)
+    
+    # Full list: stream it instead of building the whole body in memory
+    return streaming_shipments_response(paginator.order_queryset(shipments, request))
+
+@api_view(['GET'])
+@authentication_classes([StatelessJWTAuthentication])
+@permission_classes([IsAuthenticated])
+def get_shipment_changes(request):
+    """Shipments changed or deleted since ?since=<token>; without one, the full list"""
+    since = request.query_params.get('since')
+    if since:
+        try:
+            since = decode_token(since)
+        except (ValueError, OverflowError):
+            return Response({'error': 'Invalid sync token'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    token, reset, deleted, shipments = shipment_changes(request.user, since or None)
+    return streaming_shipments_response(shipments, envelope=[
+        ('token', token),
+        ('reset', reset),
+        ('deleted', deleted),
+        ('records', RECORDS),
+    ])
+
+@api_view(['GET'])
+@authentication_classes([StatelessJWTAuthentication])
+@permission_classes([IsAuthenticated])
+def get_shipment_summary(request):
+    """
+    Shipment counts and costs by status with the account balance, cached
+    per user. Misses are computed on the primary: totals read from a
+    lagging replica would stay cached for the whole TTL.
+    """
+    return Response(shipment_summary(request.user))
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@replica_reads
+def export_shipments(request, file_type):
+    """Download the user's shipments as CSV (template layout) or XLSX, with the list filters"""
+    if file_type not in EXPORT_FORMATS:
+        return Response({'error': 'Export format must be csv or xlsx'}, status=status.HTTP_404_NOT_FOUND)
+    
+    shipments = filter_shipments(
+        ShipmentRecord.objects.filter(user=request.user),
+        request.query_params
+    )
+    return export_response(shipments, file_type)
 
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
@@ -152,12 +252,24 @@ def update_shipment(request, pk):
     
     serializer = ShipmentRecordSerializer(shipment, data=request.data, partial=True)
     if serializer.is_valid():
-        # Update shipping price if service changed
-        if 'shipping_service' in request.data:
-            shipment.shipping_service = request.data['shipping_service']
-            request.data['shipping_price'] = shipment.calculate_shipping_price()
+        extra = {}
+        # Re-check the ship-to address when any part of it changes
+        address_fields = ['to_city', 'to_state', 'to_zip']
+        if any(field in serializer.validated_data for field in address_fields):
+            city, state, zip_code, address_status = normalize_address(*[
+                serializer.validated_data.get(field, getattr(shipment, field)) for field in address_fields
+            ])
+            extra.update(to_city=city, to_state=state, to_zip=zip_code, address_status=address_status)
+        # Reprice when anything the rate depends on changes, from the
+        # normalized address rather than the submitted one
+        if any(field in serializer.validated_data for field in QUOTE_FIELDS + address_fields):
+            values = {**serializer.validated_data, **extra}
+            price = get_rate_engine().quote_one(*[values.get(field, getattr(shipment, field)) for field in QUOTE_FIELDS])
+            if price is not None:
+                extra['shipping_price'] = price
         
-        serializer.save()
+        serializer.save(**extra)
+        invalidate_summary(request.user)
         return Response(serializer.data)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -165,25 +277,21 @@ def update_shipment(request, pk):
 @permission_classes([IsAuthenticated])
 def delete_shipment(request, pk):
     """Delete a single shipment"""
-    try:
-        shipment = ShipmentRecord.objects.get(pk=pk, user=request.user)
-        shipment.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
-    except ShipmentRecord.DoesNotExist:
+    if not delete_shipments(request.user, ShipmentRecord.objects.filter(pk=pk)):
         return Response(status=status.HTTP_404_NOT_FOUND)
+    invalidate_summary(request.user)
+    return Response(status=status.HTTP_204_NO_CONTENT)
 
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def delete_all_shipments(request):
     """Delete all shipments for the current user"""
-    user = request.user
-    shipments = ShipmentRecord.objects.filter(user=user)
-    
-    count = shipments.count()
+    count = clear_shipments(request.user)
+    record_rows(count, 'written')
     if count == 0:
         return Response({'message': 'No shipments to delete'}, status=status.HTTP_200_OK)
     
-    shipments.delete()
+    invalidate_summary(request.user)
     return Response({
         'message': f'Successfully deleted all shipments ({count} records)'
     }, status=status.HTTP_200_OK)
@@ -197,31 +305,12 @@ def bulk_update_shipments(request):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     data = serializer.validated_data
-    record_ids = data.pop('record_ids', [])
-
-    if not record_ids:
-        return Response(
-            {'error': 'No record IDs provided'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
+    selection = {key: data.pop(key) for key in ('record_ids', 'filter') if key in data}
 
-    records = ShipmentRecord.objects.filter(id__in=record_ids, user=request.user)
-
-    if not records.exists():
-        return Response(
-            {"error": f"No shipments found for IDs: {record_ids}"},
-            status=status.HTTP_404_NOT_FOUND
-        )
-
-    # Check for invalid IDs
-    existing_ids = set(records.values_list('id', flat=True))
-    invalid_ids = [rid for rid in record_ids if rid not in existing_ids]
-
-    if invalid_ids:
-        return Response(
-            {"error": f"Invalid shipment IDs: {invalid_ids}"},
-            status=status.HTTP_400_BAD_REQUEST
-        )
+    try:
+        records = select_shipments(ShipmentRecord.objects.filter(user=request.user), selection)
+    except SelectionError as e:
+        return Response({'error': str(e)}, status=e.status)
 
     # Remove None or empty values
     update_data = {
@@ -235,72 +324,94 @@ def bulk_update_shipments(request):
             status=status.HTTP_400_BAD_REQUEST
         )
 
+    # A service change reprices from the stored weights, unless a manual
+    # price was given too
+    reprice = 'shipping_service' in update_data and 'shipping_price' not in update_data
+    if reprice:
+        expression = ShipmentRecord.shipping_price_expression(update_data['shipping_service'])
+        if expression is not None:
+            update_data['shipping_price'] = expression
+            reprice = False
+
+    update_data['updated_at'] = timezone.now()
+
+    # Single UPDATE ... RETURNING; the response is built from its rows
     with transaction.atomic():
-        if 'shipping_service' in update_data:
-            new_service = update_data.pop('shipping_service')
-            for record in records:
-                record.shipping_service = new_service
-                record.shipping_price = record.calculate_shipping_price()
-            ShipmentRecord.objects.bulk_update(
-                records,
-                ['shipping_service', 'shipping_price']
-            )
-
-        if 'shipping_price' in update_data:
-            manual_price = update_data.pop('shipping_price')
-            for record in records:
-                record.shipping_price = manual_price
-            ShipmentRecord.objects.bulk_update(
-                records,
-                ['shipping_price']
-            )
-            
-        if 'status' in update_data:
-            new_status = update_data.pop('status')
-            for record in records:
-                record.status = new_status
-            ShipmentRecord.objects.bulk_update(
-                records,
-                ['status']
-            )
-
-        if update_data:
-            records.update(**update_data)
-
-    updated = ShipmentRecord.objects.filter(id__in=record_ids, user=request.user)
-    response_serializer = ShipmentRecordSerializer(updated, many=True)
-
-    return Response(response_serializer.data, status=status.HTTP_200_OK)
+        updated = update_returning(records, update_data)
+        if reprice:
+            # Zoned rate tables are priced in batch from the returned rows
+            updated = reprice_rows(ShipmentRecord, updated, get_rate_engine(), using=records.db)
+        invalidate_summary(request.user)
+
+    # RETURNING rows come back in no particular order
+    return streaming_shipments_response(ordered_rows(ShipmentRecord, updated), status=status.HTTP_200_OK)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def bulk_delete_shipments(request):
-    """Bulk delete shipments"""
-    record_ids = request.data.get('record_ids', [])
+    """Bulk delete shipments by record_ids or filter"""
+    try:
+        records = select_shipments(ShipmentRecord.objects.filter(user=request.user), request.data)
+    except SelectionError as e:
+        return Response({'error': str(e)}, status=e.status)
 
-    if not record_ids:
-        return Response({'error': 'No record IDs provided'}, status=status.HTTP_400_BAD_REQUEST)
+    record_rows(delete_shipments(request.user, records), 'written')
+    invalidate_summary(request.user)
+    return Response(status=status.HTTP_204_NO_CONTENT)
 
-    records = ShipmentRecord.objects.filter(id__in=record_ids, user=request.user)
+# ============== PRESET APPLICATION ==============
 
-    if not records.exists():
-        return Response(
-            {"error": f"No shipments found for IDs: {record_ids}"},
-            status=status.HTTP_404_NOT_FOUND
-        )
+def apply_to_shipments(request, values):
+    """
+    Set `values` on the selected unpurchased shipments and reprice them in
+    one UPDATE ... RETURNING; rate tables the database cannot price are
+    repriced in batch from the returned rows.
+    """
+    try:
+        records = select_shipments(ShipmentRecord.objects.filter(user=request.user), request.data)
+    except SelectionError as e:
+        return Response({'error': str(e)}, status=e.status)
+    
+    # Purchased labels keep the address, package and price they were bought with
+    records = records.exclude(status='processed')
+    expression = ShipmentRecord.shipping_price_expression(
+        weight_lbs=values.get('weight_lbs'), weight_oz=values.get('weight_oz')
+    )
+    values['updated_at'] = timezone.now()
+    if expression is not None:
+        values['shipping_price'] = expression
+    
+    with transaction.atomic():
+        updated = update_returning(records, values)
+        if expression is None:
+            updated = reprice_rows(ShipmentRecord, updated, get_rate_engine(), using=records.db)
+        invalidate_summary(request.user)
+    
+    return streaming_shipments_response(ordered_rows(ShipmentRecord, updated), status=status.HTTP_200_OK)
 
-    # Check for invalid IDs
-    existing_ids = set(records.values_list('id', flat=True))
-    invalid_ids = [rid for rid in record_ids if rid not in existing_ids]
-    if invalid_ids:
-        return Response(
-            {"error": f"Invalid shipment IDs: {invalid_ids}"},
-            status=status.HTTP_400_BAD_REQUEST
-        )
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def apply_address(request):
+    """Use a saved address as the ship-from of many shipments"""
+    try:
+        address = SavedAddress.objects.get(pk=request.data.get('address_id'), user=request.user)
+    except (SavedAddress.DoesNotExist, ValueError, TypeError):
+        return Response({'error': 'Saved address not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    return apply_to_shipments(request, address.shipment_fields('from'))
 
-    # Delete valid records
-    records.delete()
-    return Response(status=status.HTTP_204_NO_CONTENT)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def apply_package(request):
+    """Use a saved package's dimensions and weight for many shipments, repricing them"""
+    try:
+        package = SavedPackage.objects.get(pk=request.data.get('package_id'), user=request.user)
+    except (SavedPackage.DoesNotExist, ValueError, TypeError):
+        return Response({'error': 'Saved package not found'}, status=status.HTTP_404_NOT_FOUND)
+    if get_rate_engine().quote_one('ground', package.weight_lbs, package.weight_oz) is None:
+        return Response({'error': 'No rate for this package weight'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return apply_to_shipments(request, package.shipment_fields())
 
 # ============== UPLOAD ==============
 
@@ -313,116 +424,226 @@ def upload_csv(request):
         return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
     
     file = request.FILES['file']
+    mode = request.data.get('mode', 'create')
+    if mode not in IMPORT_MODES:
+        return Response({'error': f'mode must be one of {", ".join(IMPORT_MODES)}'}, status=status.HTTP_400_BAD_REQUEST)
     
     try:
-        df = pd.read_csv(file, skiprows=2, header=None, encoding='utf-8')
+        counts, errors = import_manifest(file, request.user, mode=mode)
+        invalidate_summary(request.user)
+        record_rows(sum(counts.values()) + len(errors), 'parsed')
+        record_rows(counts['created'] + counts['updated'], 'written')
         
-        records = []
-        errors = []
-
-        for index, row in df.iterrows():
-            try:
-                if pd.isna(row[7]) and pd.isna(row[8]):
-                    continue  # skip empty rows
-                
-                record = ShipmentRecord(
-                    user=request.user,
-                    from_first_name=str(row[0])[:50] if not pd.isna(row[0]) else '',
-                    from_last_name=str(row[1])[:50] if not pd.isna(row[1]) else '',
-                    from_address=str(row[2])[:100] if not pd.isna(row[2]) else '',
-                    from_address2=str(row[3])[:100] if not pd.isna(row[3]) else '',
-                    from_city=str(row[4])[:50] if not pd.isna(row[4]) else '',
-                    from_zip=str(row[5])[:20] if not pd.isna(row[5]) else '',
-                    from_state=str(row[6])[:50] if not pd.isna(row[6]) else '',
-                    to_first_name=str(row[7])[:50] if not pd.isna(row[7]) else '',
-                    to_last_name=str(row[8])[:50] if not pd.isna(row[8]) else '',
-                    to_address=str(row[9])[:100] if not pd.isna(row[9]) else '',
-                    to_address2=str(row[10])[:100] if not pd.isna(row[10]) else '',
-                    to_city=str(row[11])[:50] if not pd.isna(row[11]) else '',
-                    to_zip=str(row[12])[:20] if not pd.isna(row[12]) else '',
-                    to_state=str(row[13])[:50] if not pd.isna(row[13]) else '',
-                    weight_lbs=safe_int(row[14]),
-                    weight_oz=safe_int(row[15]),
-                    length=safe_float(row[16]),
-                    width=safe_float(row[17]),
-                    height=safe_float(row[18]),
-                    phone_num1=str(row[19])[:20] if not pd.isna(row[19]) else '',
-                    phone_num2=str(row[20])[:20] if not pd.isna(row[20]) else '',
-                    order_no=str(row[21])[:30] if not pd.isna(row[21]) else f"ORDER-{index}",
-                    item_sku=str(row[22])[:30] if not pd.isna(row[22]) else '',
-                    shipping_service='ground'
-                )
-                
-                record.shipping_price = record.calculate_shipping_price()
-                records.append(record)
-            
-            except Exception as row_error:
-                errors.append({'row': index + 2, 'error': str(row_error)})
-        
-        # Save all valid records
-        with transaction.atomic():
-            # Optionally delete existing pending shipments for this user
-            # ShipmentRecord.objects.filter(user=request.user, status='pending').delete()
-            ShipmentRecord.objects.bulk_create(records)
-        
-        serializer = ShipmentRecordSerializer(
+        return streaming_shipments_response(
             ShipmentRecord.objects.filter(user=request.user),
-            many=True
+            envelope=[
+                ('message', f'Successfully imported {counts["created"] + counts["updated"]} records'),
+                ('created', counts['created']),
+                ('updated', counts['updated']),
+                ('skipped', counts['skipped']),
+                ('records', RECORDS),
+                ('errors', errors),
+            ]
         )
-        
-        return Response({
-            'message': f'Successfully imported {len(records)} records',
-            'records': serializer.data,
-            'errors': errors,
-        })
 
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+# ============== IMPORT JOBS ==============
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+def import_jobs(request):
+    """List recent import jobs, or queue a CSV for background import"""
+    if request.method == 'GET':
+        jobs = ImportJob.objects.filter(user=request.user)[:20]
+        return Response(ImportJobSerializer(jobs, many=True).data)
+    
+    if 'file' not in request.FILES:
+        return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    file = request.FILES['file']
+    mode = request.data.get('mode', 'create')
+    if mode not in IMPORT_MODES:
+        return Response({'error': f'mode must be one of {", ".join(IMPORT_MODES)}'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    with transaction.atomic():
+        job = ImportJob.objects.create(user=request.user, file=file, filename=file.name[:255], mode=mode)
+        enqueue_import(job)
+    
+    return Response(ImportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def start_upload(request):
+    """
+    Start a chunked, resumable upload. Send the file with upload_chunk,
+    then upload_finalize; progress is reported like any import job.
+    """
+    filename = request.data.get('filename', '')
+    mode = request.data.get('mode', 'create')
+    size = request.data.get('size')
+    if not isinstance(filename, str):
+        return Response({'error': 'filename must be a string'}, status=status.HTTP_400_BAD_REQUEST)
+    if mode not in IMPORT_MODES:
+        return Response({'error': f'mode must be one of {", ".join(IMPORT_MODES)}'}, status=status.HTTP_400_BAD_REQUEST)
+    if size is not None and (not isinstance(size, int) or isinstance(size, bool) or size < 0):
+        return Response({'error': 'size must be a non-negative integer'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    job = create_upload(request.user, filename, mode, size)
+    return Response(ImportJobSerializer(job).data, status=status.HTTP_201_CREATED)
+
+@api_view(['PUT'])
+@permission_classes([IsAuthenticated])
+def upload_chunk(request, pk):
+    """
+    Append the raw request body to an upload at ?offset=, which must equal
+    its bytes_received. A mismatch answers 409 with the offset to resume from.
+    """
+    try:
+        job = ImportJob.objects.get(pk=pk, user=request.user)
+    except ImportJob.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+    try:
+        offset = int(request.query_params.get('offset', ''))
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return Response({'error': 'offset must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        # Read the body as a stream so it is never buffered whole
+        job = append_upload(job, offset, request.stream or io.BytesIO(), length)
+    except UploadError as e:
+        job.refresh_from_db(fields=['bytes_received'])
+        return Response({'error': str(e), 'bytes_received': job.bytes_received}, status=e.status)
+    return Response({'bytes_received': job.bytes_received})
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def upload_finalize(request, pk):
+    """Complete an upload, optionally checking its total size, and let the import finish"""
+    try:
+        job = ImportJob.objects.get(pk=pk, user=request.user)
+    except ImportJob.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+    size = request.data.get('size')
+    if size is not None and (not isinstance(size, int) or isinstance(size, bool) or size < 0):
+        return Response({'error': 'size must be a non-negative integer'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        job = finalize_upload(job, size)
+    except UploadError as e:
+        return Response({'error': str(e)}, status=e.status)
+    return Response(ImportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+@api_view(['GET'])
+@authentication_classes([StatelessJWTAuthentication])
+@permission_classes([IsAuthenticated])
+def import_job_detail(request, pk):
+    """Progress and row errors for one import job"""
+    try:
+        job = ImportJob.objects.get(pk=pk, user=request.user)
+    except ImportJob.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+    
+    # Restart an upload's import if its worker died
+    resume_upload_import(job)
+    return Response(ImportJobSerializer(job).data)
+
 # ============== PURCHASE ==============
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def purchase_shipments(request):
-    """Simulate purchase of selected shipments"""
+    """Purchase labels for the selected pending shipments, by record_ids or filter"""
     record_ids = request.data.get('record_ids', [])
     label_format = request.data.get('label_format', 'letter')
+    idempotency_key = request.headers.get('Idempotency-Key') or request.data.get('idempotency_key')
     
-    if not record_ids:
+    try:
+        lookups = selection_lookups(request.data)
+    except SelectionError as e:
+        return Response({'error': str(e)}, status=e.status)
+    if lookups is not None:
+        record_ids = None
+    elif not record_ids:
         return Response({'error': 'No records specified'}, status=status.HTTP_400_BAD_REQUEST)
+    elif not is_id_list(record_ids):
+        return Response({'error': 'record_ids must be a list of integers'}, status=status.HTTP_400_BAD_REQUEST)
+    if label_format not in LABEL_FORMATS:
+        return Response({'error': f'label_format must be one of {", ".join(LABEL_FORMATS)}'}, status=status.HTTP_400_BAD_REQUEST)
+    if idempotency_key is not None and not 0 < len(str(idempotency_key)) <= 255:
+        return Response({'error': 'Idempotency key must be 1-255 characters'}, status=status.HTTP_400_BAD_REQUEST)
     
-    # Get records belonging to this user
-    records = ShipmentRecord.objects.filter(id__in=record_ids, user=request.user)
-    
-    if not records.exists():
-        return Response({'error': 'No valid records found'}, status=status.HTTP_404_NOT_FOUND)
+    try:
+        data, replayed = purchase_records(
+            request.user, record_ids, label_format,
+            idempotency_key=str(idempotency_key) if idempotency_key is not None else None,
+            lookups=lookups
+        )
+    except PurchaseError as e:
+        return Response(e.data, status=e.status)
     
-    # Check if user has enough balance
-    total = sum(record.shipping_price for record in records)
+    response = Response(data)
+    if replayed:
+        response['Idempotent-Replayed'] = 'true'
+    else:
+        record_rows(len(data['record_ids']), 'written')
+        invalidate_summary(request.user)
+        # The balance changed through an update, which sends no signals
+        forget_user(request.user.pk)
+        enqueue_label_warmup(request.user, data['record_ids'], label_format)
+    return response
+
+# ============== LABELS ==============
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def download_labels(request):
+    """Labels for purchased shipments as one PDF, or a ZIP of PDFs"""
+    record_ids = request.data.get('record_ids', [])
+    label_format = request.data.get('label_format', 'letter')
+    output = request.data.get('output', 'pdf')
     
-    if request.user.profile.account_balance < total:
-        return Response({
-            'error': 'Insufficient balance',
-            'required': total,
-            'available': request.user.profile.account_balance
-        }, status=status.HTTP_400_BAD_REQUEST)
+    if not record_ids:
+        return Response({'error': 'No records specified'}, status=status.HTTP_400_BAD_REQUEST)
+    if not is_id_list(record_ids):
+        return Response({'error': 'record_ids must be a list of integers'}, status=status.HTTP_400_BAD_REQUEST)
+    if label_format not in LABEL_FORMATS:
+        return Response({'error': f'label_format must be one of {", ".join(LABEL_FORMATS)}'}, status=status.HTTP_400_BAD_REQUEST)
+    if output not in ('pdf', 'zip'):
+        return Response({'error': 'output must be pdf or zip'}, status=status.HTTP_400_BAD_REQUEST)
     
-    # Process purchase
-    with transaction.atomic():
-        # Deduct from user balance
-        profile = request.user.profile
-        profile.account_balance -= total
-        profile.save()
-        
-        # Update status to processed
-        records.update(status='processed')
+    labels = purchased_labels(request.user.pk, record_ids)
+    if not labels:
+        return Response({'error': 'No purchased records found'}, status=status.HTTP_404_NOT_FOUND)
     
+    record_rows(len(labels), 'serialized')
+    paths = render_labels(labels, label_format)
+    return labels_response(labels, paths, label_format, output)
+
+# ============== RATES ==============
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def quote_rates(request):
+    """Price a batch of shipments against the active rate table"""
+    shipments = request.data.get('shipments')
+    if not isinstance(shipments, list) or not shipments:
+        return Response({'error': 'shipments must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(shipments) > MAX_QUOTE_BATCH:
+        return Response(
+            {'error': f'At most {MAX_QUOTE_BATCH} shipments can be quoted at once'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if not all(isinstance(shipment, dict) for shipment in shipments):
+        return Response({'error': 'Each shipment must be an object'}, status=status.HTTP_400_BAD_REQUEST)
+
+    engine = get_rate_engine()
+    record_rows(len(shipments), 'parsed')
     return Response({
-        'message': f'Successfully purchased {len(records)} labels',
-        'total': total,
-        'label_format': label_format,
-        'records_processed': len(records),
-        'new_balance': profile.account_balance
+        'rate_version': engine.version,
+        'quotes': quote_shipments(shipments, engine),
     })
 
 # ============== TEMPLATE ==============
@@ -436,21 +657,10 @@ def download_template(request):
     writer = csv.writer(output)
 
     # Row 1: Top-level categories
-    writer.writerow([
-        'From', '', '', '', '', '', '', '',
-        'To', '', '', '', '', '', '', '',
-        'weight*', 'weight*',
-        'Dimensions*', 'Dimensions*', 'Dimensions*',
-        '', '', '', ''
-    ])
+    writer.writerow(TEMPLATE_CATEGORY_ROW)
 
     # Row 2: Column headers
-    writer.writerow([
-        'First name*', 'Last name', 'Address*', 'Address2', 'City*', 'ZIP/Postal code*', 'Abbreviation*',
-        'First name*', 'Last name', 'Address*', 'Address2', 'City*', 'ZIP/Postal code*', 'Abbreviation*',
-        'lbs', 'oz', 'Length', 'width', 'Height',
-        'phone num1', 'phone num2', 'order no', 'Item-sku'
-    ])
+    writer.writerow(TEMPLATE_COLUMN_ROW)
 
     # Row 3: Sample data
     writer.writerow([
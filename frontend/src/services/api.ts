@@ -106,6 +106,8 @@ export const deletePackage = (id: number) => api.delete(`/packages/${id}/`);
 
 // Shipments
 export const getShipments = () => api.get('/shipments/');
+export const getShipmentChanges = (since?: string) =>
+  api.get('/shipments/changes/', { params: since ? { since } : {} });
 export const getShipment = (id: number) => api.get(`/shipments/${id}/`); // Fixed typo: getshipment -> getShipment
 export const updateShipment = (id: number, data: any) => api.put(`/shipments/${id}/`, data);
 export const deleteShipment = (id: number) => api.delete(`/shipments/${id}/delete/`);
@@ -50,6 +50,7 @@ export interface ShipmentRecord {
   to_city: string;
   to_zip: string;
   to_state: string;
+  address_status: 'unverified' | 'valid' | 'corrected' | 'mismatch' | 'unknown_zip' | 'invalid';
   
   // Package
   weight_lbs: number;